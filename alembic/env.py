@@ -11,7 +11,7 @@ from alembic import context
 
 # Импортируем Base и модели
 from app.db.base import Base
-from app.db.models import User, Order  # noqa: F401
+from app.db.models import User, Order, GeocodeCache, FsmState, OrderCounter  # noqa: F401
 from app.config import settings
 
 # this is the Alembic Config object, which provides
@@ -0,0 +1,34 @@
+"""Add geocode_cache table
+
+Revision ID: 5b1e7c3a9d42
+Revises: 2d9a89410994
+Create Date: 2025-11-20 10:12:41.318402
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b1e7c3a9d42'
+down_revision: Union[str, None] = '2d9a89410994'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('geocode_cache',
+    sa.Column('address_key', sa.Text(), nullable=False),
+    sa.Column('latitude', sa.Float(), nullable=True),
+    sa.Column('longitude', sa.Float(), nullable=True),
+    sa.Column('found', sa.Boolean(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('address_key')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('geocode_cache')
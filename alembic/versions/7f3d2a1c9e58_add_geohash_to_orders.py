@@ -0,0 +1,107 @@
+"""Add load/unload geohash columns to orders
+
+Revision ID: 7f3d2a1c9e58
+Revises: 5b1e7c3a9d42
+Create Date: 2025-11-24 09:41:17.502913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7f3d2a1c9e58'
+down_revision: Union[str, None] = '5b1e7c3a9d42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Точность хранимого geohash (как OrderDBService.GEOHASH_PRECISION)
+PRECISION = 9
+BATCH_SIZE = 5000
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def encode(latitude, longitude, precision=PRECISION):
+    """Geohash точки (копия app.services.geohash.encode: миграция не зависит от кода приложения)."""
+    if latitude is None or longitude is None:
+        return None
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        value, interval = (longitude, lon_range) if even else (latitude, lat_range)
+        middle = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits, bit_count = 0, 0
+    return "".join(chars)
+
+
+INDEXES = [
+    ('ix_orders_load_geohash', 'load_geohash'),
+    ('ix_orders_unload_geohash', 'unload_geohash'),
+]
+
+
+def upgrade() -> None:
+    op.add_column('orders', sa.Column('load_geohash', sa.String(length=12, collation='C'), nullable=True))
+    op.add_column('orders', sa.Column('unload_geohash', sa.String(length=12, collation='C'), nullable=True))
+
+    # Заполнение и индексы — вне транзакции миграции: каждая пачка фиксируется
+    # сразу (блокировки строк держатся недолго), индексы строятся CONCURRENTLY
+    # без блокировки записи в orders. Прерванная сборка оставляет индекс
+    # INVALID — его нужно удалить (DROP INDEX CONCURRENTLY) и повторить миграцию.
+    with op.get_context().autocommit_block():
+        conn = op.get_bind()
+        select_batch = sa.text(
+            "SELECT id, load_latitude, load_longitude, unload_latitude, unload_longitude "
+            "FROM orders WHERE id > :last_id "
+            "AND (load_latitude IS NOT NULL OR unload_latitude IS NOT NULL) "
+            "ORDER BY id LIMIT :limit"
+        )
+        # Одна пачка — один UPDATE: geohash считается здесь (в Postgres без
+        # PostGIS функции geohash нет) и передаётся массивами
+        update_batch = sa.text(
+            "UPDATE orders SET load_geohash = batch.load_geohash, unload_geohash = batch.unload_geohash "
+            "FROM unnest(CAST(:ids AS bigint[]), CAST(:load_geohashes AS text[]), CAST(:unload_geohashes AS text[])) "
+            "AS batch(id, load_geohash, unload_geohash) "
+            "WHERE orders.id = batch.id"
+        )
+        last_id = 0
+        while True:
+            rows = conn.execute(select_batch, {"last_id": last_id, "limit": BATCH_SIZE}).all()
+            if not rows:
+                break
+            conn.execute(update_batch, {
+                "ids": [row.id for row in rows],
+                "load_geohashes": [encode(row.load_latitude, row.load_longitude) for row in rows],
+                "unload_geohashes": [encode(row.unload_latitude, row.unload_longitude) for row in rows],
+            })
+            last_id = rows[-1].id
+
+        for name, column in INDEXES:
+            op.create_index(
+                name,
+                'orders',
+                [column],
+                unique=False,
+                postgresql_concurrently=True,
+                if_not_exists=True
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, _ in reversed(INDEXES):
+            op.drop_index(name, table_name='orders', postgresql_concurrently=True, if_exists=True)
+    op.drop_column('orders', 'unload_geohash')
+    op.drop_column('orders', 'load_geohash')
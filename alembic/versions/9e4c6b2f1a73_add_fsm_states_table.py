@@ -0,0 +1,33 @@
+"""Add fsm_states table
+
+Revision ID: 9e4c6b2f1a73
+Revises: 7f3d2a1c9e58
+Create Date: 2025-12-08 11:47:05.204117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9e4c6b2f1a73'
+down_revision: Union[str, None] = '7f3d2a1c9e58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('fsm_states',
+    sa.Column('key', sa.Text(), nullable=False),
+    sa.Column('state', sa.Text(), nullable=True),
+    sa.Column('data', postgresql.JSONB(astext_type=sa.Text()), server_default='{}', nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('fsm_states')
@@ -0,0 +1,50 @@
+"""Add composite and partial indexes for order lists
+
+Revision ID: b4e8d1f6a2c0
+Revises: 9e4c6b2f1a73
+Create Date: 2025-12-15 10:12:38.640291
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b4e8d1f6a2c0'
+down_revision: Union[str, None] = '9e4c6b2f1a73'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Порядок (created_at DESC, id DESC) — как у keyset-пагинации OrderDBService:
+# страница читается из индекса без сортировки
+INDEXES = [
+    ('ix_orders_user_id_created_at', ['user_id', sa.text('created_at DESC'), sa.text('id DESC')], None),
+    ('ix_orders_status_created_at', ['status', sa.text('created_at DESC'), sa.text('id DESC')], None),
+    # Черновики — малая доля заказов: частичный индекс для get_user_draft_order
+    ('ix_orders_draft_user_id_updated_at', ['user_id', 'updated_at'], sa.text("status = 'DRAFT'")),
+]
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY не блокирует запись в orders, но не работает
+    # внутри транзакции. Прерванная сборка оставляет индекс INVALID —
+    # его нужно удалить (DROP INDEX CONCURRENTLY) и повторить миграцию.
+    with op.get_context().autocommit_block():
+        for name, columns, where in INDEXES:
+            op.create_index(
+                name,
+                'orders',
+                columns,
+                unique=False,
+                postgresql_concurrently=True,
+                postgresql_where=where,
+                if_not_exists=True
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name='orders', postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,44 @@
+"""Add order_counters table
+
+Revision ID: d2f7a9c4e1b8
+Revises: b4e8d1f6a2c0
+Create Date: 2025-12-17 16:03:52.118874
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2f7a9c4e1b8'
+down_revision: Union[str, None] = 'b4e8d1f6a2c0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Строки итогов по статусу (как OrderCounter.ALL_USERS)
+ALL_USERS = 0
+
+
+def upgrade() -> None:
+    op.create_table('order_counters',
+    sa.Column('user_id', sa.BigInteger(), nullable=False),
+    sa.Column('status', postgresql.ENUM(name='orderstatus', create_type=False), nullable=False),
+    sa.Column('count', sa.BigInteger(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('user_id', 'status')
+    )
+
+    # Начальные значения; заказы, изменённые до выхода новой версии бота,
+    # исправляет python -m scripts.rebuild_order_counters
+    op.execute(sa.text(
+        "INSERT INTO order_counters (user_id, status, count) "
+        "SELECT user_id, status, count(*) FROM orders GROUP BY user_id, status "
+        "UNION ALL "
+        f"SELECT {ALL_USERS}, status, count(*) FROM orders GROUP BY status"
+    ))
+
+
+def downgrade() -> None:
+    op.drop_table('order_counters')
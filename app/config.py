@@ -1,4 +1,6 @@
 """Конфигурация приложения."""
+from typing import Optional
+
 from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -22,11 +24,73 @@ class Settings(BaseSettings):
         default="postgresql+asyncpg://sibcargo:sibcargo@db:5432/sibcargo",
         alias="DATABASE_URL"
     )
+    db_profile: str = Field(default="prod", alias="DB_PROFILE")  # Профиль движка: dev, prod или bench
+    # Переопределения параметров профиля (не заданы — берутся из профиля)
+    db_pool_size: Optional[int] = Field(default=None, alias="DB_POOL_SIZE")  # Постоянных соединений
+    db_max_overflow: Optional[int] = Field(default=None, alias="DB_MAX_OVERFLOW")  # Дополнительных при нагрузке
+    db_pool_timeout: Optional[float] = Field(default=None, alias="DB_POOL_TIMEOUT")  # Ожидание свободного соединения (сек)
+    db_pool_recycle: Optional[int] = Field(default=None, alias="DB_POOL_RECYCLE")  # Пересоздавать соединение старше (сек)
+    db_pool_pre_ping: Optional[bool] = Field(default=None, alias="DB_POOL_PRE_PING")  # Проверять соединение перед выдачей
+    db_statement_cache_size: Optional[int] = Field(default=None, alias="DB_STATEMENT_CACHE_SIZE")  # Подготовленных запросов
+    db_echo: Optional[bool] = Field(default=None, alias="DB_ECHO")  # Логировать SQL
+    db_pool_stats_interval: float = Field(default=60.0, alias="DB_POOL_STATS_INTERVAL")  # Лог метрик пула (сек, 0 — нет)
+    user_cache_size: int = Field(default=10000, alias="USER_CACHE_SIZE")  # Пользователей в кэше процесса
+    user_cache_ttl: float = Field(default=300.0, alias="USER_CACHE_TTL")  # TTL записи пользователя (сек)
     
     # Pricing (формула: базовая + расстояние * тариф_км + вес * тариф_кг)
     base_price: float = Field(default=500.0, alias="BASE_PRICE")  # Базовая ставка (руб)
     price_per_km: float = Field(default=35.0, alias="PRICE_PER_KM")  # Тариф за километр (руб/км)
     price_per_kg: float = Field(default=2.0, alias="PRICE_PER_KG")  # Тариф за килограмм (руб/кг)
+    tariffs_path: str = Field(default="", alias="TARIFFS_PATH")  # Файл тарифа (пусто — плоский тариф выше)
+    
+    # Geocoding
+    geocoder_backends: str = Field(default="local,nominatim", alias="GEOCODER_BACKENDS")  # Порядок бэкендов
+    nominatim_url: str = Field(default="https://nominatim.openstreetmap.org", alias="NOMINATIM_URL")
+    photon_url: str = Field(default="", alias="PHOTON_URL")  # Photon-совместимый сервер (пусто — отключён)
+    geocoder_timeout: float = Field(default=10.0, alias="GEOCODER_TIMEOUT")  # Таймаут запроса (сек)
+    geocoder_hedge: bool = Field(default=True, alias="GEOCODER_HEDGE")  # Дублировать медленный запрос в следующий бэкенд
+    geocoder_hedge_delay: float = Field(default=1.0, alias="GEOCODER_HEDGE_DELAY")  # Задержка до статистики p95 (сек)
+    geocoder_hedge_min_delay: float = Field(default=0.2, alias="GEOCODER_HEDGE_MIN_DELAY")  # Минимальная задержка (сек)
+    geocoder_breaker_failures: int = Field(default=3, alias="GEOCODER_BREAKER_FAILURES")  # Ошибок подряд до отключения
+    geocoder_breaker_reset: float = Field(default=30.0, alias="GEOCODER_BREAKER_RESET")  # Время отключения бэкенда (сек)
+    geocoder_pool_size: int = Field(default=20, alias="GEOCODER_POOL_SIZE")  # Размер пула HTTP-соединений
+    geocoder_rate_limit: float = Field(default=1.0, alias="GEOCODER_RATE_LIMIT")  # Запросов в секунду на бота (делится между WORKERS)
+    geocoder_burst: float = Field(default=1.0, alias="GEOCODER_BURST")  # Допустимый всплеск запросов
+    geocode_cache_size: int = Field(default=2048, alias="GEOCODE_CACHE_SIZE")  # Адресов в LRU-кэше процесса
+    geocode_cache_ttl: float = Field(default=30 * 24 * 3600, alias="GEOCODE_CACHE_TTL")  # TTL найденного адреса (сек)
+    geocode_negative_ttl: float = Field(default=3600, alias="GEOCODE_NEGATIVE_TTL")  # TTL «адрес не найден» (сек)
+    gazetteer_path: str = Field(default="data/gazetteer.idx", alias="GAZETTEER_PATH")  # Офлайн-индекс адресов
+    reverse_geocode_max_distance: float = Field(default=150.0, alias="REVERSE_GEOCODE_MAX_DISTANCE")  # До ближайшего дома (м)
+    
+    # Routing
+    road_graph_path: str = Field(default="data/road_graph.npz", alias="ROAD_GRAPH_PATH")  # Дорожный граф региона
+    routing_max_snap_km: float = Field(default=3.0, alias="ROUTING_MAX_SNAP_KM")  # Макс. удаление точки от дороги (км)
+    distance_cache_size: int = Field(default=10000, alias="DISTANCE_CACHE_SIZE")  # Пар ячеек в LRU-кэше расстояний
+    distance_cache_ttl: float = Field(default=7 * 24 * 3600, alias="DISTANCE_CACHE_TTL")  # TTL расстояния (сек)
+    distance_cache_precision: int = Field(default=7, alias="DISTANCE_CACHE_PRECISION")  # Длина geohash (7 — ~150 м)
+    distance_cache_path: str = Field(default="", alias="DISTANCE_CACHE_PATH")  # Файл кэша (пусто — только в памяти)
+    
+    # FSM
+    fsm_storage: str = Field(default="postgres", alias="FSM_STORAGE")  # Хранилище состояний: postgres или memory
+    fsm_flush_interval: float = Field(default=0.2, alias="FSM_FLUSH_INTERVAL")  # Период записи изменений в БД (сек)
+    fsm_cache_size: int = Field(default=10000, alias="FSM_CACHE_SIZE")  # Ключей в кэше процесса
+    fsm_cache_ttl: float = Field(default=300.0, alias="FSM_CACHE_TTL")  # Доверять кэшу без чтения из БД (сек)
+    fsm_memory_ttl: float = Field(default=86400.0, alias="FSM_MEMORY_TTL")  # Жизнь брошенного диалога в памяти (сек)
+    fsm_memory_limit_mb: float = Field(default=64.0, alias="FSM_MEMORY_LIMIT_MB")  # Объём диалогов в памяти (МБ)
+    
+    # Webhook
+    bot_mode: str = Field(default="polling", alias="BOT_MODE")  # Получение обновлений: polling или webhook
+    webhook_url: str = Field(default="", alias="WEBHOOK_URL")  # Публичный адрес бота (пусто — не регистрировать)
+    webhook_path: str = Field(default="/webhook", alias="WEBHOOK_PATH")
+    webhook_secret: str = Field(default="", alias="WEBHOOK_SECRET")  # Секрет (A-Z, a-z, 0-9, _ и -, до 256 символов)
+    webhook_host: str = Field(default="0.0.0.0", alias="WEBHOOK_HOST")
+    webhook_port: int = Field(default=8080, alias="PORT")  # Railway задаёт PORT сам
+    webhook_max_connections: int = Field(default=40, alias="WEBHOOK_MAX_CONNECTIONS")  # Параллельных запросов от Telegram
+    
+    # Workers
+    workers: int = Field(default=1, alias="WORKERS")  # Процессов-обработчиков (1 — всё в одном процессе)
+    worker_queue_size: int = Field(default=1000, alias="WORKER_QUEUE_SIZE")  # Очередь обновлений процесса
+    worker_heartbeat_timeout: float = Field(default=30.0, alias="WORKER_HEARTBEAT_TIMEOUT")  # Зависший процесс (сек)
 
 
 settings = Settings()
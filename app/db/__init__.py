@@ -1,6 +1,6 @@
 """Database module."""
 from app.db.base import Base, get_async_session, engine
-from app.db.models import User, Order
+from app.db.models import User, Order, GeocodeCache, FsmState, OrderCounter
 
-__all__ = ["Base", "get_async_session", "engine", "User", "Order"]
+__all__ = ["Base", "get_async_session", "engine", "User", "Order", "GeocodeCache", "FsmState", "OrderCounter"]
 
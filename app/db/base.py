@@ -1,10 +1,11 @@
 """Database configuration and session management."""
 from typing import AsyncGenerator
 
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
 
 from app.config import settings
+from app.db.pool import InstrumentedPool, instrument_engine
 
 
 class Base(DeclarativeBase):
@@ -17,12 +18,78 @@ database_url = settings.database_url
 if database_url.startswith("postgresql://"):
     database_url = database_url.replace("postgresql://", "postgresql+asyncpg://", 1)
 
-# Создание async engine
-engine = create_async_engine(
-    database_url,
-    echo=True,  # Логирование SQL запросов (для разработки)
-    future=True
-)
+# Профили движка. dev — с логом SQL; prod — без лога, pre-ping и пересоздание
+# соединений (прокси Railway рвёт долгие соединения); bench — фиксированный
+# пул без overflow и pre-ping для замеров.
+ENGINE_PROFILES = {
+    "dev": {
+        "echo": True,
+        "pool_size": 5,
+        "max_overflow": 5,
+        "pool_timeout": 30.0,
+        "pool_recycle": -1,
+        "pool_pre_ping": False,
+        "statement_cache_size": 100,
+    },
+    "prod": {
+        "echo": False,
+        "pool_size": 10,
+        "max_overflow": 10,
+        "pool_timeout": 10.0,
+        "pool_recycle": 1800,
+        "pool_pre_ping": True,
+        "statement_cache_size": 500,
+    },
+    "bench": {
+        "echo": False,
+        "pool_size": 20,
+        "max_overflow": 0,
+        "pool_timeout": 30.0,
+        "pool_recycle": -1,
+        "pool_pre_ping": False,
+        "statement_cache_size": 1000,
+    },
+}
+
+
+def engine_options(profile: str) -> dict:
+    """Параметры профиля с переопределениями из настроек DB_*."""
+    if profile not in ENGINE_PROFILES:
+        raise ValueError(f"Неизвестный профиль БД: {profile} (доступны: {', '.join(ENGINE_PROFILES)})")
+    options = dict(ENGINE_PROFILES[profile])
+    overrides = {
+        "echo": settings.db_echo,
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+        "statement_cache_size": settings.db_statement_cache_size,
+    }
+    options.update({key: value for key, value in overrides.items() if value is not None})
+    return options
+
+
+def create_engine(profile: str) -> AsyncEngine:
+    """Async engine по профилю, с метриками пула."""
+    options = engine_options(profile)
+    new_engine = create_async_engine(
+        database_url,
+        echo=options["echo"],
+        poolclass=InstrumentedPool,
+        pool_size=options["pool_size"],
+        max_overflow=options["max_overflow"],
+        pool_timeout=options["pool_timeout"],
+        pool_recycle=options["pool_recycle"],
+        pool_pre_ping=options["pool_pre_ping"],
+        # Кэш подготовленных запросов asyncpg на соединение (0 — выключен, нужно для pgbouncer)
+        connect_args={"prepared_statement_cache_size": options["statement_cache_size"]}
+    )
+    instrument_engine(new_engine)
+    return new_engine
+
+
+engine = create_engine(settings.db_profile)
 
 # Создание фабрики сессий
 async_session_maker = async_sessionmaker(
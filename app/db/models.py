@@ -3,7 +3,8 @@ from datetime import datetime
 from typing import Optional
 from enum import Enum as PyEnum
 
-from sqlalchemy import String, BigInteger, Float, DateTime, Text, Enum, ForeignKey
+from sqlalchemy import String, BigInteger, Float, DateTime, Text, Enum, ForeignKey, Boolean, Index, text
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.sql import func
 
@@ -61,11 +62,15 @@ class Order(Base):
     load_address: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
     load_latitude: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
     load_longitude: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    # Geohash точки (побайтовое сравнение "C" — поиск по диапазонам ячеек через индекс)
+    load_geohash: Mapped[Optional[str]] = mapped_column(String(12, collation="C"), nullable=True, index=True)
     
     # Адрес выгрузки
     unload_address: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
     unload_latitude: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
     unload_longitude: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    # Geohash точки выгрузки
+    unload_geohash: Mapped[Optional[str]] = mapped_column(String(12, collation="C"), nullable=True, index=True)
     
     # Параметры груза
     weight_kg: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
@@ -95,7 +100,71 @@ class Order(Base):
     
     # Связи
     user: Mapped["User"] = relationship("User", back_populates="orders")
+    
+    # Индексы под списки заказов (миграция b4e8d1f6a2c0, docs/DATABASE.md)
+    __table_args__ = (
+        Index("ix_orders_user_id_created_at", "user_id", text("created_at DESC"), text("id DESC")),
+        Index("ix_orders_status_created_at", "status", text("created_at DESC"), text("id DESC")),
+        Index(
+            "ix_orders_draft_user_id_updated_at", "user_id", "updated_at",
+            postgresql_where=text("status = 'DRAFT'")
+        ),
+    )
 
     def __repr__(self) -> str:
         return f"<Order(id={self.id}, user_id={self.user_id}, status={self.status.value})>"
 
+
+
+class GeocodeCache(Base):
+    """Постоянный кэш геокодирования (адрес → координаты)."""
+    __tablename__ = "geocode_cache"
+
+    # Нормализованный адрес (ключ кэша)
+    address_key: Mapped[str] = mapped_column(Text, primary_key=True)
+    
+    # Координаты (NULL — адрес не найден, «отрицательная» запись)
+    latitude: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    longitude: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    found: Mapped[bool] = mapped_column(Boolean, nullable=False)
+    
+    # Метаданные
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<GeocodeCache(address_key={self.address_key}, found={self.found})>"
+
+
+class FsmState(Base):
+    """Состояние FSM диалога (см. app/states/storage.py)."""
+    __tablename__ = "fsm_states"
+
+    # Ключ хранилища: бот, чат, пользователь, назначение
+    key: Mapped[str] = mapped_column(Text, primary_key=True)
+    
+    # Текущее состояние (NULL — вне сценария) и данные диалога
+    state: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    data: Mapped[dict] = mapped_column(JSONB, nullable=False, server_default="{}")
+    
+    # Метаданные
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+    def __repr__(self) -> str:
+        return f"<FsmState(key={self.key}, state={self.state})>"
+
+
+class OrderCounter(Base):
+    """Число заказов по пользователю и статусу (см. OrderDBService.count_orders)."""
+    __tablename__ = "order_counters"
+
+    # telegram_id пользователя; ALL_USERS — итог по всем пользователям
+    user_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    status: Mapped[OrderStatus] = mapped_column(Enum(OrderStatus), primary_key=True)
+    count: Mapped[int] = mapped_column(BigInteger, nullable=False, server_default="0")
+
+    # Строки итогов по статусу (telegram_id пользователей положительные)
+    ALL_USERS = 0
+
+    def __repr__(self) -> str:
+        return f"<OrderCounter(user_id={self.user_id}, status={self.status.value}, count={self.count})>"
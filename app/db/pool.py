@@ -0,0 +1,149 @@
+"""
+Метрики пула соединений с БД.
+
+InstrumentedPool замеряет время получения соединения (ожидание свободного
+соединения, а также подключение и pre-ping), события пула — время жизни
+соединений. pool_stats() добавляет к ним текущие значения пула: занято,
+свободно, сверх pool_size. По ним видно насыщение пула раньше, чем запросы
+начнут падать с TimeoutError.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Optional
+
+from sqlalchemy import event, exc
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+logger = logging.getLogger(__name__)
+
+# Получение соединения дольше этого считается медленным (сек)
+SLOW_CHECKOUT = 0.1
+
+
+def _percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+class PoolMetrics:
+    """Счётчики пула; времена — по последним window значениям."""
+
+    def __init__(self, window: int = 1000):
+        self.waits: deque[float] = deque(maxlen=window)
+        self.lifetimes: deque[float] = deque(maxlen=window)
+        self.checkouts = 0
+        self.slow_checkouts = 0
+        self.timeouts = 0
+        self.opened = 0
+        self.closed = 0
+        self.invalidated = 0
+
+    def record_checkout(self, seconds: float) -> None:
+        self.checkouts += 1
+        self.waits.append(seconds)
+        if seconds > SLOW_CHECKOUT:
+            self.slow_checkouts += 1
+
+    def stats(self) -> dict:
+        waits, lifetimes = list(self.waits), list(self.lifetimes)
+        return {
+            "checkouts": self.checkouts,
+            "slow_checkouts": self.slow_checkouts,
+            "timeouts": self.timeouts,
+            "wait_p50_ms": round(_percentile(waits, 0.5) * 1000, 2),
+            "wait_p99_ms": round(_percentile(waits, 0.99) * 1000, 2),
+            "wait_max_ms": round(max(waits, default=0.0) * 1000, 2),
+            "opened": self.opened,
+            "closed": self.closed,
+            "invalidated": self.invalidated,
+            "lifetime_avg_s": round(sum(lifetimes) / len(lifetimes), 1) if lifetimes else 0.0,
+            "lifetime_max_s": round(max(lifetimes, default=0.0), 1),
+        }
+
+
+# Один движок на процесс — одни метрики (переживают пересоздание пула при dispose)
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool с замером времени получения соединения."""
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            pool_metrics.timeouts += 1
+            raise
+        finally:
+            pool_metrics.record_checkout(time.perf_counter() - started)
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """Подписаться на события пула: открытие, закрытие и сброс соединений."""
+    @event.listens_for(engine.sync_engine, "connect")
+    def on_connect(dbapi_connection, connection_record) -> None:
+        pool_metrics.opened += 1
+
+    @event.listens_for(engine.sync_engine, "close")
+    def on_close(dbapi_connection, connection_record) -> None:
+        pool_metrics.closed += 1
+        pool_metrics.lifetimes.append(time.time() - connection_record.starttime)
+
+    @event.listens_for(engine.sync_engine, "invalidate")
+    def on_invalidate(dbapi_connection, connection_record, exception) -> None:
+        pool_metrics.invalidated += 1
+
+
+def pool_stats(engine: AsyncEngine) -> dict:
+    """Текущее состояние пула и накопленные метрики."""
+    pool = engine.sync_engine.pool
+    stats = {"pool": pool.__class__.__name__}
+    if isinstance(pool, AsyncAdaptedQueuePool):
+        stats.update({
+            "size": pool.size(),
+            "in_use": pool.checkedout(),
+            "idle": pool.checkedin(),
+            # Соединений сверх pool_size (отрицательное — ещё не все открыты)
+            "overflow": pool.overflow(),
+            "max_overflow": pool._max_overflow,
+        })
+    stats.update(pool_metrics.stats())
+    return stats
+
+
+class PoolStatsLogger:
+    """Периодический лог метрик пула; предупреждение, если пул на пределе."""
+
+    def __init__(self, engine: AsyncEngine, interval: float):
+        self.engine = engine
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        # Таймаутов на момент предыдущего лога (счётчик накопительный)
+        self._timeouts = pool_metrics.timeouts
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            stats = pool_stats(self.engine)
+            saturated = "size" in stats and stats["in_use"] >= stats["size"] + max(stats["max_overflow"], 0)
+            new_timeouts = stats["timeouts"] - self._timeouts
+            self._timeouts = stats["timeouts"]
+            if saturated or new_timeouts:
+                logger.warning(f"Пул соединений БД на пределе (новых таймаутов: {new_timeouts}): {stats}")
+            else:
+                logger.info(f"Пул соединений БД: {stats}")
+
+    async def start(self) -> None:
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
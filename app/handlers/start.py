@@ -1,39 +1,46 @@
 """Обработчики команд /start, /help и главного меню."""
 import logging
+from typing import Optional
+
 from aiogram import Router
 from aiogram.filters import CommandStart, Command
-from aiogram.types import Message
+from aiogram.methods import TelegramMethod
+from aiogram.types import CallbackQuery, InlineKeyboardMarkup, Message
+from sqlalchemy.exc import SQLAlchemyError
 
+from app.db.models import Order
 from app.keyboards.main_menu import get_main_menu
-from app.db import get_async_session
-from app.services import UserDBService
+from app.keyboards.orders import OrdersPage, get_orders_pager
+from app.services import OrderDBService, UserDBService
+from app.services.order_db_service import OrderCursor, order_cursor
 
 start_router = Router()
 logger = logging.getLogger(__name__)
 
+# Заказов на странице «Мои заказы»
+ORDERS_PAGE_SIZE = 5
+
 
 @start_router.message(CommandStart())
-async def handle_start(message: Message) -> None:
+async def handle_start(message: Message, user_service: UserDBService) -> TelegramMethod:
     """Ответ на команду /start."""
-    # Сохраняем или обновляем пользователя в БД
-    async for session in get_async_session():
-        try:
-            user_service = UserDBService(session)
-            user, created = await user_service.get_or_create_user(
-                telegram_id=message.from_user.id,
-                username=message.from_user.username,
-                first_name=message.from_user.first_name,
-                last_name=message.from_user.last_name
-            )
-            
-            if created:
-                logger.info(f"Новый пользователь создан: {user.telegram_id} (@{user.username})")
-            else:
-                logger.info(f"Пользователь обновлён: {user.telegram_id} (@{user.username})")
-        except Exception as e:
-            logger.error(f"Ошибка при сохранении пользователя: {e}")
+    # Сохраняем или обновляем пользователя в БД; приветствие отправляем и без БД
+    try:
+        user, created = await user_service.get_or_create_user(
+            telegram_id=message.from_user.id,
+            username=message.from_user.username,
+            first_name=message.from_user.first_name,
+            last_name=message.from_user.last_name
+        )
+        
+        if created:
+            logger.info(f"Новый пользователь создан: {user.telegram_id} (@{user.username})")
+        else:
+            logger.info(f"Пользователь обновлён: {user.telegram_id} (@{user.username})")
+    except (SQLAlchemyError, OSError) as e:
+        logger.exception(f"Ошибка при сохранении пользователя: {e}")
     
-    await message.answer(
+    return message.answer(
         f"👋 Добро пожаловать в <b>SibCargo</b>!\n\n"
         f"Я помогу вам заказать грузоперевозку быстро и удобно.\n"
         f"Выберите действие из меню:",
@@ -42,9 +49,9 @@ async def handle_start(message: Message) -> None:
 
 
 @start_router.message(Command("help"))
-async def handle_help(message: Message) -> None:
+async def handle_help(message: Message) -> TelegramMethod:
     """Ответ на команду /help."""
-    await message.answer(
+    return message.answer(
         "ℹ️ <b>Как пользоваться ботом:</b>\n\n"
         "🚚 <b>Оформить перевозку</b> — создать новую заявку\n"
         "ℹ️ <b>О нас</b> — информация о компании\n"
@@ -55,9 +62,9 @@ async def handle_help(message: Message) -> None:
 
 
 @start_router.message(lambda msg: msg.text == "ℹ️ О нас")
-async def handle_about(message: Message) -> None:
+async def handle_about(message: Message) -> TelegramMethod:
     """Информация о компании."""
-    await message.answer(
+    return message.answer(
         "ℹ️ <b>О компании SibCargo</b>\n\n"
         "Мы предоставляем услуги грузоперевозок по Новосибирску и области.\n\n"
         "📞 <b>Контакты:</b>\n"
@@ -67,90 +74,127 @@ async def handle_about(message: Message) -> None:
     )
 
 
+def format_orders(orders: list[Order]) -> str:
+    """Текст страницы списка заказов."""
+    orders_text = "📦 <b>Ваши заказы:</b>\n\n"
+    
+    for order in orders:
+        # Получаем строковое значение статуса и приводим к верхнему регистру
+        status_value = order.status.value if hasattr(order.status, 'value') else str(order.status)
+        status_value = status_value.upper()  # Приводим к верхнему регистру!
+        
+        status_emoji = {
+            "DRAFT": "📝",
+            "PENDING": "⏳",
+            "CONFIRMED": "✅",
+            "IN_PROGRESS": "🚚",
+            "COMPLETED": "✔️",
+            "CANCELLED": "❌"
+        }.get(status_value, "❓")
+        
+        status_text = {
+            "DRAFT": "Черновик",
+            "PENDING": "Ожидает подтверждения",
+            "CONFIRMED": "Подтверждён",
+            "IN_PROGRESS": "В процессе доставки",
+            "COMPLETED": "Завершён",
+            "CANCELLED": "Отменён"
+        }.get(status_value, "Неизвестно")
+        
+        orders_text += f"{status_emoji} <b>Заказ #{order.id}</b> — {status_text}\n"
+        
+        if order.load_address:
+            orders_text += f"📍 Откуда: {order.load_address[:50]}...\n" if len(order.load_address) > 50 else f"📍 Откуда: {order.load_address}\n"
+        
+        if order.unload_address:
+            orders_text += f"📍 Куда: {order.unload_address[:50]}...\n" if len(order.unload_address) > 50 else f"📍 Куда: {order.unload_address}\n"
+        
+        if order.distance_km:
+            # Убираем .0 для целых чисел
+            distance_str = f"{order.distance_km:.1f}".rstrip('0').rstrip('.')
+            orders_text += f"📏 Расстояние: {distance_str} км\n"
+        
+        if order.weight_kg:
+            # Убираем .0 для целых чисел
+            weight_str = f"{order.weight_kg:.1f}".rstrip('0').rstrip('.')
+            orders_text += f"⚖️ Вес: {weight_str} кг\n"
+        
+        if order.price_rub:
+            orders_text += f"💰 Стоимость: {int(order.price_rub)} ₽\n"
+        
+        orders_text += f"📅 Создан: {order.created_at.strftime('%d.%m.%Y %H:%M')}\n"
+        orders_text += "\n"
+    
+    return orders_text
+
+
+async def get_orders_page(
+    order_service: OrderDBService,
+    user_id: int,
+    after: Optional[OrderCursor] = None,
+    before: Optional[OrderCursor] = None
+) -> tuple[list[Order], Optional[InlineKeyboardMarkup]]:
+    """Страница заказов и кнопки листания от её первого и последнего заказа."""
+    orders, has_newer, has_older = await order_service.get_user_orders_page(
+        user_id=user_id,
+        limit=ORDERS_PAGE_SIZE,
+        after=after,
+        before=before
+    )
+    if not orders:
+        return orders, None
+    pager = get_orders_pager(
+        newer=order_cursor(orders[0]) if has_newer else None,
+        older=order_cursor(orders[-1]) if has_older else None
+    )
+    return orders, pager
+
+
 @start_router.message(lambda msg: msg.text == "📦 Мои заказы")
-async def handle_my_orders(message: Message) -> None:
-    """Показать заказы пользователя."""
-    async for session in get_async_session():
-        try:
-            # Получаем пользователя
-            user_service = UserDBService(session)
-            user = await user_service.get_user_by_telegram_id(
-                telegram_id=message.from_user.id
-            )
-            
-            if not user:
-                await message.answer("❌ Пользователь не найден. Нажмите /start")
-                return
-            
-            # Получаем заказы пользователя
-            from app.services import OrderDBService
-            order_service = OrderDBService(session)
-            orders = await order_service.get_user_orders(
-                user_id=user.telegram_id,
-                limit=10
-            )
-            
-            if not orders:
-                await message.answer(
-                    "📦 <b>Мои заказы</b>\n\n"
-                    "У вас пока нет заказов.\n"
-                    "Создайте первый заказ через кнопку «🚚 Оформить перевозку»"
-                )
-                return
-            
-            # Формируем список заказов
-            orders_text = "📦 <b>Ваши заказы:</b>\n\n"
-            
-            for order in orders:
-                # Получаем строковое значение статуса и приводим к верхнему регистру
-                status_value = order.status.value if hasattr(order.status, 'value') else str(order.status)
-                status_value = status_value.upper()  # Приводим к верхнему регистру!
-                
-                status_emoji = {
-                    "DRAFT": "📝",
-                    "PENDING": "⏳",
-                    "CONFIRMED": "✅",
-                    "IN_PROGRESS": "🚚",
-                    "COMPLETED": "✔️",
-                    "CANCELLED": "❌"
-                }.get(status_value, "❓")
-                
-                status_text = {
-                    "DRAFT": "Черновик",
-                    "PENDING": "Ожидает подтверждения",
-                    "CONFIRMED": "Подтверждён",
-                    "IN_PROGRESS": "В процессе доставки",
-                    "COMPLETED": "Завершён",
-                    "CANCELLED": "Отменён"
-                }.get(status_value, "Неизвестно")
-                
-                orders_text += f"{status_emoji} <b>Заказ #{order.id}</b> — {status_text}\n"
-                
-                if order.load_address:
-                    orders_text += f"📍 Откуда: {order.load_address[:50]}...\n" if len(order.load_address) > 50 else f"📍 Откуда: {order.load_address}\n"
-                
-                if order.unload_address:
-                    orders_text += f"📍 Куда: {order.unload_address[:50]}...\n" if len(order.unload_address) > 50 else f"📍 Куда: {order.unload_address}\n"
-                
-                if order.distance_km:
-                    # Убираем .0 для целых чисел
-                    distance_str = f"{order.distance_km:.1f}".rstrip('0').rstrip('.')
-                    orders_text += f"📏 Расстояние: {distance_str} км\n"
-                
-                if order.weight_kg:
-                    # Убираем .0 для целых чисел
-                    weight_str = f"{order.weight_kg:.1f}".rstrip('0').rstrip('.')
-                    orders_text += f"⚖️ Вес: {weight_str} кг\n"
-                
-                if order.price_rub:
-                    orders_text += f"💰 Стоимость: {int(order.price_rub)} ₽\n"
-                
-                orders_text += f"📅 Создан: {order.created_at.strftime('%d.%m.%Y %H:%M')}\n"
-                orders_text += "\n"
-            
-            await message.answer(orders_text)
-            
-        except Exception as e:
-            logger.error(f"Ошибка при получении заказов: {e}")
-            await message.answer("❌ Произошла ошибка при получении заказов")
+async def handle_my_orders(
+    message: Message,
+    user_service: UserDBService,
+    order_service: OrderDBService
+) -> TelegramMethod:
+    """Показать последние заказы пользователя (дальше — листание кнопками)."""
+    # Получаем пользователя
+    user = await user_service.get_user_by_telegram_id(
+        telegram_id=message.from_user.id
+    )
+    
+    if not user:
+        return message.answer("❌ Пользователь не найден. Нажмите /start")
+    
+    # Первая страница заказов
+    orders, pager = await get_orders_page(order_service, user.telegram_id)
+    
+    if not orders:
+        return message.answer(
+            "📦 <b>Мои заказы</b>\n\n"
+            "У вас пока нет заказов.\n"
+            "Создайте первый заказ через кнопку «🚚 Оформить перевозку»"
+        )
+    
+    return message.answer(format_orders(orders), reply_markup=pager)
 
+
+@start_router.callback_query(OrdersPage.filter())
+async def handle_orders_page(
+    callback: CallbackQuery,
+    callback_data: OrdersPage,
+    order_service: OrderDBService
+) -> TelegramMethod:
+    """Листание заказов: сообщение со списком редактируется на месте."""
+    cursor = callback_data.cursor
+    orders, pager = await get_orders_page(
+        order_service,
+        callback.from_user.id,
+        after=cursor if callback_data.direction == "older" else None,
+        before=cursor if callback_data.direction == "newer" else None
+    )
+    
+    if not orders:
+        return callback.answer("Больше заказов нет")
+    
+    await callback.message.edit_text(format_orders(orders), reply_markup=pager)
+    return callback.answer()
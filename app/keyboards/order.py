@@ -16,6 +16,7 @@ def get_cancel_keyboard() -> ReplyKeyboardMarkup:
 def get_location_keyboard() -> ReplyKeyboardMarkup:
     """Клавиатура для ввода адреса."""
     keyboard = [
+        [KeyboardButton(text="📍 Моё местоположение", request_location=True)],
         [KeyboardButton(text="❌ Отменить")]
     ]
     return ReplyKeyboardMarkup(
@@ -0,0 +1,45 @@
+"""Клавиатура листания списка заказов."""
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from app.services.order_db_service import OrderCursor
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class OrdersPage(CallbackData, prefix="orders"):
+    """
+    Кнопка перехода к странице заказов.
+
+    Курсор (created_at в микросекундах, id) — граничный заказ текущей
+    страницы: direction "older" — заказы старше него, "newer" — новее.
+    Укладывается в 64 байта callback_data.
+    """
+    direction: str
+    created_us: int
+    order_id: int
+
+    @classmethod
+    def from_cursor(cls, direction: str, cursor: OrderCursor) -> "OrdersPage":
+        created_at, order_id = cursor
+        return cls(direction=direction, created_us=(created_at - EPOCH) // timedelta(microseconds=1), order_id=order_id)
+
+    @property
+    def cursor(self) -> OrderCursor:
+        return EPOCH + timedelta(microseconds=self.created_us), self.order_id
+
+
+def get_orders_pager(
+    newer: Optional[OrderCursor],
+    older: Optional[OrderCursor]
+) -> Optional[InlineKeyboardMarkup]:
+    """Кнопки «← / →» (None — листать некуда)."""
+    row = []
+    if newer is not None:
+        row.append(InlineKeyboardButton(text="← Новее", callback_data=OrdersPage.from_cursor("newer", newer).pack()))
+    if older is not None:
+        row.append(InlineKeyboardButton(text="Старше →", callback_data=OrdersPage.from_cursor("older", older).pack()))
+    return InlineKeyboardMarkup(inline_keyboard=[row]) if row else None
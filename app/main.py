@@ -1,13 +1,28 @@
 """Точка входа в приложение."""
 import asyncio
 import logging
+import signal
+from contextlib import suppress
+from typing import Optional
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
 
 from app.config import settings
+from app.db.base import engine
+from app.db.pool import PoolStatsLogger
 from app.handlers import setup_routers
+from app.middlewares import setup_middlewares
+from app.services import UserDBService
+from app.services.distance_cache import distance_cache
+from app.services.gazetteer import load_gazetteer
+from app.services.geocoders import close_geocoders
+from app.services.pricing import load_tariffs
+from app.services.routing import load_road_graph
+from app.states.storage import create_fsm_storage
 
 # Настройка логирования
 logging.basicConfig(
@@ -17,23 +32,136 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-async def main() -> None:
-    """Запуск бота."""
-    # Инициализация бота и диспетчера
-    bot = Bot(
+def create_dispatcher() -> Dispatcher:
+    """Диспетчер с хранилищем FSM, middleware и роутерами (общий для polling и webhook)."""
+    dispatcher = Dispatcher(storage=create_fsm_storage())
+    setup_middlewares(dispatcher)
+    dispatcher.include_router(setup_routers())
+
+    pool_logger = PoolStatsLogger(engine, settings.db_pool_stats_interval)
+    dispatcher.startup.register(pool_logger.start)
+    dispatcher.shutdown.register(pool_logger.stop)
+    return dispatcher
+
+
+async def run_polling(bot: Bot, dispatcher: Dispatcher) -> None:
+    """Получение обновлений через getUpdates."""
+    # Telegram не отдаёт обновления через getUpdates, пока установлен webhook
+    await bot.delete_webhook()
+    logger.info("Бот запущен (polling)")
+    await dispatcher.start_polling(bot, allowed_updates=dispatcher.resolve_used_update_types())
+
+
+def stop_signal() -> asyncio.Event:
+    """Событие, которое устанавливается по SIGINT/SIGTERM."""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        with suppress(NotImplementedError):
+            loop.add_signal_handler(sig, stop.set)
+    return stop
+
+
+async def serve_webhook(app: web.Application, bot: Bot, allowed_updates: list[str]) -> None:
+    """Запустить HTTP-сервер webhook, зарегистрировать его в Telegram и работать до сигнала остановки."""
+    if settings.webhook_url and not settings.webhook_secret:
+        raise ValueError("Для публичного webhook (WEBHOOK_URL) нужен WEBHOOK_SECRET")
+    if not settings.webhook_secret:
+        logger.warning("WEBHOOK_SECRET не задан: запросы к webhook не проверяются")
+
+    stop = stop_signal()
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, settings.webhook_host, settings.webhook_port).start()
+        logger.info(f"Бот запущен (webhook): {settings.webhook_host}:{settings.webhook_port}{settings.webhook_path}")
+
+        if settings.webhook_url:
+            await bot.set_webhook(
+                url=settings.webhook_url.rstrip("/") + settings.webhook_path,
+                secret_token=settings.webhook_secret,
+                allowed_updates=allowed_updates,
+                max_connections=settings.webhook_max_connections
+            )
+            logger.info(f"Webhook зарегистрирован: {settings.webhook_url}{settings.webhook_path}")
+        else:
+            # Локальный запуск: обновления присылает scripts/post_update.py
+            logger.warning("WEBHOOK_URL не задан: webhook в Telegram не регистрируется")
+
+        await stop.wait()
+    finally:
+        await runner.cleanup()
+
+
+async def run_webhook(bot: Bot, dispatcher: Dispatcher) -> None:
+    """
+    Получение обновлений через webhook (HTTP-сервер aiohttp).
+
+    Каждый запрос Telegram обрабатывается в своей задаче, параллельно — до
+    WEBHOOK_MAX_CONNECTIONS одновременно. Ответ обработчика (return
+    message.answer(...)) отправляется прямо в ответе на webhook, без
+    отдельного запроса к Bot API.
+    """
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dispatcher,
+        bot=bot,
+        handle_in_background=False,
+        secret_token=settings.webhook_secret or None
+    ).register(app, path=settings.webhook_path)
+    setup_application(app, dispatcher, bot=bot)
+    await serve_webhook(app, bot, dispatcher.resolve_used_update_types())
+
+
+def create_bot() -> Bot:
+    """Клиент Bot API."""
+    return Bot(
         token=settings.bot_token,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
-    dispatcher = Dispatcher()
+
+
+def load_resources() -> str:
+    """Загрузить данные, нужные обработчикам; вернуть версию дорожного графа (для кэша расстояний)."""
+    # Тариф компилируется один раз при старте
+    load_tariffs(settings.tariffs_path)
     
-    # Регистрация роутеров
-    dispatcher.include_router(setup_routers())
+    # Офлайн-индекс адресов для геокодирования без сети
+    load_gazetteer(settings.gazetteer_path)
+    
+    # Дорожный граф для расчёта расстояния по дорогам
+    road_graph = load_road_graph(settings.road_graph_path, max_snap_km=settings.routing_max_snap_km)
+    graph_version = road_graph.version if road_graph else ""
+    distance_cache.load(graph_version)
+    return graph_version
+
+
+async def close_resources(graph_version: str, distance_cache_path: Optional[str] = None) -> None:
+    """Сохранить кэш расстояний (по умолчанию — в DISTANCE_CACHE_PATH) и закрыть HTTP-сессии геокодеров."""
+    distance_cache.save(graph_version, distance_cache_path)
+    logger.info(f"Кэш пользователей: {UserDBService.cache_stats()}")
+    await close_geocoders()
+
+
+async def main() -> None:
+    """Запуск бота."""
+    if settings.workers > 1:
+        # Приём обновлений в этом процессе, обработка — в WORKERS процессах
+        from app.sharding import run_sharded
+        await run_sharded()
+        return
+
+    bot = create_bot()
+    dispatcher = create_dispatcher()
+    graph_version = load_resources()
     
-    # Запуск polling
-    logger.info("Бот запущен")
     try:
-        await dispatcher.start_polling(bot, allowed_updates=dispatcher.resolve_used_update_types())
+        if settings.bot_mode == "webhook":
+            await run_webhook(bot, dispatcher)
+        else:
+            await run_polling(bot, dispatcher)
     finally:
+        await close_resources(graph_version)
         await bot.session.close()
 
 
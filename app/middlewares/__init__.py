@@ -0,0 +1,17 @@
+"""Middleware диспетчера."""
+from aiogram import Dispatcher
+
+from app.db.base import async_session_maker
+from app.middlewares.db import DbSessionMiddleware
+
+
+def setup_middlewares(dispatcher: Dispatcher) -> None:
+    """Регистрирует middleware на обновлениях, которые обрабатывают роутеры."""
+    db_middleware = DbSessionMiddleware(async_session_maker)
+    # Inner middleware вызывается только для найденного обработчика:
+    # обновления без обработчика сессию не создают
+    dispatcher.message.middleware(db_middleware)
+    dispatcher.callback_query.middleware(db_middleware)
+
+
+__all__ = ["DbSessionMiddleware", "setup_middlewares"]
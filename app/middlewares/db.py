@@ -0,0 +1,51 @@
+"""
+Сессия БД на обновление.
+
+Middleware создаёт одну AsyncSession на обработку обновления и передаёт
+обработчику сервисы поверх неё: session, user_service, order_service
+(параметры с такими именами в сигнатуре обработчика). Сессия ленивая:
+соединение берётся из пула только при первом запросе и возвращается при
+commit сервиса или при закрытии сессии сразу после обработчика. Обработчики
+без запросов к БД пул не трогают.
+"""
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.services import OrderDBService, UserDBService
+
+logger = logging.getLogger(__name__)
+
+DB_ERROR_TEXT = "❌ Сервис временно недоступен, попробуйте позже"
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    """Сессия и сервисы БД для обработчика."""
+
+    def __init__(self, session_maker: async_sessionmaker[AsyncSession]):
+        self.session_maker = session_maker
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        async with self.session_maker() as session:
+            data["session"] = session
+            data["user_service"] = UserDBService(session)
+            data["order_service"] = OrderDBService(session)
+            try:
+                return await handler(event, data)
+            except (SQLAlchemyError, OSError) as e:
+                # Незакоммиченные изменения откатываются при закрытии сессии
+                logger.exception(f"Ошибка БД при обработке обновления: {e}")
+                if isinstance(event, CallbackQuery):
+                    return event.answer(DB_ERROR_TEXT, show_alert=True)
+                if isinstance(event, Message):
+                    return event.answer(DB_ERROR_TEXT)
+                raise
@@ -0,0 +1,248 @@
+"""
+Нормализация адресов перед геокодированием.
+
+Адрес разбивается на токены, сокращения типа улицы приводятся к полной
+форме («ул.» → «улица», «пр-т» → «проспект»), населённый пункт
+определяется автоматом Ахо–Корасик по списку населённых пунктов региона.
+Результат — структурированный адрес (улица/дом/город/регион), по которому
+делается один структурированный запрос к геокодеру вместо перебора
+строковых вариантов.
+"""
+import re
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional
+
+# Населённые пункты региона работы -> субъект РФ
+REGIONAL_SETTLEMENTS = {
+    "Новосибирская область": [
+        "Новосибирск", "Бердск", "Искитим", "Обь", "Кольцово", "Краснообск",
+        "Барабинск", "Болотное", "Карасук", "Каргат", "Куйбышев", "Купино",
+        "Татарск", "Тогучин", "Черепаново", "Чулым", "Коченёво", "Мошково",
+        "Ордынское", "Сузун", "Колывань", "Линёво",
+    ],
+    "Алтайский край": [
+        "Барнаул", "Бийск", "Рубцовск", "Новоалтайск", "Заринск", "Камень-на-Оби",
+        "Славгород", "Алейск", "Яровое", "Белокуриха", "Горняк", "Змеиногорск",
+    ],
+    "Томская область": [
+        "Томск", "Северск", "Стрежевой", "Асино", "Колпашево", "Кедровый",
+    ],
+    "Кемеровская область": [
+        "Кемерово", "Новокузнецк", "Прокопьевск", "Междуреченск", "Ленинск-Кузнецкий",
+        "Киселёвск", "Юрга", "Белово", "Анжеро-Судженск", "Берёзовский", "Осинники",
+        "Мыски", "Мариинск", "Топки", "Полысаево", "Калтан", "Таштагол", "Гурьевск",
+    ],
+    "Красноярский край": [
+        "Красноярск", "Норильск", "Ачинск", "Канск", "Железногорск", "Минусинск",
+        "Зеленогорск", "Лесосибирск", "Назарово", "Шарыпово", "Сосновоборск",
+        "Дивногорск", "Бородино", "Боготол", "Енисейск", "Ужур", "Заозёрный",
+    ],
+    "Омская область": [
+        "Омск", "Тара", "Калачинск", "Исилькуль", "Называевск", "Тюкалинск",
+    ],
+}
+
+# Сокращения типа улицы -> полная форма
+STREET_TYPE_ABBREVIATIONS = {
+    "улица": "улица", "ул": "улица",
+    "проспект": "проспект", "пр": "проспект", "пр-т": "проспект", "пр-кт": "проспект", "просп": "проспект",
+    "переулок": "переулок", "пер": "переулок",
+    "площадь": "площадь", "пл": "площадь",
+    "шоссе": "шоссе", "ш": "шоссе",
+    "бульвар": "бульвар", "б-р": "бульвар", "бул": "бульвар",
+    "проезд": "проезд", "пр-д": "проезд",
+    "набережная": "набережная", "наб": "набережная",
+    "микрорайон": "микрорайон", "мкр": "микрорайон", "мкрн": "микрорайон",
+    "тракт": "тракт",
+    "тупик": "тупик", "туп": "тупик",
+    "аллея": "аллея",
+}
+
+# Слова, которые не относятся ни к улице, ни к дому
+_NOISE_TOKENS = {"россия", "рф", "г", "город", "д", "дом"}
+_REGION_TOKENS = {"область", "обл", "край"}
+_BUILDING_TOKENS = {"к": "к", "корп": "к", "корпус": "к", "стр": "с", "строение": "с"}
+
+_PUNCTUATION_RE = re.compile(r"[,.;:\"'«»()]+")
+_HOUSE_RE = re.compile(r"^\d+[а-я]?(/\d+[а-я]?)?(к\d+)?(с\d+)?$")
+
+
+def normalize_text(text: str) -> str:
+    """Нижний регистр, «ё» → «е», без знаков препинания и лишних пробелов."""
+    text = text.lower().replace("ё", "е")
+    return " ".join(_PUNCTUATION_RE.sub(" ", text).split())
+
+
+class AhoCorasick:
+    """Автомат Ахо–Корасик для поиска набора строк за один проход по тексту."""
+
+    def __init__(self, patterns: list[str]):
+        """Построить автомат по списку (уже нормализованных) строк."""
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._output: list[list[str]] = [[]]
+
+        for pattern in patterns:
+            node = 0
+            for char in pattern:
+                if char not in self._goto[node]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                    self._goto[node][char] = len(self._goto) - 1
+                node = self._goto[node][char]
+            self._output[node].append(pattern)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def find_all(self, text: str) -> list[tuple[int, str]]:
+        """Все вхождения (позиция начала, строка) в порядке окончания."""
+        matches = []
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            for pattern in self._output[node]:
+                matches.append((index - len(pattern) + 1, pattern))
+        return matches
+
+
+_SETTLEMENTS = {
+    normalize_text(name): (name, region)
+    for region, names in REGIONAL_SETTLEMENTS.items()
+    for name in names
+}
+_settlement_matcher = AhoCorasick(list(_SETTLEMENTS))
+
+
+def detect_settlement(text: str) -> Optional[tuple[int, str]]:
+    """
+    Найти населённый пункт в нормализованном тексте.
+
+    Учитываются только вхождения целыми словами («омск» в «томск» не
+    считается). При нескольких совпадениях берётся первое, при равных
+    позициях — самое длинное.
+
+    Returns:
+        (позиция, нормализованное название) или None
+    """
+    best = None
+    for start, pattern in _settlement_matcher.find_all(text):
+        end = start + len(pattern)
+        if start > 0 and text[start - 1] != " ":
+            continue
+        if end < len(text) and text[end] != " ":
+            continue
+        if best is None or start < best[0] or (start == best[0] and len(pattern) > len(best[1])):
+            best = (start, pattern)
+    return best
+
+
+@dataclass(frozen=True)
+class NormalizedAddress:
+    """Адрес, разобранный на составные части."""
+
+    city: str
+    region: Optional[str]
+    street_type: Optional[str]
+    street_name: str
+    house: Optional[str]
+
+    @property
+    def street(self) -> str:
+        """Улица с полным типом: «улица Ленина»."""
+        return f"{self.street_type} {self.street_name}" if self.street_type else self.street_name
+
+    @property
+    def key(self) -> str:
+        """Канонический ключ адреса (для кэша)."""
+        return normalize_text(f"{self.city}|{self.street_type or ''}|{self.street_name}|{self.house or ''}")
+
+    def structured_query(self) -> dict:
+        """Структурированный запрос Nominatim (street/city/state/country)."""
+        query = {"city": self.city, "country": "Россия"}
+        if self.region:
+            query["state"] = self.region
+        if self.street_name:
+            query["street"] = f"{self.house} {self.street}" if self.house else self.street
+        return query
+
+    def freeform_query(self) -> str:
+        """Свободная строка запроса для геокодеров без структурированного поиска."""
+        parts = [f"{self.street} {self.house}" if self.house else self.street, self.city]
+        if self.region:
+            parts.append(self.region)
+        parts.append("Россия")
+        return ", ".join(part for part in parts if part)
+
+
+def normalize_address(address: str, default_city: str = "Новосибирск") -> NormalizedAddress:
+    """
+    Разобрать адрес, введённый пользователем.
+
+    Пример: "Новосибирск, ул. Ленина д. 1 корп 2" ->
+        NormalizedAddress(city="Новосибирск", region="Новосибирская область",
+                          street_type="улица", street_name="ленина", house="1к2")
+    """
+    text = normalize_text(address)
+
+    settlement = detect_settlement(text)
+    if settlement:
+        start, pattern = settlement
+        city, region = _SETTLEMENTS[pattern]
+        text = f"{text[:start]} {text[start + len(pattern):]}"
+    else:
+        city, region = _SETTLEMENTS.get(normalize_text(default_city), (default_city, None))
+
+    tokens = text.split()
+
+    # Убираем упоминание субъекта РФ («Новосибирская область»)
+    for index, token in enumerate(tokens):
+        if token in _REGION_TOKENS:
+            del tokens[max(index - 1, 0):index + 1]
+            break
+
+    street_type = None
+    house = None
+    street_tokens = []
+    index = 0
+    while index < len(tokens):
+        token = tokens[index]
+        if token in _NOISE_TOKENS:
+            pass
+        elif token in STREET_TYPE_ABBREVIATIONS and street_type is None:
+            street_type = STREET_TYPE_ABBREVIATIONS[token]
+        elif house is None and _HOUSE_RE.match(token) and street_tokens:
+            house = token
+        elif house is not None and token in _BUILDING_TOKENS and index + 1 < len(tokens):
+            house += _BUILDING_TOKENS[token] + tokens[index + 1]
+            index += 1
+        elif house is None:
+            street_tokens.append(token)
+        index += 1
+
+    return NormalizedAddress(
+        city=city,
+        region=region,
+        street_type=street_type,
+        street_name=" ".join(street_tokens),
+        house=house,
+    )
+
+
+def legacy_variant_count(address: str) -> int:
+    """Сколько строковых вариантов перебирал прежний geocode_address (для статистики)."""
+    text = normalize_text(address)
+    cities = ("новосибирск", "барнаул", "томск", "кемерово", "красноярск", "омск")
+    return 9 if text.startswith(cities) else 6
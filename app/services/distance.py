@@ -0,0 +1,104 @@
+"""
+Векторизованный расчёт расстояний (NumPy) для пакетной обработки заказов.
+
+Точность относительно geopy.geodesic (эллипсоид WGS-84, алгоритм Карни):
+
+- haversine — сфера радиуса 6371.0088 км (средний радиус Земли). Погрешность
+  зависит от широты и направления: в общем случае до ~0.5%, для маршрутов в
+  регионе работы (широты 52–58°) — не более ~0.35% (≈ 3.5 м на 1 км).
+- vincenty — обратная задача Винсенти на эллипсоиде WGS-84. Погрешность
+  меньше 1 мм; для почти антиподальных точек итерации могут не сойтись —
+  такие пары считаются по haversine.
+
+Проверка и замер скорости: python -m scripts.bench_distances
+"""
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Эллипсоид WGS-84
+WGS84_A = 6378.137  # Большая полуось (км)
+WGS84_F = 1 / 298.257223563  # Сжатие
+WGS84_B = WGS84_A * (1 - WGS84_F)  # Малая полуось (км)
+
+
+def _split(points) -> tuple[np.ndarray, np.ndarray]:
+    """Массив (N, 2) широта/долгота -> два массива в радианах."""
+    points = np.asarray(points, dtype=np.float64)
+    if points.ndim != 2 or points.shape[1] != 2:
+        raise ValueError("Ожидается массив координат формы (N, 2): широта, долгота")
+    radians = np.radians(points)
+    return radians[:, 0], radians[:, 1]
+
+
+def haversine_km(origins, destinations) -> np.ndarray:
+    """Расстояния по большому кругу (км) для пар точек."""
+    lat1, lon1 = _split(origins)
+    lat2, lon2 = _split(destinations)
+
+    sin_dlat = np.sin((lat2 - lat1) / 2)
+    sin_dlon = np.sin((lon2 - lon1) / 2)
+    a = sin_dlat ** 2 + np.cos(lat1) * np.cos(lat2) * sin_dlon ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def vincenty_km(origins, destinations, max_iterations: int = 200, tolerance: float = 1e-12) -> np.ndarray:
+    """Расстояния на эллипсоиде WGS-84 (км) для пар точек (обратная задача Винсенти)."""
+    lat1, lon1 = _split(origins)
+    lat2, lon2 = _split(destinations)
+
+    f = WGS84_F
+    u1 = np.arctan((1 - f) * np.tan(lat1))
+    u2 = np.arctan((1 - f) * np.tan(lat2))
+    sin_u1, cos_u1 = np.sin(u1), np.cos(u1)
+    sin_u2, cos_u2 = np.sin(u2), np.cos(u2)
+
+    big_l = lon2 - lon1
+    lam = big_l.copy()
+    active = np.ones(lam.shape, dtype=bool)
+
+    sin_sigma = cos_sigma = sigma = cos_sq_alpha = cos_2sigma_m = np.zeros_like(lam)
+    for _ in range(max_iterations):
+        sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+        sin_sigma = np.sqrt((cos_u2 * sin_lam) ** 2 + (cos_u1 * sin_u2 - sin_u1 * cos_u2 * cos_lam) ** 2)
+        cos_sigma = sin_u1 * sin_u2 + cos_u1 * cos_u2 * cos_lam
+        sigma = np.arctan2(sin_sigma, cos_sigma)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            sin_alpha = np.where(sin_sigma == 0, 0.0, cos_u1 * cos_u2 * sin_lam / sin_sigma)
+            cos_sq_alpha = 1 - sin_alpha ** 2
+            # На экваторе (cos²α = 0) слагаемое не используется
+            cos_2sigma_m = np.where(cos_sq_alpha == 0, 0.0, cos_sigma - 2 * sin_u1 * sin_u2 / cos_sq_alpha)
+
+        c = f / 16 * cos_sq_alpha * (4 + f * (4 - 3 * cos_sq_alpha))
+        lam_next = big_l + (1 - c) * f * sin_alpha * (
+            sigma + c * sin_sigma * (cos_2sigma_m + c * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2))
+        )
+
+        converged = np.abs(lam_next - lam) <= tolerance
+        lam = np.where(active, lam_next, lam)
+        active &= ~converged
+        if not active.any():
+            break
+
+    u_sq = cos_sq_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+    big_a = 1 + u_sq / 16384 * (4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq)))
+    big_b = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+    delta_sigma = big_b * sin_sigma * (
+        cos_2sigma_m + big_b / 4 * (
+            cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)
+            - big_b / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)
+        )
+    )
+    distances = WGS84_B * big_a * (sigma - delta_sigma)
+
+    # Несошедшиеся (почти антиподальные) пары — по сфере
+    if active.any():
+        distances[active] = haversine_km(np.asarray(origins)[active], np.asarray(destinations)[active])
+    return distances
+
+
+DISTANCE_METHODS = {
+    "haversine": haversine_km,
+    "vincenty": vincenty_km,
+}
@@ -0,0 +1,181 @@
+"""
+Кэш расстояний между ячейками geohash.
+
+Заказы часто идут между одними и теми же складами и районами, а расчёт
+маршрута по дорожному графу дорогой. Расстояние запоминается для пары
+ячеек (geohash отправления, geohash назначения) заданной точности: все
+точки внутри ячейки считаются одной точкой. Погрешность — не больше двух
+диагоналей ячейки (точность 7 — ~0.35 км).
+
+Кэш — LRU с TTL в памяти процесса; при заданном DISTANCE_CACHE_PATH он
+сохраняется в JSON-файл при остановке бота и загружается при старте.
+Записи файла, посчитанные на другом дорожном графе, не загружаются.
+При WORKERS > 1 каждый обработчик сохраняет кэш в свой файл (shard_path),
+а приёмник после остановки обработчиков объединяет их в основной (merge).
+"""
+import json
+import logging
+import os
+from typing import Optional, Tuple
+
+from app.config import settings
+from app.services import geohash
+from app.services.ttl_cache import TTLCache, MISSING
+
+logger = logging.getLogger(__name__)
+
+
+class DistanceCache:
+    """LRU-кэш расстояний по паре ячеек geohash."""
+
+    def __init__(self, maxsize: int, ttl: float, precision: int, path: str = ""):
+        """
+        Args:
+            maxsize: Максимальное число пар ячеек
+            ttl: Время жизни записи (сек)
+            precision: Длина geohash (размер ячейки)
+            path: JSON-файл для сохранения между перезапусками (пусто — не сохранять)
+        """
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.precision = precision
+        self.path = path
+
+    def key(self, origin: Tuple[float, float], destination: Tuple[float, float]) -> Tuple[str, str]:
+        """Ключ кэша — пара ячеек geohash."""
+        return (
+            geohash.encode(origin[0], origin[1], self.precision),
+            geohash.encode(destination[0], destination[1], self.precision),
+        )
+
+    def get(self, origin: Tuple[float, float], destination: Tuple[float, float]) -> Optional[float]:
+        """Расстояние (км) или None, если пары нет в кэше."""
+        value = self.memory.get(self.key(origin, destination))
+        return None if value is MISSING else value
+
+    def set(self, origin: Tuple[float, float], destination: Tuple[float, float], distance: float) -> None:
+        """Запомнить расстояние (км)."""
+        self.memory.set(self.key(origin, destination), distance)
+
+    def shard_path(self, index: int) -> str:
+        """Файл кэша процесса-обработчика index (пусто — кэш не сохраняется)."""
+        return f"{self.path}.worker-{index}" if self.path else ""
+
+    def _read(self, path: str) -> Optional[dict]:
+        """Содержимое файла кэша или None (файла нет или он повреждён)."""
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, encoding="utf-8") as source:
+                return json.load(source)
+        except (OSError, ValueError) as e:
+            logger.error(f"Ошибка чтения кэша расстояний {path}: {e}")
+            return None
+
+    def _fill(self, data: dict) -> None:
+        for origin, destination, distance, ttl in data.get("entries", []):
+            self.memory.set((origin, destination), distance, ttl=ttl)
+
+    def load(self, graph_version: str = "") -> int:
+        """
+        Загрузить записи из файла.
+
+        Args:
+            graph_version: Версия дорожного графа; записи другой версии пропускаются
+
+        Returns:
+            Число загруженных записей
+        """
+        data = self._read(self.path) if self.path else None
+        if data is None:
+            return 0
+
+        if data.get("precision") != self.precision or data.get("graph_version") != graph_version:
+            logger.info(f"Кэш расстояний {self.path} посчитан с другими параметрами, не загружается")
+            return 0
+
+        self._fill(data)
+        logger.info(f"Кэш расстояний загружен: {len(self.memory)} пар ячеек")
+        return len(self.memory)
+
+    def merge(self, paths: list[str]) -> int:
+        """
+        Объединить файлы обработчиков в основной файл кэша и удалить их.
+
+        Вызывается приёмником после остановки обработчиков: если бы все они
+        писали в основной файл, остался бы только кэш последнего. Версия графа
+        берётся из самого нового файла, файлы другой версии пропускаются.
+
+        Returns:
+            Число пар ячеек в основном файле (0 — файл не изменён)
+        """
+        found = sorted((path for path in paths if path and os.path.exists(path)), key=os.path.getmtime)
+        shards = []
+        for path in found:
+            data = self._read(path)
+            if data is not None and data.get("precision") == self.precision:
+                shards.append((path, data))
+        if not shards:
+            return 0
+
+        graph_version = shards[-1][1].get("graph_version")
+        for path, data in shards:
+            if data.get("graph_version") == graph_version:
+                self._fill(data)
+            else:
+                logger.info(f"Кэш расстояний {path} посчитан на другом дорожном графе, пропускается")
+        if not self.save(graph_version):
+            return 0
+
+        for path in found:
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.error(f"Не удалось удалить {path}: {e}")
+        return len(self.memory)
+
+    def save(self, graph_version: str = "", path: Optional[str] = None) -> bool:
+        """
+        Сохранить живые записи в файл (атомарно через временный файл).
+
+        Args:
+            graph_version: Версия дорожного графа
+            path: Файл (по умолчанию — основной файл кэша)
+
+        Returns:
+            True, если файл записан
+        """
+        path = self.path if path is None else path
+        if not path:
+            return False
+        data = {
+            "precision": self.precision,
+            "graph_version": graph_version,
+            "entries": [
+                [origin, destination, distance, round(ttl)]
+                for (origin, destination), distance, ttl in self.memory.items()
+            ],
+        }
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as out:
+                json.dump(data, out)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"Ошибка сохранения кэша расстояний {path}: {e}")
+            return False
+        logger.info(f"Кэш расстояний сохранён: {len(data['entries'])} пар ячеек -> {path}")
+        return True
+
+    def stats(self) -> dict:
+        """Счётчики кэша."""
+        return self.memory.stats()
+
+
+# Кэш процесса
+distance_cache = DistanceCache(
+    maxsize=settings.distance_cache_size,
+    ttl=settings.distance_cache_ttl,
+    precision=settings.distance_cache_precision,
+    path=settings.distance_cache_path,
+)
@@ -0,0 +1,409 @@
+"""
+Офлайн-справочник адресов (газеттир) для локального геокодирования.
+
+Индекс строится один раз из выгрузки OpenStreetMap (scripts/build_gazetteer.py)
+и открывается через mmap при старте бота. Формат файла (little-endian):
+
+    magic      8 байт   b"SCGAZ003"
+    count      uint32   число записей
+    offsets    uint32 * (count + 1)   смещения ключей в блоке ключей
+    labels_at  uint32 * (count + 1)   смещения адресов для показа в блоке адресов
+    coords     float32 * 2 * count    широта/долгота
+    keys       UTF-8 ключи "город|название|тип|дом", отсортированные побайтово
+    labels     UTF-8 адреса для показа в порядке ключей ("Красный проспект, 100, Новосибирск")
+
+Тип улицы в ключе — полная форма ("проспект", "площадь"; пусто, если в OSM
+тип не указан): одноимённые улицы разных типов (площадь и проспект Карла
+Маркса) — разные улицы. Тип стоит после названия, поэтому все улицы с одним
+названием лежат рядом: сортировка ключей позволяет искать точный адрес, дома
+улицы (префикс "город|название|тип|") и улицы с названием без учёта типа
+(префикс "город|название|") двоичным поиском без загрузки файла в память.
+
+Для обратного геокодирования хранится исходное написание адреса из OSM.
+Файлы прежних форматов не открываются — индекс нужно пересобрать.
+
+Для обратного геокодирования (координаты -> адрес) при загрузке над точками
+индекса строится k-d дерево (app/services/kdtree.py).
+"""
+import bz2
+import gzip
+import logging
+import mmap
+import os
+import struct
+import time
+import xml.etree.ElementTree as ET
+from array import array
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+from app.services.address_normalizer import STREET_TYPE_ABBREVIATIONS, normalize_text
+from app.services.kdtree import KDTree, chord_to_km, to_unit_vectors
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"SCGAZ003"
+_HEADER = struct.Struct("<8sI")
+
+# Города, для которых строится индекс
+CITIES = ['новосибирск', 'барнаул', 'томск', 'кемерово', 'красноярск', 'омск']
+
+# Обозначения типа улицы (сокращения тоже) -> полная форма
+STREET_TYPES = STREET_TYPE_ABBREVIATIONS
+
+
+def split_street(street: str) -> Tuple[str, str]:
+    """Название и тип улицы: "Красный проспект" -> ("красный", "проспект"); без типа — ("ленина", "")."""
+    name, street_type = [], ""
+    for token in normalize_text(street).split():
+        if token in STREET_TYPES and not street_type:
+            street_type = STREET_TYPES[token]
+        else:
+            name.append(token)
+    return " ".join(name), street_type
+
+
+def normalize_house(house: str) -> str:
+    """Номер дома без пробелов и слов: "195 / 3" -> "195/3", "10 корпус 2" -> "10к2"."""
+    house = normalize_text(house).replace("корпус", "к").replace("корп", "к").replace("строение", "с")
+    return house.replace(" ", "")
+
+
+def make_key(city: str, street_name: str, street_type: Optional[str] = None, house: str = "") -> bytes:
+    """
+    Ключ индекса "город|название|тип|дом" в UTF-8.
+
+    street_type=None — префикс всех улиц с этим названием (без учёта типа).
+    """
+    prefix = f"{normalize_text(city)}|{normalize_text(street_name)}|"
+    if street_type is None:
+        return prefix.encode("utf-8")
+    return f"{prefix}{STREET_TYPES.get(street_type, street_type)}|{normalize_house(house)}".encode("utf-8")
+
+
+def display_address(city: str, street: str, house: str) -> str:
+    """Адрес для показа в написании OSM: "Красный проспект, 100, Новосибирск"."""
+    return ", ".join(" ".join(part.split()) for part in (street, house, city) if part.strip())
+
+
+class Gazetteer:
+    """Индекс адресов, открытый через mmap."""
+
+    def __init__(self, path: str):
+        """Открыть файл индекса."""
+        self.path = path
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.count = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"Файл {path} не является индексом газеттира текущего формата, пересоберите его")
+
+        self._offsets_pos = _HEADER.size
+        self._labels_at_pos = self._offsets_pos + 4 * (self.count + 1)
+        self._coords_pos = self._labels_at_pos + 4 * (self.count + 1)
+        self._keys_pos = self._coords_pos + 8 * self.count
+        keys_size, = struct.unpack_from("<I", self._mm, self._offsets_pos + 4 * self.count)
+        self._labels_pos = self._keys_pos + keys_size
+        self._reverse_index: Optional[KDTree] = None
+
+    def close(self) -> None:
+        """Закрыть mmap и файл."""
+        self._mm.close()
+        self._file.close()
+
+    def _key(self, index: int) -> bytes:
+        start, end = struct.unpack_from("<II", self._mm, self._offsets_pos + 4 * index)
+        return self._mm[self._keys_pos + start:self._keys_pos + end]
+
+    def label(self, index: int) -> str:
+        """Адрес записи для показа."""
+        start, end = struct.unpack_from("<II", self._mm, self._labels_at_pos + 4 * index)
+        return self._mm[self._labels_pos + start:self._labels_pos + end].decode("utf-8")
+
+    def _coords(self, index: int) -> Tuple[float, float]:
+        return struct.unpack_from("<ff", self._mm, self._coords_pos + 8 * index)
+
+    def _lower_bound(self, key: bytes) -> int:
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def get(self, key: bytes) -> Optional[Tuple[float, float]]:
+        """Точный поиск по ключу."""
+        index = self._lower_bound(key)
+        if index < self.count and self._key(index) == key:
+            return self._coords(index)
+        return None
+
+    def prefix(self, prefix: bytes) -> Iterator[Tuple[bytes, Tuple[float, float]]]:
+        """Все записи, ключ которых начинается с prefix (в порядке ключей)."""
+        index = self._lower_bound(prefix)
+        while index < self.count:
+            key = self._key(index)
+            if not key.startswith(prefix):
+                break
+            yield key, self._coords(index)
+            index += 1
+
+    def _streets(self, city: str, street_name: str, street_type: Optional[str]) -> dict[str, dict[str, Tuple[float, float]]]:
+        """
+        Дома улиц с этим названием по типам: {тип: {дом: координаты}}.
+
+        С типом — только улица этого типа и улица, тип которой в OSM не указан.
+        """
+        if street_type is not None:
+            prefixes = [make_key(city, street_name, found_type) for found_type in (street_type, "")]
+        else:
+            prefixes = [make_key(city, street_name)]
+
+        streets: dict[str, dict[str, Tuple[float, float]]] = {}
+        for prefix in prefixes:
+            for key, coords in self.prefix(prefix):
+                _, _, found_type, house = key.decode("utf-8").split("|")
+                streets.setdefault(found_type, {})[house] = coords
+        return streets
+
+    def lookup(
+        self,
+        city: str,
+        street_name: str,
+        house: Optional[str] = None,
+        street_type: Optional[str] = None
+    ) -> Optional[Tuple[float, float]]:
+        """
+        Найти координаты адреса.
+
+        street_name — название без типа. С типом ищется улица этого типа (или
+        улица без типа в OSM); без типа — улица с этим названием, где есть
+        нужный дом, а если таких несколько — с наибольшим числом домов.
+        Если дом не указан — возвращается центр улицы (среднее по её домам).
+        Для дробного номера без точного совпадения пробуется основной номер
+        ("195/3" -> "195").
+        """
+        if not street_name:
+            return None
+
+        if street_type is not None:
+            street_type = STREET_TYPES.get(street_type, street_type)
+        streets = self._streets(city, street_name, street_type)
+        if street_type is not None:
+            # Указанный тип важнее улицы без типа
+            ordered = [streets.get(street_type, {}), streets.get("", {})]
+        else:
+            ordered = sorted(streets.values(), key=len, reverse=True)
+
+        if house:
+            house = normalize_house(house)
+            candidates = [house, house.split("/")[0]] if "/" in house else [house]
+            for candidate in candidates:
+                for houses in ordered:
+                    if candidate in houses:
+                        return houses[candidate]
+            return None
+
+        houses = next((houses for houses in ordered if houses), None)
+        if not houses:
+            return None
+        points = list(houses.values())
+        return (
+            sum(lat for lat, _ in points) / len(points),
+            sum(lon for _, lon in points) / len(points),
+        )
+
+    def build_reverse_index(self) -> None:
+        """Построить k-d дерево по точкам индекса для обратного геокодирования."""
+        started = time.perf_counter()
+        coords = np.frombuffer(self._mm, dtype="<f4", count=2 * self.count, offset=self._coords_pos)
+        points = to_unit_vectors(coords[0::2], coords[1::2])
+        del coords  # Копия сделана — освобождаем ссылку на mmap (иначе его нельзя закрыть)
+        self._reverse_index = KDTree(points)
+        logger.info(f"Индекс обратного геокодирования построен за {time.perf_counter() - started:.2f} с")
+
+    def nearest(self, latitude: float, longitude: float) -> Optional[Tuple[str, float]]:
+        """
+        Ближайший к точке адрес.
+
+        Returns:
+            (адрес для показа, расстояние в км) или None, если индекс пуст или не построен
+        """
+        if self._reverse_index is None:
+            return None
+        found = self._reverse_index.nearest(to_unit_vectors([latitude], [longitude])[0])
+        if found is None:
+            return None
+        index, chord = found
+        return self.label(index), chord_to_km(chord)
+
+    def __len__(self) -> int:
+        return self.count
+
+
+def _open_osm(path: str):
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def _is_address(tags: dict) -> bool:
+    return bool(tags.get("addr:street") and tags.get("addr:housenumber") and tags.get("addr:city"))
+
+
+def _addressed_way_nodes(osm_path: str) -> np.ndarray:
+    """Отсортированные id узлов контуров с адресом (первый проход по файлу)."""
+    refs = array("q")
+    way_nodes = array("q")
+    tags: dict[str, str] = {}
+    root = None
+
+    with _open_osm(osm_path) as source:
+        for event, element in ET.iterparse(source, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = element
+                if element.tag == "way":
+                    tags = {}
+                    way_nodes = array("q")
+                continue
+
+            if element.tag == "tag":
+                tags[element.get("k")] = element.get("v")
+            elif element.tag == "nd":
+                way_nodes.append(int(element.get("ref")))
+            elif element.tag == "way":
+                if _is_address(tags):
+                    refs.extend(way_nodes)
+                root.clear()
+            elif element.tag in ("node", "relation"):
+                root.clear()
+    return np.unique(np.frombuffer(refs, dtype=np.int64))
+
+
+def iter_osm_addresses(osm_path: str) -> Iterator[Tuple[str, str, str, float, float]]:
+    """
+    Извлечь адреса (город, улица, дом, широта, долгота) из OSM XML.
+
+    Учитываются точки и контуры (здания) с тегами addr:street и
+    addr:housenumber; для контуров берётся центр по узлам. Файл читается
+    дважды: сначала собираются id узлов контуров с адресом, затем в
+    массиве запоминаются координаты только этих узлов (а не всех узлов
+    выгрузки — их миллионы).
+    """
+    wanted = _addressed_way_nodes(osm_path)
+    wanted_coords = np.full((len(wanted), 2), np.nan)
+    way_nodes: list[int] = []
+    tags: dict[str, str] = {}
+
+    root = None
+
+    with _open_osm(osm_path) as source:
+        for event, element in ET.iterparse(source, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = element
+                if element.tag in ("node", "way"):
+                    tags = {}
+                    way_nodes = []
+                continue
+
+            if element.tag == "tag":
+                tags[element.get("k")] = element.get("v")
+            elif element.tag == "nd":
+                way_nodes.append(int(element.get("ref")))
+            elif element.tag in ("node", "way"):
+                if element.tag == "node":
+                    point = (float(element.get("lat")), float(element.get("lon")))
+                    node_id = int(element.get("id"))
+                    position = int(np.searchsorted(wanted, node_id))
+                    if position < len(wanted) and wanted[position] == node_id:
+                        wanted_coords[position] = point
+                elif _is_address(tags) and way_nodes:
+                    # Все узлы контура есть в wanted; узлы за границей выгрузки остаются NaN
+                    points = wanted_coords[np.searchsorted(wanted, way_nodes)]
+                    points = points[~np.isnan(points[:, 0])]
+                    point = tuple(points.mean(axis=0).tolist()) if len(points) else None
+                else:
+                    point = None
+
+                if point and _is_address(tags):
+                    yield tags["addr:city"], tags["addr:street"], tags["addr:housenumber"], point[0], point[1]
+                root.clear()
+            elif element.tag == "relation":
+                root.clear()
+
+
+def build_gazetteer(osm_path: str, out_path: str, cities: list[str] = CITIES) -> int:
+    """
+    Построить файл индекса из OSM XML (.osm, .osm.bz2, .osm.gz).
+
+    Returns:
+        Число адресов в индексе
+    """
+    wanted = {normalize_text(city) for city in cities}
+    entries: dict[bytes, Tuple[float, float, bytes]] = {}
+
+    for city, street, house, lat, lon in iter_osm_addresses(osm_path):
+        if normalize_text(city) not in wanted:
+            continue
+        label = display_address(city, street, house).encode("utf-8")
+        # Первая запись адреса (точка или контур здания) остаётся; одноимённые
+        # улицы разных типов различаются по типу в ключе
+        entries.setdefault(make_key(city, *split_street(street), house), (lat, lon, label))
+
+    keys = sorted(entries)
+    labels = [entries[key][2] for key in keys]
+    offsets, labels_at = [0], [0]
+    for key, label in zip(keys, labels):
+        offsets.append(offsets[-1] + len(key))
+        labels_at.append(labels_at[-1] + len(label))
+
+    tmp_path = f"{out_path}.tmp"
+    with open(tmp_path, "wb") as out:
+        out.write(_HEADER.pack(MAGIC, len(keys)))
+        out.write(struct.pack(f"<{len(offsets)}I", *offsets))
+        out.write(struct.pack(f"<{len(labels_at)}I", *labels_at))
+        for key in keys:
+            out.write(struct.pack("<ff", *entries[key][:2]))
+        for key in keys:
+            out.write(key)
+        for label in labels:
+            out.write(label)
+    os.replace(tmp_path, out_path)
+
+    logger.info(f"Газеттир построен: {len(keys)} адресов -> {out_path}")
+    return len(keys)
+
+
+# Индекс процесса (загружается при старте бота, см. load_gazetteer)
+_gazetteer: Optional[Gazetteer] = None
+
+
+def load_gazetteer(path: str) -> Optional[Gazetteer]:
+    """Открыть индекс, если файл существует; иначе геокодирование идёт только через сеть."""
+    global _gazetteer
+    if _gazetteer is None:
+        if not os.path.exists(path):
+            logger.warning(f"Индекс газеттира {path} не найден, локальное геокодирование отключено")
+            return None
+        try:
+            _gazetteer = Gazetteer(path)
+        except ValueError as e:
+            logger.warning(f"{e}; локальное геокодирование отключено")
+            return None
+        _gazetteer.build_reverse_index()
+        logger.info(f"Газеттир загружен: {len(_gazetteer)} адресов")
+    return _gazetteer
+
+
+def get_gazetteer() -> Optional[Gazetteer]:
+    """Загруженный индекс или None."""
+    return _gazetteer
@@ -1,10 +1,20 @@
 """Сервис для работы с геолокацией и расчёта расстояний."""
+import asyncio
 import logging
 from typing import Optional, Tuple
-from geopy.geocoders import Nominatim
+
+import numpy as np
 from geopy.distance import geodesic
 from geopy.exc import GeocoderTimedOut, GeocoderServiceError
 
+from app.services.address_normalizer import legacy_variant_count, normalize_address
+from app.services.distance import DISTANCE_METHODS
+from app.services.distance_cache import distance_cache
+from app.services.geocode_cache import geocode_cache
+from app.services.geocoders import get_geocoder_chain, upstream_stats
+from app.services.geo_throttle import Priority
+from app.services.routing import get_road_graph
+
 logger = logging.getLogger(__name__)
 
 
@@ -13,79 +23,55 @@ class GeoService:
     
     def __init__(self):
         """Инициализация геокодера."""
-        self.geolocator = Nominatim(user_agent="sibcargo_bot")
+        self.geocoder = get_geocoder_chain()
     
-    async def geocode_address(self, address: str, city: str = "Новосибирск") -> Optional[Tuple[float, float]]:
+    async def geocode_address(
+        self,
+        address: str,
+        city: str = "Новосибирск",
+        priority: Priority = Priority.INTERACTIVE
+    ) -> Optional[Tuple[float, float]]:
         """
         Получить координаты по адресу.
         
         Args:
             address: Адрес в текстовом формате
             city: Город по умолчанию (если не указан в адресе)
+            priority: Приоритет в очереди запросов к геокодеру
             
         Returns:
             Кортеж (широта, долгота) или None если адрес не найден
         """
         try:
-            # Проверяем, есть ли город в адресе
-            address_lower = address.lower()
-            cities = ['новосибирск', 'барнаул', 'томск', 'кемерово', 'красноярск', 'омск']
-            has_city = any(city_name in address_lower for city_name in cities)
+            # Разбираем адрес: город, тип и название улицы, дом
+            normalized = normalize_address(address, default_city=city)
+            upstream_stats["addresses"] += 1
+            upstream_stats["legacy_variants"] += legacy_variant_count(address)
             
-            # Если города нет, добавляем по умолчанию
-            if not has_city:
-                base_address = f"{address} {city}"
-            else:
-                base_address = address
+            # Сначала ищем в локальном индексе адресов (без сети)
+            location = await self.geocoder.geocode_local(normalized)
+            if location:
+                logger.info(f"✅ Адрес найден в локальном индексе: {location.latitude}, {location.longitude}")
+                return (location.latitude, location.longitude)
             
-            # Пробуем множество вариантов поиска
-            search_variants = [
-                # Оригинальный формат
-                f"{base_address}, Россия",
-                f"{base_address} Россия",
-                
-                # С "улица" в начале
-                f"улица {base_address}, Россия",
-                f"улица {base_address} Россия",
-                
-                # С "ул." в начале
-                f"ул. {base_address}, Россия",
-                f"ул. {base_address} Россия",
-                
-                # Если город в начале, пробуем переставить
-                # Например: "Новосибирск Сухарная 101" -> "Сухарная 101, Новосибирск, Россия"
-            ]
+            # Затем смотрим в кэш (память → БД)
+            cached, coordinates = await geocode_cache.get(normalized.key)
+            if cached:
+                logger.debug(f"Адрес '{address}' найден в кэше: {coordinates}")
+                return coordinates
             
-            # Если город в начале, пробуем переставить его в конец
-            if has_city:
-                for city_name in cities:
-                    if address_lower.startswith(city_name):
-                        # Убираем город из начала
-                        street_part = address[len(city_name):].strip().strip(',').strip()
-                        if street_part:
-                            search_variants.extend([
-                                f"{street_part}, {city_name.capitalize()}, Россия",
-                                f"улица {street_part}, {city_name.capitalize()}, Россия",
-                                f"ул. {street_part}, {city_name.capitalize()}, Россия",
-                            ])
-                        break
+            # Сетевые геокодеры: один структурированный запрос, свободная строка — только при промахе
+            location = await self.geocoder.geocode_remote(normalized, priority)
             
-            for search_query in search_variants:
-                logger.info(f"Попытка поиска: '{search_query}'")
-                
-                location = self.geolocator.geocode(
-                    search_query,
-                    timeout=10,
-                    exactly_one=True,
-                    language='ru'
-                )
-                
-                if location:
-                    logger.info(f"✅ Адрес найден: {location.latitude}, {location.longitude}")
-                    logger.info(f"Полный адрес: {location.address}")
-                    return (location.latitude, location.longitude)
+            if location:
+                logger.info(f"✅ Адрес найден: {location.latitude}, {location.longitude}")
+                logger.info(f"Полный адрес: {location.address}")
+                coordinates = (location.latitude, location.longitude)
+                await geocode_cache.set(normalized.key, coordinates)
+                return coordinates
             
-            logger.warning(f"❌ Адрес '{address}' не найден ни в одном варианте")
+            logger.warning(f"❌ Адрес '{address}' не найден")
+            await geocode_cache.set(normalized.key, None)
             return None
                 
         except (GeocoderTimedOut, GeocoderServiceError) as e:
@@ -109,12 +95,75 @@ class GeoService:
         """
         try:
             distance = geodesic(point1, point2).kilometers
-            logger.info(f"Расстояние между {point1} и {point2}: {distance:.2f} км")
+            logger.debug(f"Расстояние между {point1} и {point2}: {distance:.2f} км")
             return round(distance, 2)
         except Exception as e:
             logger.error(f"Ошибка расчёта расстояния: {e}")
             return 0.0
     
+    async def calculate_route_distance(
+        self,
+        point1: Tuple[float, float],
+        point2: Tuple[float, float]
+    ) -> float:
+        """
+        Рассчитать расстояние по дорогам между двумя точками.
+        
+        Если дорожный граф не загружен, точка далеко от дорог или маршрут
+        не найден — возвращается расстояние по прямой (calculate_distance).
+        Результат кэшируется по паре ячеек geohash (см. distance_cache).
+        
+        Args:
+            point1: Координаты первой точки (широта, долгота)
+            point2: Координаты второй точки (широта, долгота)
+            
+        Returns:
+            Расстояние в километрах
+        """
+        cached = distance_cache.get(point1, point2)
+        if cached is not None:
+            logger.debug(f"Расстояние между {point1} и {point2} найдено в кэше: {cached} км")
+            return cached
+        
+        distance = None
+        road_graph = get_road_graph()
+        if road_graph is not None:
+            # Поиск пути — CPU-задача, не блокируем цикл событий
+            distance = await asyncio.to_thread(road_graph.route_distance, point1, point2)
+            if distance is not None:
+                logger.info(f"Расстояние по дорогам между {point1} и {point2}: {distance:.2f} км")
+                distance = round(distance, 2)
+            else:
+                logger.warning(f"Маршрут между {point1} и {point2} не найден, расстояние по прямой")
+        
+        if distance is None:
+            distance = self.calculate_distance(point1, point2)
+        distance_cache.set(point1, point2, distance)
+        return distance
+    
+    def calculate_distances_batch(
+        self,
+        origins,
+        destinations,
+        method: str = "haversine"
+    ) -> np.ndarray:
+        """
+        Рассчитать расстояния для массива пар точек за один векторизованный проход.
+        
+        Args:
+            origins: Координаты начальных точек, форма (N, 2): широта, долгота
+            destinations: Координаты конечных точек, форма (N, 2)
+            method: "haversine" (сфера, погрешность до ~0.5%) или
+                "vincenty" (эллипсоид WGS-84, погрешность меньше 1 мм),
+                подробнее — в app/services/distance.py
+            
+        Returns:
+            Массив расстояний в километрах (N,)
+        """
+        if method not in DISTANCE_METHODS:
+            raise ValueError(f"Неизвестный метод расчёта расстояний: {method}")
+        return DISTANCE_METHODS[method](origins, destinations)
+    
     async def get_address_from_coordinates(
         self,
         latitude: float,
@@ -131,15 +180,11 @@ class GeoService:
             Адрес в текстовом формате или None
         """
         try:
-            location = self.geolocator.reverse(
-                f"{latitude}, {longitude}",
-                timeout=10,
-                language='ru'
-            )
+            address = await self.geocoder.reverse(latitude, longitude)
             
-            if location:
-                logger.info(f"Координаты {latitude}, {longitude} -> {location.address}")
-                return location.address
+            if address:
+                logger.info(f"Координаты {latitude}, {longitude} -> {address}")
+                return address
             else:
                 return None
                 
@@ -0,0 +1,170 @@
+"""
+Ограничение частоты запросов к геокодеру.
+
+Политика Nominatim — не больше ~1 запроса в секунду на приложение. Все
+запросы процесса проходят через общий токен-бакет; ожидающие обслуживаются
+по приоритету (интерактивные шаги FSM раньше фоновых задач), а одинаковые
+запросы, уже отправленные кем-то другим, не дублируются (single-flight).
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from app.config import settings
+
+
+class Priority(IntEnum):
+    """Приоритет запроса к геокодеру (меньше — раньше)."""
+    INTERACTIVE = 0  # Пользователь ждёт ответа в чате
+    BACKGROUND = 10  # Пакетные задачи, дозаполнение данных
+
+
+class PriorityTokenBucket:
+    """Токен-бакет с очередью ожидающих по приоритету."""
+
+    def __init__(self, rate: float, capacity: float):
+        """
+        Args:
+            rate: Скорость пополнения (токенов в секунду)
+            capacity: Максимальный запас токенов (допустимый всплеск)
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+        self._pump_task: Optional[asyncio.Task] = None
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self, priority: Priority = Priority.INTERACTIVE) -> None:
+        """Дождаться токена."""
+        self._refill()
+        if not self._waiters and self._tokens >= 1:
+            self._tokens -= 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), waiter))
+        self._start_pump()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # Отменён уже после выдачи токена — возвращаем токен следующему ожидающему
+            if waiter.done() and not waiter.cancelled():
+                self._tokens += 1
+                self._grant()
+            raise
+
+    def _start_pump(self) -> None:
+        if self._waiters and (self._pump_task is None or self._pump_task.done()):
+            self._pump_task = asyncio.create_task(self._pump())
+
+    def _grant(self) -> None:
+        """Выдать имеющиеся токены ожидающим в порядке приоритета."""
+        while self._waiters and self._tokens >= 1:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if waiter.done():  # Ожидающий отменён — токен не тратим
+                continue
+            self._tokens -= 1
+            waiter.set_result(None)
+
+    async def _pump(self) -> None:
+        """Раздавать токены ожидающим по мере пополнения бакета."""
+        while self._waiters:
+            self._refill()
+            self._grant()
+            if self._waiters:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    @property
+    def queued(self) -> int:
+        """Число ожидающих токена."""
+        return sum(1 for _, _, waiter in self._waiters if not waiter.done())
+
+
+class SingleFlight:
+    """Объединение одинаковых одновременных вызовов в один."""
+
+    def __init__(self):
+        self._calls: dict[Hashable, tuple[asyncio.Task, list[int]]] = {}
+        self.shared = 0
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Выполнить func или присоединиться к уже выполняющемуся вызову с тем же ключом.
+
+        Если все ожидающие отменены, общий вызов тоже отменяется.
+        """
+        call = self._calls.get(key)
+        if call is None:
+            task = asyncio.create_task(func())
+            call = (task, [0])
+            self._calls[key] = call
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self.shared += 1
+
+        task, waiting = call
+        waiting[0] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if waiting[0] == 1 and not task.done():
+                task.cancel()
+            raise
+        finally:
+            waiting[0] -= 1
+
+
+class GeocoderThrottle:
+    """Общий для процесса ограничитель запросов к геокодеру."""
+
+    def __init__(self, rate: float, burst: float):
+        self.bucket = PriorityTokenBucket(rate=rate, capacity=burst)
+        self.single_flight = SingleFlight()
+        self.requests = 0
+
+    async def call(
+        self,
+        key: Hashable,
+        func: Callable[[], Awaitable[Any]],
+        priority: Priority = Priority.INTERACTIVE
+    ) -> Any:
+        """Выполнить запрос к геокодеру с учётом лимита и объединения дублей."""
+        async def throttled():
+            await self.bucket.acquire(priority)
+            self.requests += 1
+            return await func()
+
+        return await self.single_flight.do(key, throttled)
+
+    def stats(self) -> dict:
+        """Счётчики ограничителя."""
+        return {
+            "requests": self.requests,
+            "shared": self.single_flight.shared,
+            "queued": self.bucket.queued,
+        }
+
+
+def query_key(method: str, query: Any) -> Hashable:
+    """Ключ single-flight для запроса геокодера (строка или структурированный dict)."""
+    if isinstance(query, dict):
+        query = tuple(sorted(query.items()))
+    return method, query
+
+
+# Ограничитель процесса. При WORKERS > 1 у каждого обработчика свой бакет,
+# поэтому лимит делится между процессами: в сумме — не больше GEOCODER_RATE_LIMIT
+geocoder_throttle = GeocoderThrottle(
+    rate=settings.geocoder_rate_limit / settings.workers,
+    burst=max(settings.geocoder_burst / settings.workers, 1.0)
+)
@@ -0,0 +1,113 @@
+"""Двухуровневый кэш геокодирования: LRU в памяти + таблица geocode_cache."""
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.config import settings
+from app.db.base import async_session_maker
+from app.db.models import GeocodeCache
+from app.services.ttl_cache import TTLCache, MISSING
+
+logger = logging.getLogger(__name__)
+
+class GeocodeCacheStore:
+    """
+    Кэш результатов геокодирования.
+
+    Первый уровень — LRU с TTL в памяти процесса, второй — таблица
+    geocode_cache в Postgres (общая для всех процессов и переживает рестарт).
+    Адреса, которые не удалось найти, тоже кэшируются (с коротким TTL),
+    чтобы не повторять заведомо безуспешные запросы к геокодеру.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, negative_ttl: float):
+        """
+        Args:
+            maxsize: Размер LRU в памяти
+            ttl: Время жизни найденного адреса (сек)
+            negative_ttl: Время жизни «адрес не найден» (сек)
+        """
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.db_hits = 0
+        self.db_misses = 0
+
+    async def get(self, key: str) -> Tuple[bool, Optional[Tuple[float, float]]]:
+        """
+        Найти адрес в кэше.
+
+        Returns:
+            Кортеж (найдено_в_кэше, координаты). Координаты None при
+            найденной «отрицательной» записи.
+        """
+        value = self.memory.get(key)
+        if value is not MISSING:
+            return True, value
+
+        try:
+            async with async_session_maker() as session:
+                stmt = select(GeocodeCache).where(
+                    GeocodeCache.address_key == key,
+                    GeocodeCache.expires_at > datetime.now(timezone.utc)
+                )
+                row = (await session.execute(stmt)).scalar_one_or_none()
+        except (SQLAlchemyError, OSError) as e:
+            logger.error(f"Ошибка чтения кэша геокодирования: {e}")
+            return False, None
+
+        if row is None:
+            self.db_misses += 1
+            return False, None
+
+        self.db_hits += 1
+        coordinates = (row.latitude, row.longitude) if row.found else None
+        self.memory.set(key, coordinates, ttl=self._ttl_for(coordinates))
+        return True, coordinates
+
+    async def set(self, key: str, coordinates: Optional[Tuple[float, float]]) -> None:
+        """Сохранить результат геокодирования (None — адрес не найден)."""
+        ttl = self._ttl_for(coordinates)
+        self.memory.set(key, coordinates, ttl=ttl)
+
+        values = {
+            "address_key": key,
+            "latitude": coordinates[0] if coordinates else None,
+            "longitude": coordinates[1] if coordinates else None,
+            "found": coordinates is not None,
+            "expires_at": datetime.now(timezone.utc) + timedelta(seconds=ttl),
+        }
+        stmt = insert(GeocodeCache).values(**values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[GeocodeCache.address_key],
+            set_={name: stmt.excluded[name] for name in values if name != "address_key"}
+        )
+        try:
+            async with async_session_maker() as session:
+                await session.execute(stmt)
+                await session.commit()
+        except (SQLAlchemyError, OSError) as e:
+            logger.error(f"Ошибка записи кэша геокодирования: {e}")
+
+    def _ttl_for(self, coordinates: Optional[Tuple[float, float]]) -> float:
+        return self.ttl if coordinates is not None else self.negative_ttl
+
+    def stats(self) -> dict:
+        """Счётчики попаданий/промахов по уровням."""
+        return {
+            "memory": self.memory.stats(),
+            "db_hits": self.db_hits,
+            "db_misses": self.db_misses,
+        }
+
+
+# Общий кэш процесса (GeoService создаётся на каждый запрос)
+geocode_cache = GeocodeCacheStore(
+    maxsize=settings.geocode_cache_size,
+    ttl=settings.geocode_cache_ttl,
+    negative_ttl=settings.geocode_negative_ttl
+)
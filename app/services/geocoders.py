@@ -0,0 +1,458 @@
+"""
+Цепочка геокодеров с отслеживанием задержек и автоматическим выключателем.
+
+Бэкенды опрашиваются по порядку из GEOCODER_BACKENDS:
+
+- local     — офлайн-индекс адресов (газеттир), без сети;
+- nominatim — Nominatim (публичный или свой, NOMINATIM_URL), через общий
+              ограничитель частоты запросов;
+- photon    — Photon-совместимый сервер (PHOTON_URL).
+
+Для сетевых бэкендов ведётся статистика задержек. Если бэкенд подряд
+возвращает ошибки, выключатель (circuit breaker) исключает его из цепочки
+на GEOCODER_BREAKER_RESET секунд. Если ответ основного бэкенда задерживается
+дольше его p95, параллельно отправляется запрос в следующий (hedged request)
+и берётся первый найденный результат.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, NamedTuple, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+from geopy.adapters import AioHTTPAdapter
+from geopy.exc import GeocoderServiceError, GeocoderTimedOut, GeocoderUnavailable
+from geopy.geocoders import Nominatim, Photon
+
+from app.config import settings
+from app.services.address_normalizer import NormalizedAddress
+from app.services.gazetteer import get_gazetteer
+from app.services.geo_throttle import Priority, geocoder_throttle, query_key
+
+logger = logging.getLogger(__name__)
+
+# Сколько адресов геокодировано и сколько запросов ушло к внешним геокодерам
+# (legacy_variants — сколько строковых вариантов перебирала старая схема)
+upstream_stats = {"addresses": 0, "requests": 0, "legacy_variants": 0}
+
+
+class GeocodeResult(NamedTuple):
+    """Результат геокодирования."""
+    latitude: float
+    longitude: float
+    address: Optional[str] = None
+
+
+# Общая для всех сетевых геокодеров HTTP-сессия с пулом соединений
+_http_session: Optional[aiohttp.ClientSession] = None
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Общая aiohttp-сессия процесса (создаётся при первом обращении)."""
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        _http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=settings.geocoder_pool_size,
+                ttl_dns_cache=300
+            ),
+            trust_env=False,
+            raise_for_status=False
+        )
+    return _http_session
+
+
+class PooledAioHTTPAdapter(AioHTTPAdapter):
+    """AioHTTP-адаптер geopy, работающий через общую сессию процесса."""
+
+    @property
+    def session(self):
+        return get_http_session()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        # Сессия общая, её закрывает close_geocoders()
+        pass
+
+
+class LatencyTracker:
+    """Скользящее окно задержек бэкенда."""
+
+    def __init__(self, window: int = 200):
+        self._samples: deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        """Добавить замер (сек)."""
+        self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Перцентиль задержки (q от 0 до 1) или None, если замеров мало."""
+        if len(self._samples) < 5:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class CircuitBreaker:
+    """
+    Автоматический выключатель бэкенда.
+
+    closed    — запросы идут как обычно;
+    open      — после failure_threshold ошибок подряд бэкенд пропускается;
+    half-open — через reset_timeout пропускается один пробный запрос:
+                успех закрывает выключатель, ошибка снова открывает.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_progress = False
+
+    @property
+    def state(self) -> str:
+        """Текущее состояние: closed / open / half-open."""
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        """Можно ли отправить запрос в бэкенд."""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._trial_in_progress:
+            self._trial_in_progress = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_progress = False
+
+    def release_trial(self) -> None:
+        """Пробный запрос отменён, не дождавшись ответа."""
+        self._trial_in_progress = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial_in_progress = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class GeocoderBackend:
+    """Базовый класс бэкенда геокодирования."""
+
+    name = "base"
+    is_local = False
+
+    def __init__(self):
+        self.latency = LatencyTracker()
+        self.breaker = CircuitBreaker(
+            failure_threshold=settings.geocoder_breaker_failures,
+            reset_timeout=settings.geocoder_breaker_reset
+        )
+        self.calls = 0
+        self.errors = 0
+
+    async def geocode(self, address: NormalizedAddress, priority: Priority) -> Optional[GeocodeResult]:
+        """Найти адрес (None — адрес не найден)."""
+        raise NotImplementedError
+
+    async def reverse(self, latitude: float, longitude: float, priority: Priority) -> Optional[str]:
+        """Найти адрес по координатам (None — не найден)."""
+        return None
+
+    async def _timed(self, request: Awaitable):
+        """
+        Выполнить запрос к серверу бэкенда, записав его длительность.
+
+        Замеряется только сам запрос: ожидание токена ограничителя частоты
+        в задержку бэкенда не входит, иначе очередь завышала бы p95.
+        """
+        started = time.monotonic()
+        result = await request
+        self.latency.record(time.monotonic() - started)
+        return result
+
+    def hedge_delay(self) -> float:
+        """Через сколько секунд без ответа стоит спросить следующий бэкенд."""
+        p95 = self.latency.percentile(0.95)
+        if p95 is None:
+            return settings.geocoder_hedge_delay
+        return max(settings.geocoder_hedge_min_delay, p95)
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "breaker": self.breaker.state,
+            "p50": self.latency.percentile(0.5),
+            "p95": self.latency.percentile(0.95),
+        }
+
+
+class LocalBackend(GeocoderBackend):
+    """Офлайн-индекс адресов (газеттир)."""
+
+    name = "local"
+    is_local = True
+
+    async def geocode(self, address: NormalizedAddress, priority: Priority) -> Optional[GeocodeResult]:
+        gazetteer = get_gazetteer()
+        if gazetteer is None:
+            return None
+        coordinates = gazetteer.lookup(address.city, address.street_name, address.house, address.street_type)
+        if coordinates is None:
+            return None
+        return GeocodeResult(coordinates[0], coordinates[1])
+
+    async def reverse(self, latitude: float, longitude: float, priority: Priority) -> Optional[str]:
+        gazetteer = get_gazetteer()
+        if gazetteer is None:
+            return None
+        found = gazetteer.nearest(latitude, longitude)
+        # Слишком далёкий дом — не адрес точки, спрашиваем сетевые геокодеры
+        if found is None or found[1] * 1000 > settings.reverse_geocode_max_distance:
+            return None
+        return found[0]
+
+
+def _split_url(url: str) -> tuple[str, str]:
+    """"http://127.0.0.1:8080" -> ("http", "127.0.0.1:8080")."""
+    parts = urlsplit(url if "://" in url else f"https://{url}")
+    return parts.scheme, parts.netloc + parts.path.rstrip("/")
+
+
+class NominatimBackend(GeocoderBackend):
+    """Nominatim: структурированный запрос, при промахе — свободная строка."""
+
+    name = "nominatim"
+
+    def __init__(self, url: str):
+        super().__init__()
+        scheme, domain = _split_url(url)
+        self.geolocator = Nominatim(
+            user_agent="sibcargo_bot",
+            domain=domain,
+            scheme=scheme,
+            timeout=settings.geocoder_timeout,
+            adapter_factory=PooledAioHTTPAdapter
+        )
+
+    async def _request(self, method: str, query, priority: Priority, **kwargs):
+        async def request():
+            logger.info(f"Запрос к {self.name}: '{query}'")
+            upstream_stats["requests"] += 1
+            return await self._timed(getattr(self.geolocator, method)(query, language='ru', **kwargs))
+
+        # Политика Nominatim: общий лимит частоты и объединение одинаковых запросов
+        return await geocoder_throttle.call(query_key(method, query), request, priority)
+
+    async def geocode(self, address: NormalizedAddress, priority: Priority) -> Optional[GeocodeResult]:
+        for query in (address.structured_query(), address.freeform_query()):
+            location = await self._request("geocode", query, priority, exactly_one=True)
+            if location:
+                return GeocodeResult(location.latitude, location.longitude, location.address)
+        return None
+
+    async def reverse(self, latitude: float, longitude: float, priority: Priority) -> Optional[str]:
+        location = await self._request("reverse", f"{latitude}, {longitude}", priority)
+        return location.address if location else None
+
+
+class PhotonBackend(GeocoderBackend):
+    """Photon-совместимый сервер (например, свой экземпляр Photon)."""
+
+    name = "photon"
+
+    def __init__(self, url: str):
+        super().__init__()
+        scheme, domain = _split_url(url)
+        self.geolocator = Photon(
+            domain=domain,
+            scheme=scheme,
+            timeout=settings.geocoder_timeout,
+            adapter_factory=PooledAioHTTPAdapter
+        )
+
+    async def geocode(self, address: NormalizedAddress, priority: Priority) -> Optional[GeocodeResult]:
+        query = address.freeform_query()
+        logger.info(f"Запрос к {self.name}: '{query}'")
+        upstream_stats["requests"] += 1
+        location = await self._timed(self.geolocator.geocode(query, exactly_one=True))
+        if location:
+            return GeocodeResult(location.latitude, location.longitude, location.address)
+        return None
+
+    async def reverse(self, latitude: float, longitude: float, priority: Priority) -> Optional[str]:
+        query = f"{latitude}, {longitude}"
+        logger.info(f"Запрос к {self.name}: '{query}'")
+        upstream_stats["requests"] += 1
+        location = await self._timed(self.geolocator.reverse(query, exactly_one=True))
+        return location.address if location else None
+
+
+class GeocoderChain:
+    """Цепочка бэкендов: локальные по очереди, сетевые — с хеджированием."""
+
+    def __init__(self, backends: list[GeocoderBackend], hedge: bool = True):
+        self.backends = backends
+        self.hedge = hedge
+
+    @property
+    def local_backends(self) -> list[GeocoderBackend]:
+        return [backend for backend in self.backends if backend.is_local]
+
+    @property
+    def remote_backends(self) -> list[GeocoderBackend]:
+        return [backend for backend in self.backends if not backend.is_local]
+
+    async def geocode_local(self, address: NormalizedAddress) -> Optional[GeocodeResult]:
+        """Поиск только в локальных бэкендах (без сети)."""
+        for backend in self.local_backends:
+            result = await backend.geocode(address, Priority.INTERACTIVE)
+            if result:
+                return result
+        return None
+
+    async def geocode_remote(
+        self,
+        address: NormalizedAddress,
+        priority: Priority = Priority.INTERACTIVE
+    ) -> Optional[GeocodeResult]:
+        """
+        Поиск в сетевых бэкендах.
+
+        Raises:
+            GeocoderUnavailable: ни один бэкенд не ответил (все с ошибкой
+                или отключены выключателем)
+        """
+        return await self._run(
+            self.remote_backends,
+            lambda backend: backend.geocode(address, priority)
+        )
+
+    async def reverse(
+        self,
+        latitude: float,
+        longitude: float,
+        priority: Priority = Priority.INTERACTIVE
+    ) -> Optional[str]:
+        """Обратное геокодирование: сначала локально, затем по сети."""
+        for backend in self.local_backends:
+            result = await backend.reverse(latitude, longitude, priority)
+            if result:
+                return result
+        return await self._run(
+            self.remote_backends,
+            lambda backend: backend.reverse(latitude, longitude, priority)
+        )
+
+    async def _call(self, backend: GeocoderBackend, func: Callable[[GeocoderBackend], Awaitable]):
+        """Вызвать бэкенд с учётом задержек и выключателя. Ошибка -> исключение наружу."""
+        backend.calls += 1
+        try:
+            result = await func(backend)
+        except (GeocoderTimedOut, GeocoderServiceError) as e:
+            backend.errors += 1
+            backend.breaker.record_failure()
+            logger.warning(f"Геокодер {backend.name} вернул ошибку: {e} (выключатель: {backend.breaker.state})")
+            raise
+        except asyncio.CancelledError:
+            backend.breaker.release_trial()
+            raise
+        backend.breaker.record_success()
+        return result
+
+    async def _run(self, backends: list[GeocoderBackend], func: Callable[[GeocoderBackend], Awaitable]):
+        """
+        Опросить бэкенды по порядку, запуская следующий при ошибке, промахе
+        или (если включено хеджирование) при задержке ответа дольше p95.
+        """
+        queue = list(backends)
+        pending: dict[asyncio.Task, GeocoderBackend] = {}
+        answered = False
+
+        def start_next() -> Optional[GeocoderBackend]:
+            while queue:
+                backend = queue.pop(0)
+                if backend.breaker.allow():
+                    pending[asyncio.create_task(self._call(backend, func))] = backend
+                    return backend
+                logger.info(f"Геокодер {backend.name} пропущен: выключатель разомкнут")
+            return None
+
+        current = start_next()
+        try:
+            while pending:
+                timeout = current.hedge_delay() if self.hedge and queue and current else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    logger.info(f"Геокодер {current.name} отвечает дольше {timeout:.2f} с, запрос дублируется")
+                    current = start_next() or current
+                    continue
+
+                for task in done:
+                    pending.pop(task)
+                    if task.exception() is None:
+                        answered = True
+                        if task.result():
+                            return task.result()
+
+                if not pending:
+                    current = start_next()
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        if not answered:
+            raise GeocoderUnavailable("Нет доступных геокодеров")
+        return None
+
+    def stats(self) -> dict:
+        """Статистика по бэкендам."""
+        return {backend.name: backend.stats() for backend in self.backends}
+
+
+def build_backend(name: str) -> Optional[GeocoderBackend]:
+    """Создать бэкенд по имени из GEOCODER_BACKENDS."""
+    if name == "local":
+        return LocalBackend()
+    if name == "nominatim":
+        return NominatimBackend(settings.nominatim_url)
+    if name == "photon":
+        if not settings.photon_url:
+            logger.warning("Бэкенд photon указан, но PHOTON_URL не задан — пропускаем")
+            return None
+        return PhotonBackend(settings.photon_url)
+    raise ValueError(f"Неизвестный бэкенд геокодирования: {name}")
+
+
+_chain: Optional[GeocoderChain] = None
+
+
+def get_geocoder_chain() -> GeocoderChain:
+    """Цепочка геокодеров процесса (собирается из настроек при первом обращении)."""
+    global _chain
+    if _chain is None:
+        names = [name.strip() for name in settings.geocoder_backends.split(",") if name.strip()]
+        backends = [backend for backend in map(build_backend, names) if backend is not None]
+        _chain = GeocoderChain(backends, hedge=settings.geocoder_hedge)
+    return _chain
+
+
+async def close_geocoders() -> None:
+    """Закрыть общую HTTP-сессию геокодеров (вызывается при остановке бота)."""
+    global _http_session
+    if _http_session is not None:
+        await _http_session.close()
+        _http_session = None
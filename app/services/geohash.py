@@ -0,0 +1,127 @@
+"""
+Geohash — кодирование координат строкой base32.
+
+Каждый символ уточняет ячейку в 32 раза; соседние точки имеют общий префикс.
+Примерные размеры ячейки (широта × долгота) на широте Новосибирска (55°):
+
+    точность   ячейка
+    5          ~4.9 × 2.8 км
+    6          ~610 × 700 м
+    7          ~153 × 88 м
+    8          ~19 × 22 м
+
+Диапазоны ячеек (cover) используются для поиска по индексу в БД: все точки
+ячейки "vcfcn" — это строки от "vcfcn" до "vcfcp" (не включая).
+"""
+import math
+from typing import Optional, Tuple
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_DECODE = {char: index for index, char in enumerate(BASE32)}
+
+
+def encode(latitude: float, longitude: float, precision: int = 7) -> str:
+    """Geohash точки заданной длины."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits, bit_count, even = 0, 0, True
+
+    while len(chars) < precision:
+        value, interval = (longitude, lon_range) if even else (latitude, lat_range)
+        middle = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits, bit_count = 0, 0
+    return "".join(chars)
+
+
+def decode_bounds(geohash: str) -> Tuple[float, float, float, float]:
+    """Границы ячейки: (мин. широта, мин. долгота, макс. широта, макс. долгота)."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+
+    for char in geohash:
+        index = _DECODE[char]
+        for shift in range(4, -1, -1):
+            interval = lon_range if even else lat_range
+            middle = (interval[0] + interval[1]) / 2
+            if index >> shift & 1:
+                interval[0] = middle
+            else:
+                interval[1] = middle
+            even = not even
+    return lat_range[0], lon_range[0], lat_range[1], lon_range[1]
+
+
+def decode(geohash: str) -> Tuple[float, float]:
+    """Центр ячейки (широта, долгота)."""
+    min_lat, min_lon, max_lat, max_lon = decode_bounds(geohash)
+    return (min_lat + max_lat) / 2, (min_lon + max_lon) / 2
+
+
+def cell_size(latitude: float, precision: int) -> Tuple[float, float]:
+    """Размер ячейки в градусах: (по широте, по долготе)."""
+    lat_bits = 5 * precision // 2
+    lon_bits = 5 * precision - lat_bits
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def precision_for_radius(latitude: float, radius_km: float, max_precision: int = 9) -> int:
+    """Наибольшая точность, при которой ячейка не меньше радиуса (3×3 ячейки покрывают круг)."""
+    km_per_degree = 111.32
+    for precision in range(max_precision, 0, -1):
+        lat_span, lon_span = cell_size(latitude, precision)
+        height = lat_span * km_per_degree
+        width = lon_span * km_per_degree * math.cos(math.radians(latitude))
+        if min(height, width) >= radius_km:
+            return precision
+    return 1
+
+
+def _increment(geohash: str) -> Optional[str]:
+    """Следующая по порядку ячейка того же родителя ("bz" -> "c"); None — после неё ничего нет."""
+    chars = list(geohash)
+    for index in range(len(chars) - 1, -1, -1):
+        position = _DECODE[chars[index]]
+        if position < len(BASE32) - 1:
+            return "".join(chars[:index]) + BASE32[position + 1]
+    return None
+
+
+def cover(latitude: float, longitude: float, radius_km: float, max_precision: int = 9) -> list[Tuple[str, Optional[str]]]:
+    """
+    Диапазоны geohash, покрывающие круг радиуса radius_km вокруг точки.
+
+    Берётся ячейка точки и 8 соседних подходящей точности; соседние по
+    порядку ячейки склеиваются. Строка g попадает в диапазон (low, high),
+    если low <= g < high (high=None — без верхней границы).
+    """
+    precision = precision_for_radius(latitude, radius_km, max_precision)
+    lat_span, lon_span = cell_size(latitude, precision)
+
+    cells = set()
+    for d_lat in (-lat_span, 0.0, lat_span):
+        for d_lon in (-lon_span, 0.0, lon_span):
+            lat = min(max(latitude + d_lat, -90.0), 90.0)
+            lon = (longitude + d_lon + 180.0) % 360.0 - 180.0
+            cells.add(encode(lat, lon, precision))
+
+    ranges: list[list] = []
+    for cell in sorted(cells):
+        if ranges and ranges[-1][1] is not None and cell.startswith(ranges[-1][1]) \
+                and set(cell[len(ranges[-1][1]):]) <= {"0"}:
+            ranges[-1][1] = _increment(cell)
+        else:
+            ranges.append([cell, _increment(cell)])
+    return [(low, high) for low, high in ranges]
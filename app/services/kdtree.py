@@ -0,0 +1,118 @@
+"""Статическое k-d дерево для поиска ближайшей точки (обратное геокодирование)."""
+import math
+from typing import Optional, Tuple
+
+import numpy as np
+
+from app.services.distance import EARTH_RADIUS_KM
+
+
+def to_unit_vectors(latitudes, longitudes) -> np.ndarray:
+    """
+    Широта/долгота (градусы) -> точки на единичной сфере (N, 3).
+
+    Евклидово расстояние (хорда) между такими точками монотонно связано с
+    расстоянием по поверхности Земли, поэтому ближайшая по хорде точка —
+    ближайшая и на местности, без искажений проекции.
+    """
+    lat = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lon = np.radians(np.asarray(longitudes, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)))
+
+
+def chord_to_km(chord: float) -> float:
+    """Длина хорды единичной сферы -> расстояние по поверхности Земли (км)."""
+    return 2 * EARTH_RADIUS_KM * math.asin(min(chord / 2, 1.0))
+
+
+class KDTree:
+    """
+    k-d дерево над массивом точек (N, k), строится один раз.
+
+    Узлы хранятся в плоских списках; лист содержит до leaf_size точек,
+    расстояния до которых считаются одним векторным вызовом NumPy.
+    """
+
+    def __init__(self, points: np.ndarray, leaf_size: int = 32):
+        """
+        Args:
+            points: Массив точек (N, k)
+            leaf_size: Максимальное число точек в листе
+        """
+        points = np.asarray(points, dtype=np.float64)
+        self.order = np.arange(len(points))
+        self._axis: list[int] = []  # -1 — лист
+        self._split: list[float] = []
+        self._children: list[Tuple[int, int]] = []  # Для листа — диапазон точек
+
+        if len(points):
+            stack = [(self._new_node(), 0, len(points))]
+            while stack:
+                node, low, high = stack.pop()
+                if high - low <= leaf_size:
+                    self._children[node] = (low, high)
+                    continue
+
+                chunk = points[self.order[low:high]]
+                axis = int(np.argmax(np.ptp(chunk, axis=0)))
+                middle = (high - low) // 2
+                partition = np.argpartition(chunk[:, axis], middle)
+                self.order[low:high] = self.order[low:high][partition]
+
+                left, right = self._new_node(), self._new_node()
+                self._axis[node] = axis
+                self._split[node] = float(points[self.order[low + middle], axis])
+                self._children[node] = (left, right)
+                stack.append((left, low, low + middle))
+                stack.append((right, low + middle, high))
+
+        # Точки в порядке листьев — лист читается непрерывным срезом
+        self._points = points[self.order]
+
+    def _new_node(self) -> int:
+        self._axis.append(-1)
+        self._split.append(0.0)
+        self._children.append((0, 0))
+        return len(self._axis) - 1
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def nearest(self, point) -> Optional[Tuple[int, float]]:
+        """
+        Ближайшая точка.
+
+        Returns:
+            (индекс в исходном массиве, евклидово расстояние) или None для пустого дерева
+        """
+        if not len(self._points):
+            return None
+
+        query = np.asarray(point, dtype=np.float64)
+        coords = query.tolist()
+        best_index, best_d2 = -1, math.inf
+        stack = [(0, 0.0)]
+
+        while stack:
+            node, bound = stack.pop()
+            if bound >= best_d2:
+                continue
+
+            axis = self._axis[node]
+            if axis < 0:
+                low, high = self._children[node]
+                d2 = ((self._points[low:high] - query) ** 2).sum(axis=1)
+                index = int(np.argmin(d2))
+                if d2[index] < best_d2:
+                    best_index, best_d2 = low + index, float(d2[index])
+                continue
+
+            diff = coords[axis] - self._split[node]
+            left, right = self._children[node]
+            near, far = (left, right) if diff < 0 else (right, left)
+            # Дальнее поддерево — позже и только если оно может быть ближе найденного
+            stack.append((far, diff * diff))
+            stack.append((near, bound))
+
+        return int(self.order[best_index]), math.sqrt(best_d2)
@@ -1,10 +1,65 @@
 """Сервис для работы с заказами в БД."""
-from typing import Optional
+import logging
+from typing import Callable, Optional
 from datetime import datetime
-from sqlalchemy import select
+
+import numpy as np
+from sqlalchemy import Float, Integer, Select, and_, column, delete, func, insert, or_, select, text, tuple_, update, values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db.models import Order, OrderStatus
+from app.config import settings
+from app.db.models import Order, OrderCounter, OrderStatus
+from app.services import geohash
+from app.services.distance import EARTH_RADIUS_KM
+from app.services.pricing import TariffEngine, get_tariff_engine
+
+logger = logging.getLogger(__name__)
+
+# Точность geohash, хранимого в заказе (~5 м)
+GEOHASH_PRECISION = 9
+
+# Статусы, в которых цена заказа ещё может меняться
+OPEN_STATUSES = (OrderStatus.PENDING, OrderStatus.CONFIRMED)
+
+# Курсор keyset-пагинации: (created_at, id) последнего показанного заказа.
+# Списки идут от новых к старым; следующая страница — заказы «меньше» курсора,
+# поэтому страница N стоит столько же, сколько первая (в отличие от OFFSET).
+OrderCursor = tuple[datetime, int]
+
+
+def order_cursor(order: Order) -> OrderCursor:
+    """Курсор, указывающий на заказ."""
+    return order.created_at, order.id
+
+
+# Поля, которые можно менять через update_order
+ORDER_FIELDS = frozenset(attr.key for attr in Order.__mapper__.column_attrs) - {"id", "created_at", "updated_at"}
+
+
+def point_or_none(latitude: Optional[float], longitude: Optional[float]) -> Optional[tuple[float, float]]:
+    """Координаты точки заказа или None, если их нет."""
+    if latitude is None or longitude is None:
+        return None
+    return latitude, longitude
+
+
+def point_geohash(latitude: Optional[float], longitude: Optional[float]) -> Optional[str]:
+    """Geohash точки заказа или None, если координат нет."""
+    if latitude is None or longitude is None:
+        return None
+    return geohash.encode(latitude, longitude, GEOHASH_PRECISION)
+
+
+def haversine_sql(latitude_column, longitude_column, latitude: float, longitude: float):
+    """SQL-выражение: расстояние (км) от точки до координат в колонках."""
+    d_lat = func.radians(latitude_column - latitude, type_=Float) / 2
+    d_lon = func.radians(longitude_column - longitude, type_=Float) / 2
+    a = (
+        func.power(func.sin(d_lat), 2)
+        + func.cos(func.radians(latitude)) * func.cos(func.radians(latitude_column)) * func.power(func.sin(d_lon), 2)
+    )
+    return 2 * EARTH_RADIUS_KM * func.asin(func.sqrt(func.least(a, 1.0)))
 
 
 class OrderDBService:
@@ -30,27 +85,92 @@ class OrderDBService:
         status: OrderStatus = OrderStatus.DRAFT,
         comment: Optional[str] = None
     ) -> Order:
-        """Создать новый заказ."""
-        order = Order(
+        """Создать новый заказ (один INSERT ... RETURNING)."""
+        stmt = insert(Order).values(
             user_id=user_id,
             load_date=load_date,
             load_address=load_address,
             load_latitude=load_latitude,
             load_longitude=load_longitude,
+            load_geohash=point_geohash(load_latitude, load_longitude),
             unload_address=unload_address,
             unload_latitude=unload_latitude,
             unload_longitude=unload_longitude,
+            unload_geohash=point_geohash(unload_latitude, unload_longitude),
             weight_kg=weight_kg,
             distance_km=distance_km,
             price_rub=price_rub,
             status=status,
             comment=comment
+        ).returning(Order)
+        order = (await self.session.execute(stmt)).scalar_one()
+        await self._move_counters(None, (order.user_id, order.status))
+        await self.session.commit()
+        return order
+
+    async def _update_returning(self, order_id: int, **values) -> Optional[Order]:
+        """UPDATE заказа с RETURNING: изменённая строка без повторного чтения."""
+        stmt = (
+            update(Order)
+            .where(Order.id == order_id)
+            .values(**values)
+            .execution_options(populate_existing=True)
         )
-        self.session.add(order)
+        if "status" not in values and "user_id" not in values:
+            order = (await self.session.execute(stmt.returning(Order))).scalar_one_or_none()
+            await self.session.commit()
+            return order
+        
+        # Меняются счётчики: прежние статус и владельца возвращает тот же UPDATE.
+        # FOR UPDATE — чтобы прочитать их у последней версии строки, а не из снимка
+        old = (
+            select(Order.id, Order.user_id.label("old_user_id"), Order.status.label("old_status"))
+            .where(Order.id == order_id)
+            .with_for_update()
+            .subquery()
+        )
+        stmt = stmt.where(Order.id == old.c.id).returning(Order, old.c.old_user_id, old.c.old_status)
+        row = (await self.session.execute(stmt)).one_or_none()
+        if row is None:
+            await self.session.rollback()
+            return None
+        order, old_user_id, old_status = row
+        await self._move_counters((old_user_id, old_status), (order.user_id, order.status))
         await self.session.commit()
-        await self.session.refresh(order)
         return order
 
+    async def _move_counters(
+        self,
+        old: Optional[tuple[int, OrderStatus]],
+        new: Optional[tuple[int, OrderStatus]]
+    ) -> None:
+        """
+        Перенести заказ между счётчиками (в транзакции изменения заказа, до commit).
+        
+        old и new — (владелец, статус) заказа до и после изменения; old=None —
+        заказ создан, new=None — удалён. Все изменения счётчиков (владельцев
+        и общего) пишутся одним запросом в порядке ключа, чтобы параллельные
+        транзакции не блокировали строки крест-накрест.
+        """
+        deltas: dict[tuple[int, OrderStatus], int] = {}
+        for key, delta in ((old, -1), (new, 1)):
+            if key is not None:
+                user_id, status = key
+                for counter in ((user_id, status), (OrderCounter.ALL_USERS, status)):
+                    deltas[counter] = deltas.get(counter, 0) + delta
+        rows = [
+            {"user_id": user_id, "status": status, "count": delta}
+            for (user_id, status), delta in sorted(deltas.items(), key=lambda item: (item[0][0], item[0][1].name))
+            if delta
+        ]
+        if not rows:
+            return
+        stmt = pg_insert(OrderCounter).values(rows)
+        await self.session.execute(stmt.on_conflict_do_update(
+            index_elements=[OrderCounter.user_id, OrderCounter.status],
+            set_={"count": OrderCounter.count + stmt.excluded.count}
+        ))
+
     async def get_order_by_id(
         self,
         order_id: int
@@ -60,22 +180,69 @@ class OrderDBService:
         result = await self.session.execute(stmt)
         return result.scalar_one_or_none()
 
+    async def _newest_first(
+        self,
+        stmt: Select,
+        limit: int,
+        offset: int = 0,
+        after: Optional[OrderCursor] = None,
+        before: Optional[OrderCursor] = None
+    ) -> list[Order]:
+        """
+        Заказы от новых к старым с keyset-пагинацией.
+        
+        after — заказы старше курсора (следующая страница), before — новее
+        курсора (предыдущая страница, ближайшие к курсору). OFFSET оставлен
+        для совместимости; с курсором его лучше не использовать.
+        """
+        key = tuple_(Order.created_at, Order.id)
+        if before is not None:
+            # Ближайшие более новые: по возрастанию от курсора, затем разворот
+            stmt = stmt.where(key > tuple_(*before)).order_by(Order.created_at, Order.id)
+        else:
+            if after is not None:
+                stmt = stmt.where(key < tuple_(*after))
+            stmt = stmt.order_by(Order.created_at.desc(), Order.id.desc())
+        result = await self.session.execute(stmt.limit(limit).offset(offset))
+        orders = list(result.scalars().all())
+        if before is not None:
+            orders.reverse()
+        return orders
+
     async def get_user_orders(
         self,
         user_id: int,
         limit: int = 50,
-        offset: int = 0
+        offset: int = 0,
+        after: Optional[OrderCursor] = None,
+        before: Optional[OrderCursor] = None
     ) -> list[Order]:
-        """Получить все заказы пользователя."""
-        stmt = (
-            select(Order)
-            .where(Order.user_id == user_id)
-            .order_by(Order.created_at.desc())
-            .limit(limit)
-            .offset(offset)
-        )
-        result = await self.session.execute(stmt)
-        return list(result.scalars().all())
+        """Получить заказы пользователя (от новых к старым, курсор — см. _newest_first)."""
+        stmt = select(Order).where(Order.user_id == user_id)
+        return await self._newest_first(stmt, limit, offset, after, before)
+
+    async def get_user_orders_page(
+        self,
+        user_id: int,
+        limit: int = 5,
+        after: Optional[OrderCursor] = None,
+        before: Optional[OrderCursor] = None
+    ) -> tuple[list[Order], bool, bool]:
+        """
+        Страница заказов пользователя для листания.
+        
+        Читается на один заказ больше страницы — так видно, есть ли заказы
+        дальше в направлении листания, без COUNT.
+        
+        Returns:
+            tuple[list[Order], bool, bool]: (заказы, есть_новее, есть_старше)
+        """
+        orders = await self.get_user_orders(user_id, limit=limit + 1, after=after, before=before)
+        more = len(orders) > limit
+        if before is not None:
+            # Лишний — самый новый, он в начале списка
+            return orders[-limit:] if more else orders, more, True
+        return orders[:limit], after is not None, more
 
     async def get_user_orders_by_status(
         self,
@@ -97,18 +264,13 @@ class OrderDBService:
         self,
         status: OrderStatus,
         limit: int = 100,
-        offset: int = 0
+        offset: int = 0,
+        after: Optional[OrderCursor] = None,
+        before: Optional[OrderCursor] = None
     ) -> list[Order]:
-        """Получить все заказы по статусу."""
-        stmt = (
-            select(Order)
-            .where(Order.status == status)
-            .order_by(Order.created_at.desc())
-            .limit(limit)
-            .offset(offset)
-        )
-        result = await self.session.execute(stmt)
-        return list(result.scalars().all())
+        """Получить заказы по статусу (от новых к старым)."""
+        stmt = select(Order).where(Order.status == status)
+        return await self._newest_first(stmt, limit, offset, after, before)
 
     async def update_order(
         self,
@@ -122,19 +284,28 @@ class OrderDBService:
             order_id: ID заказа
             **kwargs: Поля для обновления (load_date, load_address, weight_kg, и т.д.)
         """
-        order = await self.get_order_by_id(order_id)
-        
-        if not order:
-            return None
-        
         # Обновляем только переданные поля
-        for key, value in kwargs.items():
-            if hasattr(order, key) and value is not None:
-                setattr(order, key, value)
+        values = {key: value for key, value in kwargs.items() if key in ORDER_FIELDS and value is not None}
         
-        await self.session.commit()
-        await self.session.refresh(order)
-        return order
+        # Geohash пересчитывается вместе с координатами
+        for prefix in ("load", "unload"):
+            latitude_key, longitude_key = f"{prefix}_latitude", f"{prefix}_longitude"
+            if latitude_key not in values and longitude_key not in values:
+                continue
+            if latitude_key in values and longitude_key in values:
+                latitude, longitude = values[latitude_key], values[longitude_key]
+            else:
+                # Передана одна координата — вторая берётся из заказа (редкий случай)
+                current = await self.get_order_by_id(order_id)
+                if not current:
+                    return None
+                latitude = values.get(latitude_key, getattr(current, latitude_key))
+                longitude = values.get(longitude_key, getattr(current, longitude_key))
+            values[f"{prefix}_geohash"] = point_geohash(latitude, longitude)
+        
+        if not values:
+            return await self.get_order_by_id(order_id)
+        return await self._update_returning(order_id, **values)
 
     async def update_order_status(
         self,
@@ -143,88 +314,296 @@ class OrderDBService:
         manager_comment: Optional[str] = None
     ) -> Optional[Order]:
         """Обновить статус заказа."""
-        order = await self.get_order_by_id(order_id)
+        values = {"status": status}
+        if manager_comment:
+            values["manager_comment"] = manager_comment
+        return await self._update_returning(order_id, **values)
+
+    async def find_orders_near(
+        self,
+        latitude: float,
+        longitude: float,
+        radius_km: float,
+        status: Optional[OrderStatus] = OrderStatus.PENDING,
+        point: str = "load",
+        limit: int = 100
+    ) -> list[tuple[Order, float]]:
+        """
+        Найти заказы, точка загрузки (или выгрузки) которых в радиусе от точки.
         
-        if not order:
-            return None
+        Сначала кандидаты отбираются по индексу geohash (диапазоны 3×3 ячеек
+        вокруг точки, см. geohash.cover), затем точно — по расстоянию haversine.
         
-        order.status = status
-        if manager_comment:
-            order.manager_comment = manager_comment
+        Args:
+            latitude: Широта точки (например, машины)
+            longitude: Долгота точки
+            radius_km: Радиус поиска (км)
+            status: Статус заказов (None — любой)
+            point: "load" — по точке загрузки, "unload" — по точке выгрузки
+            limit: Максимальное число заказов
+            
+        Returns:
+            Список (заказ, расстояние в км), ближайшие первыми
+        """
+        if point == "load":
+            hash_column, lat_column, lon_column = Order.load_geohash, Order.load_latitude, Order.load_longitude
+        elif point == "unload":
+            hash_column, lat_column, lon_column = Order.unload_geohash, Order.unload_latitude, Order.unload_longitude
+        else:
+            raise ValueError(f"Неизвестная точка заказа: {point}")
         
-        await self.session.commit()
-        await self.session.refresh(order)
-        return order
+        cells = [
+            and_(hash_column >= low, hash_column < high) if high is not None else hash_column >= low
+            for low, high in geohash.cover(latitude, longitude, radius_km, GEOHASH_PRECISION)
+        ]
+        distance = haversine_sql(lat_column, lon_column, latitude, longitude).label("distance_km")
+        
+        stmt = select(Order, distance).where(or_(*cells))
+        if status is not None:
+            stmt = stmt.where(Order.status == status)
+        stmt = stmt.where(distance <= radius_km).order_by(distance).limit(limit)
+        
+        result = await self.session.execute(stmt)
+        return [(order, distance_km) for order, distance_km in result.all()]
 
     async def calculate_and_update_price(
         self,
         order_id: int,
-        base_price: float,
-        price_per_km: float,
-        price_per_kg: float
+        base_price: Optional[float] = None,
+        price_per_km: Optional[float] = None,
+        price_per_kg: Optional[float] = None
     ) -> Optional[Order]:
         """
         Рассчитать и обновить стоимость заказа.
         
-        Формула: price = base_price + (distance_km * price_per_km) + (weight_kg * price_per_kg)
+        По умолчанию используется загруженный тариф (app/services/pricing.py)
+        с учётом зон и времени загрузки. Если переданы ставки — плоский тариф:
+        price = base_price + (distance_km * price_per_km) + (weight_kg * price_per_kg)
+        
+        Цена считается в Python, поэтому нужные для неё колонки читаются
+        (FOR UPDATE — чтобы их не изменили до записи цены), а цена
+        записывается UPDATE ... RETURNING без повторного чтения заказа.
         """
-        order = await self.get_order_by_id(order_id)
+        stmt = (
+            select(
+                Order.distance_km, Order.weight_kg, Order.load_date,
+                Order.load_latitude, Order.load_longitude,
+                Order.unload_latitude, Order.unload_longitude
+            )
+            .where(Order.id == order_id)
+            .with_for_update()
+        )
+        order = (await self.session.execute(stmt)).one_or_none()
         
         if not order:
+            await self.session.rollback()
             return None
         
-        # Расчёт стоимости
-        distance_cost = (order.distance_km or 0) * price_per_km
-        weight_cost = (order.weight_kg or 0) * price_per_kg
-        total_price = base_price + distance_cost + weight_cost
+        if base_price is None and price_per_km is None and price_per_kg is None:
+            engine = get_tariff_engine()
+        else:
+            engine = TariffEngine.flat(
+                base_price if base_price is not None else settings.base_price,
+                price_per_km if price_per_km is not None else settings.price_per_km,
+                price_per_kg if price_per_kg is not None else settings.price_per_kg
+            )
         
-        order.price_rub = round(total_price, 2)
+        price = engine.price(
+            order.distance_km or 0,
+            order.weight_kg or 0,
+            load_point=point_or_none(order.load_latitude, order.load_longitude),
+            unload_point=point_or_none(order.unload_latitude, order.unload_longitude),
+            load_time=order.load_date
+        )
+        return await self._update_returning(order_id, price_rub=price)
+
+    async def reprice_orders(
+        self,
+        engine: Optional[TariffEngine] = None,
+        statuses: tuple[OrderStatus, ...] = OPEN_STATUSES,
+        chunk_size: int = 5000,
+        dry_run: bool = False,
+        progress: Optional[Callable[[int, int], None]] = None
+    ) -> dict:
+        """
+        Пересчитать цены открытых заказов по тарифу.
         
-        await self.session.commit()
-        await self.session.refresh(order)
-        return order
+        Заказы читаются пачками по id (только нужные колонки), цены считаются
+        векторно (TariffEngine.price_batch), изменившиеся записываются одним
+        UPDATE ... FROM (VALUES ...) на пачку; каждая пачка — своя транзакция.
+        
+        Args:
+            engine: Тариф (по умолчанию загруженный)
+            statuses: Статусы пересчитываемых заказов
+            chunk_size: Размер пачки
+            dry_run: Только посчитать разницу, ничего не записывать
+            progress: Вызывается после каждой пачки: (обработано, изменено)
+            
+        Returns:
+            {"processed", "changed", "delta", "changes": [(id, старая, новая), ...]}
+        """
+        engine = engine or get_tariff_engine()
+        report = {"processed": 0, "changed": 0, "delta": 0.0, "changes": []}
+        last_id = 0
+        
+        while True:
+            stmt = (
+                select(
+                    Order.id, Order.price_rub, Order.distance_km, Order.weight_kg,
+                    Order.load_latitude, Order.load_longitude,
+                    Order.unload_latitude, Order.unload_longitude, Order.load_date
+                )
+                .where(Order.status.in_(statuses), Order.id > last_id)
+                .order_by(Order.id)
+                .limit(chunk_size)
+            )
+            rows = (await self.session.execute(stmt)).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            
+            columns = np.array(
+                [(row.distance_km, row.weight_kg, row.load_latitude, row.load_longitude,
+                  row.unload_latitude, row.unload_longitude) for row in rows],
+                dtype=np.float64  # None -> NaN
+            )
+            new_prices = engine.price_batch(
+                columns[:, 0],
+                columns[:, 1],
+                load_points=columns[:, 2:4],
+                unload_points=columns[:, 4:6],
+                load_times=[row.load_date for row in rows]
+            )
+            
+            changes = [
+                (row.id, row.price_rub, float(price))
+                for row, price in zip(rows, new_prices)
+                if row.price_rub is None or abs(row.price_rub - price) >= 0.01
+            ]
+            
+            if changes and not dry_run:
+                new_values = values(
+                    column("id", Integer), column("price_rub", Float), name="new_prices"
+                ).data([(order_id, price) for order_id, _, price in changes])
+                await self.session.execute(
+                    update(Order)
+                    .where(Order.id == new_values.c.id, Order.status.in_(statuses))
+                    .values(price_rub=new_values.c.price_rub)
+                    .execution_options(synchronize_session=False)
+                )
+                await self.session.commit()
+            
+            report["processed"] += len(rows)
+            report["changed"] += len(changes)
+            report["delta"] += sum(new - (old or 0) for _, old, new in changes)
+            report["changes"].extend(changes)
+            if progress:
+                progress(report["processed"], report["changed"])
+        
+        if dry_run:
+            await self.session.rollback()
+        report["delta"] = round(report["delta"], 2)
+        logger.info(
+            f"Пересчёт цен{' (пробный)' if dry_run else ''}: "
+            f"{report['processed']} заказов, изменено {report['changed']}, разница {report['delta']} ₽"
+        )
+        return report
 
     async def delete_order(
         self,
         order_id: int
     ) -> bool:
-        """Удалить заказ."""
-        order = await self.get_order_by_id(order_id)
-        
-        if not order:
+        """Удалить заказ (DELETE ... RETURNING и обновление счётчиков)."""
+        stmt = delete(Order).where(Order.id == order_id).returning(Order.user_id, Order.status)
+        deleted = (await self.session.execute(stmt)).one_or_none()
+        if deleted is None:
+            await self.session.rollback()
             return False
-        
-        await self.session.delete(order)
+        await self._move_counters((deleted.user_id, deleted.status), None)
         await self.session.commit()
         return True
 
     async def get_all_orders(
         self,
         limit: int = 100,
-        offset: int = 0
+        offset: int = 0,
+        after: Optional[OrderCursor] = None,
+        before: Optional[OrderCursor] = None
     ) -> list[Order]:
-        """Получить список всех заказов."""
-        stmt = select(Order).limit(limit).offset(offset).order_by(Order.created_at.desc())
-        result = await self.session.execute(stmt)
-        return list(result.scalars().all())
+        """Получить список всех заказов (от новых к старым)."""
+        return await self._newest_first(select(Order), limit, offset, after, before)
 
     async def count_orders(
         self,
         user_id: Optional[int] = None,
         status: Optional[OrderStatus] = None
     ) -> int:
-        """Получить количество заказов с фильтрами."""
-        from sqlalchemy import func
-        
-        stmt = select(func.count(Order.id))
+        """
+        Получить количество заказов с фильтрами.
         
-        if user_id:
-            stmt = stmt.where(Order.user_id == user_id)
+        Читает таблицу счётчиков order_counters (не больше шести строк по
+        первичному ключу) вместо COUNT(*) по orders. Счётчики обновляются
+        в транзакции каждого создания, смены статуса и удаления заказа через
+        сервис; после правок orders в обход сервиса — rebuild_counters.
+        """
+        stmt = select(func.coalesce(func.sum(OrderCounter.count), 0)).where(
+            OrderCounter.user_id == (user_id or OrderCounter.ALL_USERS)
+        )
         if status:
-            stmt = stmt.where(Order.status == status)
+            stmt = stmt.where(OrderCounter.status == status)
         
         result = await self.session.execute(stmt)
-        return result.scalar_one()
+        return int(result.scalar_one())
+
+    async def rebuild_counters(self, dry_run: bool = False) -> dict:
+        """
+        Пересчитать order_counters по таблице orders.
+        
+        На время пересчёта запись в orders блокируется (LOCK ... SHARE MODE):
+        счётчики получаются точными на момент commit. Чтение заказов не
+        блокируется.
+        
+        Returns:
+            {"rows": строк счётчиков, "drift": [(user_id, статус, было, стало), ...]}
+        """
+        await self.session.execute(text("LOCK TABLE orders IN SHARE MODE"))
+        
+        actual: dict[tuple[int, OrderStatus], int] = {}
+        by_user = select(Order.user_id, Order.status, func.count()).group_by(Order.user_id, Order.status)
+        for user_id, status, count in await self.session.execute(by_user):
+            actual[(user_id, status)] = count
+            key = (OrderCounter.ALL_USERS, status)
+            actual[key] = actual.get(key, 0) + count
+        
+        stored = {
+            (row.user_id, row.status): row.count
+            for row in await self.session.execute(select(OrderCounter.user_id, OrderCounter.status, OrderCounter.count))
+        }
+        drift = sorted(
+            (
+                (user_id, status, stored.get((user_id, status), 0), actual.get((user_id, status), 0))
+                for user_id, status in stored.keys() | actual.keys()
+                if stored.get((user_id, status), 0) != actual.get((user_id, status), 0)
+            ),
+            key=lambda item: (item[0], item[1].name)
+        )
+        
+        if dry_run:
+            await self.session.rollback()
+        else:
+            await self.session.execute(delete(OrderCounter))
+            if actual:
+                await self.session.execute(insert(OrderCounter).values([
+                    {"user_id": user_id, "status": status, "count": count}
+                    for (user_id, status), count in actual.items()
+                ]))
+            await self.session.commit()
+        
+        logger.info(
+            f"Пересчёт счётчиков заказов{' (пробный)' if dry_run else ''}: "
+            f"{len(actual)} строк, расхождений {len(drift)}"
+        )
+        return {"rows": len(actual), "drift": drift}
 
     async def get_user_draft_order(
         self,
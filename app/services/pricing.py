@@ -0,0 +1,275 @@
+"""
+Тарификация перевозок.
+
+Описание тарифа (JSON, см. tariffs.example.json) один раз при загрузке
+компилируется в таблицы, по которым цена считается без повторного разбора
+настроек:
+
+- ставки за км по диапазонам расстояния и за кг по диапазонам веса —
+  прогрессивные (каждый диапазон тарифицируется своей ставкой): границы
+  диапазонов и накопленная стоимость на границе, поиск диапазона — bisect,
+  O(log n);
+- зоны (город, район) — сетка по координатам с индексом зоны в ячейке,
+  поиск — O(1);
+- ночь и выходные — таблица множителей 7 × 24 (день недели × час), O(1).
+
+Формула:
+
+    цена = (база + стоимость_км + стоимость_кг) × множитель_зоны × множитель_времени
+           + надбавки зон точек загрузки и выгрузки
+
+Множитель зоны — наибольший из зон загрузки и выгрузки. Без файла тарифа
+используется плоский тариф из настроек BASE_PRICE, PRICE_PER_KM, PRICE_PER_KG.
+"""
+import json
+import logging
+from bisect import bisect_right
+from datetime import datetime
+from typing import Optional, Sequence, Tuple
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def round_price(value: float) -> float:
+    """Цена заказа округляется до целого рубля (половина — к чётному, как np.round)."""
+    return float(round(float(value)))
+
+
+class RateTable:
+    """Прогрессивная ставка по диапазонам: [(начало диапазона, ставка за единицу), ...]."""
+
+    def __init__(self, bands: Sequence[Sequence[float]]):
+        bands = sorted((float(start), float(rate)) for start, rate in bands)
+        if not bands or bands[0][0] != 0:
+            raise ValueError("Первый диапазон тарифа должен начинаться с 0")
+
+        self.starts = [start for start, _ in bands]
+        self.rates = [rate for _, rate in bands]
+        # Стоимость всех предыдущих диапазонов на начале каждого диапазона
+        self.accumulated = [0.0]
+        for index in range(1, len(bands)):
+            width = self.starts[index] - self.starts[index - 1]
+            self.accumulated.append(self.accumulated[-1] + width * self.rates[index - 1])
+
+        self._starts = np.array(self.starts)
+        self._rates = np.array(self.rates)
+        self._accumulated = np.array(self.accumulated)
+
+    def cost(self, value: float) -> float:
+        """Стоимость величины value (км или кг)."""
+        value = max(value, 0.0)
+        index = bisect_right(self.starts, value) - 1
+        return self.accumulated[index] + (value - self.starts[index]) * self.rates[index]
+
+    def cost_batch(self, values: np.ndarray) -> np.ndarray:
+        """Стоимость для массива величин."""
+        values = np.maximum(np.asarray(values, dtype=np.float64), 0.0)
+        index = np.searchsorted(self._starts, values, side="right") - 1
+        return self._accumulated[index] + (values - self._starts[index]) * self._rates[index]
+
+
+class ZoneGrid:
+    """Зоны-прямоугольники, растеризованные в сетку с индексом зоны в ячейке."""
+
+    def __init__(self, zones: list[dict], step: float = 0.01):
+        """
+        Args:
+            zones: [{"name", "bbox": [мин. широта, мин. долгота, макс. широта, макс. долгота],
+                     "multiplier", "surcharge"}, ...]; при пересечении побеждает зона выше в списке
+            step: Шаг сетки в градусах (0.01° ≈ 1.1 км по широте)
+        """
+        self.names = [zone["name"] for zone in zones]
+        self.multipliers = np.array([float(zone.get("multiplier", 1.0)) for zone in zones] + [1.0])
+        self.surcharges = np.array([float(zone.get("surcharge", 0.0)) for zone in zones] + [0.0])
+        self.step = step
+        # Индекс «вне зон» — последний элемент массивов множителей и надбавок
+        self.outside = len(zones)
+
+        if not zones:
+            self.origin = (0.0, 0.0)
+            self.cells = np.full((1, 1), self.outside, dtype=np.int16)
+            return
+
+        boxes = np.array([zone["bbox"] for zone in zones], dtype=np.float64)
+        self.origin = (boxes[:, 0].min(), boxes[:, 1].min())
+        rows, cols = self._cell(boxes[:, 2].max(), boxes[:, 3].max())
+        self.cells = np.full((rows + 1, cols + 1), self.outside, dtype=np.int16)
+
+        # Рисуем с конца списка, чтобы зоны выше перекрывали нижние
+        for index in range(len(zones) - 1, -1, -1):
+            min_lat, min_lon, max_lat, max_lon = boxes[index]
+            row0, col0 = self._cell(min_lat, min_lon)
+            row1, col1 = self._cell(max_lat, max_lon)
+            self.cells[row0:row1 + 1, col0:col1 + 1] = index
+
+    def _cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return (
+            int((latitude - self.origin[0]) // self.step),
+            int((longitude - self.origin[1]) // self.step),
+        )
+
+    def zone(self, point: Optional[Tuple[float, float]]) -> int:
+        """Индекс зоны точки (self.outside — вне зон)."""
+        if point is None:
+            return self.outside
+        row, col = self._cell(*point)
+        if 0 <= row < self.cells.shape[0] and 0 <= col < self.cells.shape[1]:
+            return int(self.cells[row, col])
+        return self.outside
+
+    def zone_batch(self, points: Optional[np.ndarray], count: int) -> np.ndarray:
+        """Индексы зон для массива точек (N, 2); NaN или None — вне зон."""
+        if points is None:
+            return np.full(count, self.outside)
+        points = np.asarray(points, dtype=np.float64)
+        with np.errstate(invalid="ignore"):
+            rows = np.floor((points[:, 0] - self.origin[0]) / self.step)
+            cols = np.floor((points[:, 1] - self.origin[1]) / self.step)
+        inside = (rows >= 0) & (rows < self.cells.shape[0]) & (cols >= 0) & (cols < self.cells.shape[1])
+        zones = np.full(len(points), self.outside)
+        zones[inside] = self.cells[rows[inside].astype(int), cols[inside].astype(int)]
+        return zones
+
+
+class TariffEngine:
+    """Скомпилированный тариф."""
+
+    def __init__(self, definition: dict):
+        """Скомпилировать описание тарифа (формат — tariffs.example.json)."""
+        self.name = definition.get("name", "default")
+        self.base_price = float(definition["base_price"])
+        self.distance = RateTable(definition["distance_bands"])
+        self.weight = RateTable(definition["weight_brackets"])
+        self.zones = ZoneGrid(definition.get("zones", []), definition.get("zone_grid_step", 0.01))
+        self.timezone = ZoneInfo(definition.get("timezone", "Asia/Novosibirsk"))
+
+        # Множители по дню недели (0 — понедельник) и часу загрузки
+        self.time_multipliers = np.ones((7, 24))
+        night = definition.get("night")
+        if night:
+            start, end = int(night["start_hour"]), int(night["end_hour"])
+            if start > end:  # Через полночь: 22 -> 6
+                hours = list(range(start, 24)) + list(range(0, end))
+            else:
+                hours = list(range(start, end))
+            self.time_multipliers[:, hours] *= float(night["multiplier"])
+        weekend = definition.get("weekend")
+        if weekend:
+            self.time_multipliers[weekend.get("days", [5, 6]), :] *= float(weekend["multiplier"])
+
+    @classmethod
+    def flat(cls, base_price: float, price_per_km: float, price_per_kg: float) -> "TariffEngine":
+        """Плоский тариф: база + км × ставка + кг × ставка."""
+        return cls({
+            "name": "flat",
+            "base_price": base_price,
+            "distance_bands": [[0, price_per_km]],
+            "weight_brackets": [[0, price_per_kg]],
+        })
+
+    def local_time(self, load_time: datetime) -> datetime:
+        """
+        Время загрузки с часовым поясом тарифа.
+
+        Время без пояса (ввод пользователя) считается местным временем тарифа.
+        В заказ сохраняется именно это значение: иначе timestamptz
+        интерпретирует его в поясе сервера, и пересчёт попадает в другой час.
+        """
+        if load_time.tzinfo is None:
+            return load_time.replace(tzinfo=self.timezone)
+        return load_time.astimezone(self.timezone)
+
+    def _time_multiplier(self, load_time: Optional[datetime]) -> float:
+        if load_time is None:
+            return 1.0
+        load_time = self.local_time(load_time)
+        return float(self.time_multipliers[load_time.weekday(), load_time.hour])
+
+    def price(
+        self,
+        distance_km: float,
+        weight_kg: float,
+        load_point: Optional[Tuple[float, float]] = None,
+        unload_point: Optional[Tuple[float, float]] = None,
+        load_time: Optional[datetime] = None
+    ) -> float:
+        """
+        Стоимость перевозки (руб, округлённая до целого рубля).
+
+        Args:
+            distance_km: Расстояние (км)
+            weight_kg: Вес груза (кг)
+            load_point: Координаты загрузки (для зон)
+            unload_point: Координаты выгрузки (для зон)
+            load_time: Дата и время загрузки (для ночного и выходного тарифа)
+        """
+        load_zone = self.zones.zone(load_point)
+        unload_zone = self.zones.zone(unload_point)
+        multiplier = max(self.zones.multipliers[load_zone], self.zones.multipliers[unload_zone])
+        multiplier *= self._time_multiplier(load_time)
+        surcharge = self.zones.surcharges[load_zone] + self.zones.surcharges[unload_zone]
+
+        total = (self.base_price + self.distance.cost(distance_km) + self.weight.cost(weight_kg)) * multiplier
+        return round_price(total + surcharge)
+
+    def price_batch(
+        self,
+        distance_km,
+        weight_kg,
+        load_points=None,
+        unload_points=None,
+        load_times: Optional[Sequence[Optional[datetime]]] = None
+    ) -> np.ndarray:
+        """
+        Стоимость для массивов заказов за один векторизованный проход
+        (округление — как в price).
+
+        Args:
+            distance_km: Расстояния (N,)
+            weight_kg: Веса (N,)
+            load_points: Координаты загрузки (N, 2) или None
+            unload_points: Координаты выгрузки (N, 2) или None
+            load_times: Время загрузки (N,) или None
+        """
+        distance_km = np.nan_to_num(np.asarray(distance_km, dtype=np.float64))
+        weight_kg = np.nan_to_num(np.asarray(weight_kg, dtype=np.float64))
+        count = len(distance_km)
+
+        load_zones = self.zones.zone_batch(load_points, count)
+        unload_zones = self.zones.zone_batch(unload_points, count)
+        multipliers = np.maximum(self.zones.multipliers[load_zones], self.zones.multipliers[unload_zones])
+        if load_times is not None:
+            multipliers = multipliers * np.array([self._time_multiplier(load_time) for load_time in load_times])
+        surcharges = self.zones.surcharges[load_zones] + self.zones.surcharges[unload_zones]
+
+        totals = (self.base_price + self.distance.cost_batch(distance_km) + self.weight.cost_batch(weight_kg)) * multipliers
+        return np.round(totals + surcharges)
+
+
+# Тариф процесса (загружается при старте бота, см. load_tariffs)
+_engine: Optional[TariffEngine] = None
+
+
+def load_tariffs(path: str = "") -> TariffEngine:
+    """Скомпилировать тариф из JSON-файла; без файла — плоский тариф из настроек."""
+    global _engine
+    if path:
+        with open(path, encoding="utf-8") as source:
+            _engine = TariffEngine(json.load(source))
+        logger.info(f"Тариф '{_engine.name}' загружен из {path}")
+    else:
+        _engine = TariffEngine.flat(settings.base_price, settings.price_per_km, settings.price_per_kg)
+        logger.info("Используется плоский тариф из настроек")
+    return _engine
+
+
+def get_tariff_engine() -> TariffEngine:
+    """Загруженный тариф (при первом обращении — из TARIFFS_PATH)."""
+    if _engine is None:
+        return load_tariffs(settings.tariffs_path)
+    return _engine
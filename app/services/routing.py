@@ -0,0 +1,490 @@
+"""
+Офлайн-маршрутизация по дорожному графу региона.
+
+Граф строится один раз из выгрузки OpenStreetMap (scripts/build_road_graph.py)
+и хранится в .npz-файле:
+
+    lat, lon            float32 * N       координаты перекрёстков
+    indptr              int32 * (N + 1)   CSR: исходящие рёбра узла v —
+    indices, weights    int32/float32 * E   indices[indptr[v]:indptr[v + 1]]
+    landmarks           int32 * K         узлы-ориентиры (ALT)
+
+Таблицы ориентиров — самая большая часть графа — лежат рядом в .npy-файлах
+и открываются через mmap, поэтому процессы-обработчики (WORKERS > 1) делят
+одну копию в кэше страниц ОС:
+
+    <граф>.from_landmark.npy   float32 * N * K   расстояния ориентир -> узел (м)
+    <граф>.to_landmark.npy     float32 * N * K   расстояния узел -> ориентир (м)
+
+Строка таблицы — все ориентиры одного узла, так что оценка для узла читается
+одним коротким участком памяти.
+
+Узлы графа — только перекрёстки и концы дорог: промежуточные точки линии
+сворачиваются в одно ребро с суммарной длиной. Вес ребра — длина в метрах,
+односторонние дороги учитываются.
+
+Кратчайший путь ищется A* с эвристикой ALT (A*, Landmarks, Triangle
+inequality): по неравенству треугольника d(v, t) >= d(L, t) - d(L, v) и
+d(v, t) >= d(v, L) - d(t, L) для любого ориентира L. Для запроса берутся
+несколько ориентиров с лучшей оценкой для пары (s, t), что сокращает
+просмотр графа в разы по сравнению с Дейкстрой. Оценка считается только для
+узлов, попавших в очередь поиска, — запрос не обходит весь граф.
+"""
+import heapq
+import logging
+import math
+import os
+import xml.etree.ElementTree as ET
+from array import array
+from operator import itemgetter
+from typing import Callable, Iterator, Optional, Tuple
+
+import numpy as np
+
+from app.services.distance import EARTH_RADIUS_KM
+from app.services.gazetteer import _open_osm
+from app.services.kdtree import KDTree, chord_to_km, to_unit_vectors
+
+logger = logging.getLogger(__name__)
+
+# Дороги, по которым может проехать грузовой автомобиль
+DRIVABLE_HIGHWAYS = {
+    "motorway", "motorway_link", "trunk", "trunk_link",
+    "primary", "primary_link", "secondary", "secondary_link",
+    "tertiary", "tertiary_link", "unclassified", "residential",
+    "living_street", "service", "road",
+}
+
+# Сколько ориентиров используется в одном запросе
+ACTIVE_LANDMARKS = 4
+
+
+def landmark_paths(path: str) -> Tuple[str, str]:
+    """Файлы таблиц ориентиров графа path: (from_landmark, to_landmark)."""
+    root = path[:-4] if path.endswith(".npz") else path
+    return f"{root}.from_landmark.npy", f"{root}.to_landmark.npy"
+
+
+class RoadGraph:
+    """Дорожный граф в CSR-массивах с поиском пути A* + ALT."""
+
+    def __init__(self, path: str, max_snap_km: float = 3.0):
+        """
+        Args:
+            path: Файл графа (.npz)
+            max_snap_km: Максимальное расстояние от точки до ближайшего узла графа
+        """
+        self.path = path
+        self.max_snap_km = max_snap_km
+        # Версия графа (для сброса кэшей расстояний после перестроения)
+        stat = os.stat(path)
+        self.version = f"{stat.st_size}-{int(stat.st_mtime)}"
+
+        with np.load(path) as data:
+            self.lat = data["lat"]
+            self.lon = data["lon"]
+            self.indptr = data["indptr"]
+            self.indices = data["indices"]
+            self.weights = data["weights"]
+            self.landmarks = data["landmarks"]
+            if "from_landmark" in data:
+                # Прежний формат: таблицы K * N внутри .npz, в памяти каждого процесса
+                logger.warning(f"Граф {path} прежнего формата: таблицы ориентиров не разделяются между процессами, пересоберите его")
+                self.from_landmark = np.ascontiguousarray(data["from_landmark"].T)
+                self.to_landmark = np.ascontiguousarray(data["to_landmark"].T)
+            else:
+                # view(np.ndarray): те же страницы mmap, но индексация без накладных расходов np.memmap
+                from_path, to_path = landmark_paths(path)
+                self.from_landmark = np.load(from_path, mmap_mode="r").view(np.ndarray)
+                self.to_landmark = np.load(to_path, mmap_mode="r").view(np.ndarray)
+
+        expected = (len(self.lat), len(self.landmarks))
+        if self.from_landmark.shape != expected or self.to_landmark.shape != expected:
+            raise ValueError(f"Таблицы ориентиров не соответствуют графу {path}: пересоберите граф")
+
+        # Привязка точек к графу — по k-d дереву узлов
+        self._nodes = KDTree(to_unit_vectors(self.lat, self.lon))
+        self.queries = 0
+        self.settled = 0
+
+    def __len__(self) -> int:
+        return len(self.lat)
+
+    @property
+    def edge_count(self) -> int:
+        """Число рёбер."""
+        return len(self.indices)
+
+    def snap(self, point: Tuple[float, float]) -> Tuple[int, float]:
+        """
+        Ближайший к точке узел графа.
+
+        Returns:
+            (индекс узла, расстояние до него в км)
+        """
+        node, chord = self._nodes.nearest(to_unit_vectors([point[0]], [point[1]])[0])
+        return node, chord_to_km(chord)
+
+    def _active_landmarks(self, source: int, target: int) -> np.ndarray:
+        """ACTIVE_LANDMARKS ориентиров с лучшей оценкой d(source, target)."""
+        with np.errstate(invalid="ignore"):
+            bounds = np.fmax(
+                self.from_landmark[target] - self.from_landmark[source],
+                self.to_landmark[source] - self.to_landmark[target],
+            )
+        return np.argsort(np.nan_to_num(bounds, nan=0.0))[-ACTIVE_LANDMARKS:]
+
+    def _estimate(self, node: int, pick: Callable, from_target: tuple, to_target: tuple) -> float:
+        """
+        Нижняя оценка d(node, target) в метрах по активным ориентирам.
+
+        pick выбирает активные ориентиры из строки таблицы. inf — цель из узла
+        недостижима. Несравнимые пары (оба расстояния бесконечны) дают NaN и
+        пропускаются: сравнение с NaN ложно.
+        """
+        estimate = 0.0
+        from_node = pick(self.from_landmark[node].tolist())
+        to_node = pick(self.to_landmark[node].tolist())
+        for from_t, from_v, to_v, to_t in zip(from_target, from_node, to_node, to_target):
+            if from_t - from_v > estimate:
+                estimate = from_t - from_v
+            if to_v - to_t > estimate:
+                estimate = to_v - to_t
+        return estimate
+
+    def shortest_path_length(self, source: int, target: int) -> Optional[float]:
+        """Длина кратчайшего пути source -> target в метрах или None, если пути нет."""
+        self.queries += 1
+        if source == target:
+            return 0.0
+
+        # Ориентиры выбираются один раз на запрос по строкам source и target
+        active = self._active_landmarks(source, target).tolist()
+        pick = itemgetter(*active) if len(active) > 1 else lambda row: (row[active[0]],)
+        from_target = pick(self.from_landmark[target].tolist())
+        to_target = pick(self.to_landmark[target].tolist())
+        estimate = self._estimate(source, pick, from_target, to_target)
+        if estimate == math.inf:
+            return None
+
+        indptr, indices, weights = self.indptr, self.indices, self.weights
+        best = {source: 0.0}
+        # Оценка считается один раз для каждого узла, попавшего в очередь
+        estimates = {source: estimate}
+        heap = [(estimate, 0.0, source)]
+
+        while heap:
+            _, length, node = heapq.heappop(heap)
+            if node == target:
+                return length
+            if length > best[node]:
+                continue
+            self.settled += 1
+
+            start, end = indptr[node], indptr[node + 1]
+            for neighbour, weight in zip(indices[start:end].tolist(), weights[start:end].tolist()):
+                candidate = length + weight
+                if candidate < best.get(neighbour, math.inf):
+                    estimate = estimates.get(neighbour)
+                    if estimate is None:
+                        estimate = estimates[neighbour] = self._estimate(neighbour, pick, from_target, to_target)
+                    if estimate == math.inf:  # Из соседа цель недостижима
+                        continue
+                    best[neighbour] = candidate
+                    heapq.heappush(heap, (candidate + estimate, candidate, neighbour))
+        return None
+
+    def route_distance(
+        self,
+        origin: Tuple[float, float],
+        destination: Tuple[float, float]
+    ) -> Optional[float]:
+        """
+        Расстояние по дорогам между точками (км).
+
+        К длине пути добавляются подъезды от точек до ближайших узлов графа.
+        Возвращает None, если точка дальше max_snap_km от дорог или пути нет.
+        """
+        source, source_snap = self.snap(origin)
+        target, target_snap = self.snap(destination)
+        if source_snap > self.max_snap_km or target_snap > self.max_snap_km:
+            logger.debug(f"Точка вне дорожного графа: {origin} ({source_snap:.1f} км), {destination} ({target_snap:.1f} км)")
+            return None
+
+        length = self.shortest_path_length(source, target)
+        if length is None:
+            return None
+        return length / 1000 + source_snap + target_snap
+
+    def stats(self) -> dict:
+        """Размер графа и счётчики запросов."""
+        return {
+            "nodes": len(self),
+            "edges": self.edge_count,
+            "landmarks": len(self.landmarks),
+            "queries": self.queries,
+            "settled_per_query": round(self.settled / self.queries, 1) if self.queries else 0.0,
+        }
+
+
+def _is_oneway(tags: dict) -> int:
+    """1 — только по направлению линии, -1 — только против, 0 — в обе стороны."""
+    oneway = tags.get("oneway")
+    if oneway in ("yes", "true", "1"):
+        return 1
+    if oneway == "-1":
+        return -1
+    if oneway == "no":
+        return 0
+    if tags.get("junction") == "roundabout" or tags.get("highway") == "motorway":
+        return 1
+    return 0
+
+
+def iter_osm_roads(osm_path: str) -> Iterator[Tuple[array, int]]:
+    """Дороги из OSM XML: (идентификаторы узлов линии, направление движения)."""
+    refs = array("q")
+    tags: dict[str, str] = {}
+    root = None
+
+    with _open_osm(osm_path) as source:
+        for event, element in ET.iterparse(source, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = element
+                if element.tag == "way":
+                    refs = array("q")
+                    tags = {}
+                continue
+
+            if element.tag == "nd":
+                refs.append(int(element.get("ref")))
+            elif element.tag == "tag":
+                tags[element.get("k")] = element.get("v")
+            elif element.tag == "way":
+                if tags.get("highway") in DRIVABLE_HIGHWAYS and len(refs) > 1:
+                    yield refs, _is_oneway(tags)
+                root.clear()
+            elif element.tag in ("node", "relation"):
+                root.clear()
+
+
+def _read_node_coords(osm_path: str, wanted: set) -> dict[int, Tuple[float, float]]:
+    """Координаты нужных узлов (второй проход по файлу)."""
+    coords = {}
+    root = None
+    with _open_osm(osm_path) as source:
+        for event, element in ET.iterparse(source, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = element
+                continue
+            if element.tag == "node":
+                node_id = int(element.get("id"))
+                if node_id in wanted:
+                    coords[node_id] = (float(element.get("lat")), float(element.get("lon")))
+                root.clear()
+            elif element.tag in ("way", "relation"):
+                root.clear()
+    return coords
+
+
+def _segment_length(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    """Длина отрезка в метрах (haversine)."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * 1000 * math.asin(math.sqrt(min(h, 1.0)))
+
+
+def _csr(sources: np.ndarray, targets: np.ndarray, weights: np.ndarray, count: int):
+    """Рёбра -> CSR-массивы (indptr, indices, weights)."""
+    order = np.argsort(sources, kind="stable")
+    indptr = np.zeros(count + 1, dtype=np.int32)
+    np.cumsum(np.bincount(sources, minlength=count), out=indptr[1:])
+    return indptr, targets[order].astype(np.int32), weights[order].astype(np.float32)
+
+
+def _dijkstra(indptr: list, indices: list, weights: list, source: int) -> np.ndarray:
+    """Расстояния от source до всех узлов (м), недостижимые — inf."""
+    distances = [np.inf] * (len(indptr) - 1)
+    distances[source] = 0.0
+    heap = [(0.0, source)]
+    while heap:
+        length, node = heapq.heappop(heap)
+        if length > distances[node]:
+            continue
+        for index in range(indptr[node], indptr[node + 1]):
+            neighbour = indices[index]
+            candidate = length + weights[index]
+            if candidate < distances[neighbour]:
+                distances[neighbour] = candidate
+                heapq.heappush(heap, (candidate, neighbour))
+    return np.array(distances, dtype=np.float32)
+
+
+def _largest_component(indptr: np.ndarray, indices: np.ndarray, count: int) -> np.ndarray:
+    """Маска узлов наибольшей компоненты связности (без учёта направления рёбер)."""
+    sources = np.repeat(np.arange(count), np.diff(indptr))
+    undirected_ptr, undirected, _ = _csr(
+        np.concatenate([sources, indices]),
+        np.concatenate([indices, sources]),
+        np.zeros(2 * len(indices)),
+        count,
+    )
+    undirected_ptr, undirected = undirected_ptr.tolist(), undirected.tolist()
+
+    component = np.full(count, -1, dtype=np.int32)
+    sizes = []
+    for start in range(count):
+        if component[start] >= 0:
+            continue
+        label = len(sizes)
+        component[start] = label
+        stack, size = [start], 0
+        while stack:
+            node = stack.pop()
+            size += 1
+            for neighbour in undirected[undirected_ptr[node]:undirected_ptr[node + 1]]:
+                if component[neighbour] < 0:
+                    component[neighbour] = label
+                    stack.append(neighbour)
+        sizes.append(size)
+    return component == int(np.argmax(sizes))
+
+
+def build_road_graph(osm_path: str, out_path: str, landmark_count: int = 16) -> Tuple[int, int]:
+    """
+    Построить файл графа из OSM XML (.osm, .osm.bz2, .osm.gz).
+
+    Returns:
+        (число узлов, число рёбер)
+    """
+    # Проход 1: дороги и число упоминаний каждого узла
+    roads = []
+    usage: dict[int, int] = {}
+    for refs, oneway in iter_osm_roads(osm_path):
+        roads.append((refs, oneway))
+        for ref in refs:
+            usage[ref] = usage.get(ref, 0) + 1
+    logger.info(f"Дорог: {len(roads)}, узлов линий: {len(usage)}")
+
+    # Проход 2: координаты узлов дорог
+    coords = _read_node_coords(osm_path, set(usage))
+
+    # Линии режутся на рёбра в перекрёстках (узел на нескольких линиях) и концах
+    junctions: dict[int, int] = {}
+    sources, targets, lengths = array("q"), array("q"), array("d")
+
+    def junction(ref: int) -> int:
+        return junctions.setdefault(ref, len(junctions))
+
+    def add_edge(u: int, v: int, length: float) -> None:
+        sources.append(u)
+        targets.append(v)
+        lengths.append(length)
+
+    for refs, oneway in roads:
+        start_ref, length, previous = None, 0.0, None
+        for position, ref in enumerate(refs):
+            point = coords.get(ref)
+            if point is None:  # Узел за границей выгрузки — линия обрывается
+                start_ref, length, previous = None, 0.0, None
+                continue
+            if previous is not None:
+                length += _segment_length(previous, point)
+            previous = point
+
+            is_junction = usage[ref] > 1 or position in (0, len(refs) - 1)
+            if start_ref is None:
+                start_ref, length = ref, 0.0
+            elif is_junction:
+                u, v = junction(start_ref), junction(ref)
+                if u != v:
+                    if oneway >= 0:
+                        add_edge(u, v, length)
+                    if oneway <= 0:
+                        add_edge(v, u, length)
+                start_ref, length = ref, 0.0
+
+    count = len(junctions)
+    sources, targets, lengths = np.frombuffer(sources, np.int64), np.frombuffer(targets, np.int64), np.frombuffer(lengths)
+
+    # Параллельные рёбра — оставляем кратчайшее
+    order = np.lexsort((lengths, targets, sources))
+    sources, targets, lengths = sources[order], targets[order], lengths[order]
+    unique = np.ones(len(sources), dtype=bool)
+    unique[1:] = (sources[1:] != sources[:-1]) | (targets[1:] != targets[:-1])
+    sources, targets, lengths = sources[unique], targets[unique], lengths[unique]
+
+    # Оставляем наибольшую компоненту: острова из-за обрезки выгрузки дают «нет пути»
+    indptr, indices, _ = _csr(sources, targets, lengths, count)
+    keep = _largest_component(indptr, indices, count)
+    renumber = np.cumsum(keep) - 1
+    edge_mask = keep[sources] & keep[targets]
+    sources, targets, lengths = renumber[sources[edge_mask]], renumber[targets[edge_mask]], lengths[edge_mask]
+
+    points = np.zeros((count, 2), dtype=np.float32)
+    for ref, index in junctions.items():
+        points[index] = coords[ref]
+    points = points[keep]
+    count = len(points)
+
+    indptr, indices, weights = _csr(sources, targets, lengths, count)
+    rev_indptr, rev_indices, rev_weights = _csr(targets, sources, lengths, count)
+    logger.info(f"Граф: {count} узлов, {len(indices)} рёбер")
+
+    # Ориентиры: каждый следующий — самый дальний от уже выбранных
+    forward = (indptr.tolist(), indices.tolist(), weights.tolist())
+    backward = (rev_indptr.tolist(), rev_indices.tolist(), rev_weights.tolist())
+    landmark_count = min(landmark_count, count)
+    landmarks, from_landmark, to_landmark = [], [], []
+    nearest = np.full(count, np.inf, dtype=np.float32)
+    candidate = 0
+    for _ in range(landmark_count):
+        landmarks.append(candidate)
+        from_landmark.append(_dijkstra(*forward, candidate))
+        to_landmark.append(_dijkstra(*backward, candidate))
+        reach = np.fmin(from_landmark[-1], to_landmark[-1])
+        nearest = np.fmin(nearest, np.where(np.isinf(reach), 0.0, reach))
+        candidate = int(np.argmax(nearest))
+        logger.info(f"Ориентир {len(landmarks)}/{landmark_count}: узел {landmarks[-1]}")
+
+    # Таблицы — до .npz: по нему определяется версия графа. Процессы со старым
+    # графом продолжают читать прежние файлы (os.replace не трогает открытый mmap)
+    for table_path, table in zip(landmark_paths(out_path), (from_landmark, to_landmark)):
+        with open(f"{table_path}.tmp", "wb") as out:
+            np.save(out, np.stack(table, axis=1))
+        os.replace(f"{table_path}.tmp", table_path)
+
+    tmp_path = f"{out_path}.tmp.npz"
+    np.savez(
+        tmp_path,
+        lat=points[:, 0], lon=points[:, 1],
+        indptr=indptr, indices=indices, weights=weights,
+        landmarks=np.array(landmarks, dtype=np.int32),
+    )
+    os.replace(tmp_path, out_path)
+
+    logger.info(f"Дорожный граф построен: {count} узлов, {len(indices)} рёбер -> {out_path}")
+    return count, len(indices)
+
+
+# Граф процесса (загружается при старте бота, см. load_road_graph)
+_road_graph: Optional[RoadGraph] = None
+
+
+def load_road_graph(path: str, max_snap_km: float = 3.0) -> Optional[RoadGraph]:
+    """Загрузить граф, если файл существует; иначе расстояние считается по прямой."""
+    global _road_graph
+    if _road_graph is None:
+        if not os.path.exists(path):
+            logger.warning(f"Дорожный граф {path} не найден, расстояние считается по прямой")
+            return None
+        _road_graph = RoadGraph(path, max_snap_km=max_snap_km)
+        logger.info(f"Дорожный граф загружен: {len(_road_graph)} узлов, {_road_graph.edge_count} рёбер")
+    return _road_graph
+
+
+def get_road_graph() -> Optional[RoadGraph]:
+    """Загруженный граф или None."""
+    return _road_graph
@@ -0,0 +1,89 @@
+"""Ограниченный LRU-кэш со временем жизни записей."""
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+# Маркер отсутствия значения (None — допустимое закэшированное значение)
+MISSING = object()
+
+
+class TTLCache:
+    """
+    LRU-кэш в памяти процесса с ограничением размера и TTL.
+
+    При переполнении вытесняется давно не использованная запись.
+    Время жизни можно задать для каждой записи отдельно (например,
+    короче для «отрицательных» результатов).
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        """
+        Args:
+            maxsize: Максимальное число записей
+            ttl: Время жизни записи по умолчанию (сек)
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Any:
+        """Получить значение или MISSING, если записи нет или она устарела."""
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return MISSING
+
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return MISSING
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Сохранить значение (ttl=None — время жизни по умолчанию)."""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        """Удалить запись из кэша."""
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """Очистить кэш."""
+        self._data.clear()
+
+    def items(self) -> list[tuple[Hashable, Any, float]]:
+        """Живые записи (ключ, значение, оставшееся время жизни в сек) от старых к новым."""
+        now = time.monotonic()
+        return [(key, value, expires_at - now) for key, (expires_at, value) in self._data.items() if expires_at > now]
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def hit_rate(self) -> float:
+        """Доля попаданий среди всех обращений."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        """Счётчики кэша."""
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hit_rate, 4),
+        }
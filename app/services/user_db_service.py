@@ -1,9 +1,33 @@
-"""Сервис для работы с пользователями в БД."""
+"""
+Сервис для работы с пользователями в БД.
+
+Строки пользователей почти не меняются, а проверка «пользователь есть»
+нужна почти каждому обработчику, поэтому get_user_by_telegram_id читает
+из кэша процесса (LRU с TTL, ключ — telegram_id). В кэше лежат
+отсоединённые копии; найденная копия подключается к сессии через
+merge(load=False) — без запроса к БД. Изменения через сервис обновляют
+кэш после commit, удаление — убирает запись. Изменения в обход сервиса
+(другой процесс, SQL) видны после истечения USER_CACHE_TTL.
+"""
 from typing import Optional
-from sqlalchemy import select
+from sqlalchemy import case, func, literal_column, or_, select
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
 
+from app.config import settings
 from app.db.models import User
+from app.services.ttl_cache import TTLCache, MISSING
+
+# Кэш процесса: telegram_id -> отсоединённая копия User
+user_cache = TTLCache(maxsize=settings.user_cache_size, ttl=settings.user_cache_ttl)
+
+
+def _remember(user: User) -> None:
+    """Положить в кэш отсоединённую копию пользователя."""
+    snapshot = User(**{attr.key: getattr(user, attr.key) for attr in User.__mapper__.column_attrs})
+    make_transient_to_detached(snapshot)
+    user_cache.set(user.telegram_id, snapshot)
 
 
 class UserDBService:
@@ -32,13 +56,28 @@ class UserDBService:
         self.session.add(user)
         await self.session.commit()
         await self.session.refresh(user)
+        _remember(user)
         return user
 
     async def get_user_by_telegram_id(
         self,
         telegram_id: int
     ) -> Optional[User]:
-        """Получить пользователя по telegram_id."""
+        """Получить пользователя по telegram_id (из кэша процесса, если есть)."""
+        cached = user_cache.get(telegram_id)
+        if cached is not MISSING:
+            return await self.session.merge(cached, load=False)
+        
+        user = await self._load_user(telegram_id)
+        if user:
+            _remember(user)
+        return user
+
+    async def _load_user(
+        self,
+        telegram_id: int
+    ) -> Optional[User]:
+        """Прочитать пользователя из БД, минуя кэш (перед изменением)."""
         stmt = select(User).where(User.telegram_id == telegram_id)
         result = await self.session.execute(stmt)
         return result.scalar_one_or_none()
@@ -52,6 +91,35 @@ class UserDBService:
         result = await self.session.execute(stmt)
         return result.scalar_one_or_none()
 
+    def _upsert(self, rows: list[dict], only_changed: bool = True):
+        """
+        INSERT ... ON CONFLICT (telegram_id) DO UPDATE для строк пользователей.
+
+        Пустые поля не затирают сохранённые (как в get_or_create_user).
+        only_changed=True — строка обновляется, только если данные изменились
+        (без лишних версий строк, но RETURNING не возвращает неизменённые);
+        False — DO UPDATE всегда, RETURNING возвращает строку в любом случае,
+        updated_at меняется только при изменении данных.
+        """
+        stmt = insert(User).values(rows)
+        excluded = stmt.excluded
+        fields = ("username", "first_name", "last_name")
+        values = {
+            field: func.coalesce(func.nullif(getattr(excluded, field), ""), getattr(User, field))
+            for field in fields
+        }
+        changed = or_(*(getattr(User, field).is_distinct_from(values[field]) for field in fields))
+        if only_changed:
+            return stmt.on_conflict_do_update(
+                index_elements=[User.telegram_id],
+                set_={**values, "updated_at": func.now()},
+                where=changed
+            )
+        return stmt.on_conflict_do_update(
+            index_elements=[User.telegram_id],
+            set_={**values, "updated_at": case((changed, func.now()), else_=User.updated_at)}
+        )
+
     async def get_or_create_user(
         self,
         telegram_id: int,
@@ -62,38 +130,75 @@ class UserDBService:
         """
         Получить существующего пользователя или создать нового.
         
+        Один запрос INSERT ... ON CONFLICT DO UPDATE ... RETURNING вместо
+        SELECT + UPDATE/INSERT: без гонки при повторном /start и с одним
+        обращением к БД. Если пользователь в кэше и данные не изменились,
+        запроса нет совсем.
+        
         Returns:
             tuple[User, bool]: (пользователь, был_ли_создан)
         """
-        user = await self.get_user_by_telegram_id(telegram_id)
+        cached = user_cache.get(telegram_id)
+        if cached is not MISSING and all(
+            not value or getattr(cached, field) == value
+            for field, value in (("username", username), ("first_name", first_name), ("last_name", last_name))
+        ):
+            return await self.session.merge(cached, load=False), False
         
-        if user:
-            # Обновляем данные если они изменились
-            updated = False
-            if username and user.username != username:
-                user.username = username
-                updated = True
-            if first_name and user.first_name != first_name:
-                user.first_name = first_name
-                updated = True
-            if last_name and user.last_name != last_name:
-                user.last_name = last_name
-                updated = True
-            
-            if updated:
-                await self.session.commit()
-                await self.session.refresh(user)
-            
-            return user, False
+        stmt = self._upsert([{
+            "telegram_id": telegram_id,
+            "username": username,
+            "first_name": first_name,
+            "last_name": last_name,
+        }], only_changed=False).returning(User, literal_column("xmax = 0").label("created"))
+        # DO UPDATE всегда — RETURNING возвращает строку и без изменений;
+        # xmax = 0 у новой версии строки — вставка, иначе — обновление
+        result = await self.session.execute(stmt, execution_options={"populate_existing": True})
+        user, created = result.one()
+        await self.session.commit()
+        _remember(user)
+        return user, created
+
+    async def upsert_users(
+        self,
+        users: list[dict],
+        chunk_size: int = 1000
+    ) -> tuple[int, int]:
+        """
+        Создать или обновить пользователей пачками (импорт списков).
         
-        # Создаём нового пользователя
-        user = await self.create_user(
-            telegram_id=telegram_id,
-            username=username,
-            first_name=first_name,
-            last_name=last_name
-        )
-        return user, True
+        Args:
+            users: [{"telegram_id", "username", "first_name", "last_name"}, ...]
+            chunk_size: Строк в одном INSERT
+        
+        Returns:
+            tuple[int, int]: (создано, обновлено); неизменённые строки не считаются
+        """
+        # Один telegram_id дважды в одном INSERT ... ON CONFLICT — ошибка: оставляем последний
+        rows = {
+            user["telegram_id"]: {
+                "telegram_id": user["telegram_id"],
+                "username": user.get("username"),
+                "first_name": user.get("first_name"),
+                "last_name": user.get("last_name"),
+            }
+            for user in users
+        }
+        rows = list(rows.values())
+        
+        created = updated = 0
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            stmt = self._upsert(chunk).returning(User.telegram_id, literal_column("xmax = 0"))
+            result = await self.session.execute(stmt)
+            for telegram_id, inserted in result:
+                user_cache.invalidate(telegram_id)
+                if inserted:
+                    created += 1
+                else:
+                    updated += 1
+            await self.session.commit()
+        return created, updated
 
     async def update_user(
         self,
@@ -104,7 +209,7 @@ class UserDBService:
         phone: Optional[str] = None
     ) -> Optional[User]:
         """Обновить данные пользователя."""
-        user = await self.get_user_by_telegram_id(telegram_id)
+        user = await self._load_user(telegram_id)
         
         if not user:
             return None
@@ -120,6 +225,7 @@ class UserDBService:
         
         await self.session.commit()
         await self.session.refresh(user)
+        _remember(user)
         return user
 
     async def update_phone(
@@ -138,13 +244,15 @@ class UserDBService:
         telegram_id: int
     ) -> bool:
         """Удалить пользователя."""
-        user = await self.get_user_by_telegram_id(telegram_id)
+        user = await self._load_user(telegram_id)
         
         if not user:
+            user_cache.invalidate(telegram_id)
             return False
         
         await self.session.delete(user)
         await self.session.commit()
+        user_cache.invalidate(telegram_id)
         return True
 
     async def get_all_users(
@@ -159,7 +267,6 @@ class UserDBService:
 
     async def count_users(self) -> int:
         """Получить количество пользователей."""
-        from sqlalchemy import func
         stmt = select(func.count(User.id))
         result = await self.session.execute(stmt)
         return result.scalar_one()
@@ -175,7 +282,7 @@ class UserDBService:
         is_manager: bool
     ) -> Optional[User]:
         """Установить статус менеджера для пользователя."""
-        user = await self.get_user_by_telegram_id(telegram_id)
+        user = await self._load_user(telegram_id)
         
         if not user:
             return None
@@ -183,5 +290,10 @@ class UserDBService:
         user.is_manager = is_manager
         await self.session.commit()
         await self.session.refresh(user)
+        _remember(user)
         return user
 
+    @staticmethod
+    def cache_stats() -> dict:
+        """Счётчики кэша пользователей процесса."""
+        return user_cache.stats()
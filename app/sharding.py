@@ -0,0 +1,305 @@
+"""
+Обработка обновлений в нескольких процессах (WORKERS > 1).
+
+Процесс-приёмник получает обновления (polling или webhook) и, не разбирая их,
+раскладывает по очередям процессов-обработчиков по id пользователя
+(from_user.id % WORKERS). Обновления одного пользователя всегда попадают в
+один процесс и внутри него обрабатываются строго по порядку, поэтому переходы
+FSM не перемешиваются; разные пользователи обрабатываются параллельно, в том
+числе на разных ядрах. Обработчики выполняют обычный диспетчер
+(create_dispatcher) — код обработчиков не меняется.
+
+Приёмник следит за обработчиками: процесс, который завершился или не
+обновлял heartbeat дольше WORKER_HEARTBEAT_TIMEOUT, перезапускается.
+Обновления, которые упавший процесс уже взял из очереди, теряются.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from hmac import compare_digest
+from queue import Empty, Full
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.methods import TelegramMethod
+from aiogram.utils.backoff import Backoff, BackoffConfig
+from aiohttp import web
+
+from app.config import settings
+from app.services.distance_cache import distance_cache
+
+logger = logging.getLogger(__name__)
+
+# spawn: обработчик стартует с чистого интерпретатора, без копии цикла событий приёмника
+_CONTEXT = multiprocessing.get_context("spawn")
+
+HEARTBEAT_INTERVAL = 1.0  # Период heartbeat и проверки обработчиков (сек)
+STARTUP_TIMEOUT = 120.0  # Время на загрузку индекса адресов и графа при старте (сек)
+WORKER_CONCURRENCY = 100  # Одновременно обрабатываемых обновлений в процессе
+POLLING_TIMEOUT = 30  # Long polling getUpdates (сек)
+
+
+def update_user_id(update: dict) -> int:
+    """id автора обновления (для событий без пользователя — id чата, иначе 0)."""
+    for event in update.values():
+        if not isinstance(event, dict):
+            continue
+        user = event.get("from") or event.get("user")
+        if user:
+            return user["id"]
+        chat = event.get("chat")
+        if chat:
+            return chat["id"]
+    return 0
+
+
+def _worker_main(index: int, queue, heartbeat, parent_pid: int) -> None:
+    """Точка входа процесса-обработчика."""
+    # Ctrl+C получает вся группа процессов; обработчик останавливает приёмник
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    asyncio.run(_worker(index, queue, heartbeat, parent_pid))
+
+
+async def _heartbeat(heartbeat) -> None:
+    while True:
+        heartbeat.value = time.time()
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+
+async def _worker(index: int, queue, heartbeat, parent_pid: int) -> None:
+    """Цикл обработчика: обновления из очереди, по порядку для каждого пользователя."""
+    from app.main import close_resources, create_bot, create_dispatcher, load_resources
+
+    bot = create_bot()
+    dispatcher = create_dispatcher()
+    graph_version = load_resources()
+    await dispatcher.emit_startup(bot=bot)
+    beat = asyncio.create_task(_heartbeat(heartbeat))
+    logger.info(f"Обработчик {index} запущен (pid {os.getpid()})")
+
+    loop = asyncio.get_running_loop()
+    # Обрабатываемые сейчас обновления. Слот занимается только после предыдущего
+    # обновления пользователя: очередь одного пользователя не занимает слоты,
+    # ожидая саму себя, и не задерживает остальных
+    in_flight = asyncio.Semaphore(WORKER_CONCURRENCY)
+    # Взятые из очереди, но не обработанные обновления (ограничение памяти)
+    backlog = asyncio.Semaphore(settings.worker_queue_size)
+    # Последняя задача каждого пользователя: следующая ждёт её завершения
+    tails: dict[int, asyncio.Task] = {}
+
+    async def process(update: dict, user_id: int, previous: Optional[asyncio.Task]) -> None:
+        try:
+            if previous is not None:
+                await asyncio.wait([previous])
+            async with in_flight:
+                result = await dispatcher.feed_raw_update(bot, update)
+                if isinstance(result, TelegramMethod):
+                    await dispatcher.silent_call_request(bot, result)
+        except Exception as e:
+            logger.exception(f"Ошибка обработки обновления {update.get('update_id')}: {e}")
+        finally:
+            backlog.release()
+            if tails.get(user_id) is asyncio.current_task():
+                del tails[user_id]
+
+    try:
+        while True:
+            try:
+                update = await loop.run_in_executor(None, queue.get, True, HEARTBEAT_INTERVAL)
+            except Empty:
+                if os.getppid() != parent_pid:
+                    logger.error(f"Обработчик {index}: приёмник завершился, остановка")
+                    break
+                continue
+            if update is None:
+                break
+            await backlog.acquire()
+            user_id = update_user_id(update)
+            tails[user_id] = asyncio.create_task(process(update, user_id, tails.get(user_id)))
+
+        if tails:
+            await asyncio.wait(list(tails.values()))
+    finally:
+        beat.cancel()
+        await dispatcher.emit_shutdown(bot=bot)
+        # Свой файл кэша расстояний: приёмник объединит файлы обработчиков
+        await close_resources(graph_version, distance_cache.shard_path(index))
+        await bot.session.close()
+        logger.info(f"Обработчик {index} остановлен")
+
+
+class WorkerPool:
+    """Процессы-обработчики с очередями и перезапуском."""
+
+    def __init__(self, count: int, queue_size: int = 1000, heartbeat_timeout: float = 30.0):
+        """
+        Args:
+            count: Число процессов
+            queue_size: Размер очереди процесса (при заполнении приём ждёт)
+            heartbeat_timeout: Через сколько секунд без heartbeat процесс считается зависшим
+        """
+        self.count = count
+        self.queue_size = queue_size
+        self.heartbeat_timeout = heartbeat_timeout
+        self.queues = [_CONTEXT.Queue(queue_size) for _ in range(count)]
+        self.heartbeats = [_CONTEXT.Value("d", 0.0, lock=False) for _ in range(count)]
+        self.processes: list = [None] * count
+
+        self.dispatched = 0
+        self.restarts = 0
+
+    def _spawn(self, index: int) -> None:
+        self.heartbeats[index].value = time.time() + STARTUP_TIMEOUT
+        process = _CONTEXT.Process(
+            target=_worker_main,
+            args=(index, self.queues[index], self.heartbeats[index], os.getpid()),
+            name=f"worker-{index}",
+            daemon=True
+        )
+        process.start()
+        self.processes[index] = process
+
+    def start(self) -> None:
+        for index in range(self.count):
+            self._spawn(index)
+        logger.info(f"Запущено обработчиков: {self.count}")
+
+    async def dispatch(self, update: dict) -> None:
+        """Поставить обновление в очередь процесса его пользователя."""
+        queue = self.queues[update_user_id(update) % self.count]
+        try:
+            queue.put_nowait(update)
+        except Full:
+            # Обработчик не успевает: ждём места, не блокируя цикл событий
+            await asyncio.get_running_loop().run_in_executor(None, queue.put, update)
+        self.dispatched += 1
+
+    def _replace_queue(self, index: int) -> None:
+        """
+        Новая очередь вместо очереди завершившегося процесса.
+
+        Процесс, убитый во время queue.get (kill, OOM), оставляет захваченной
+        блокировку чтения — новый процесс не получил бы из очереди ничего.
+        Оставшиеся обновления переносятся, если блокировка свободна.
+        """
+        old, new = self.queues[index], _CONTEXT.Queue(self.queue_size)
+        moved = 0
+        try:
+            while True:
+                new.put_nowait(old.get(timeout=0.1))
+                moved += 1
+        except (Empty, Full):
+            pass
+        self.queues[index] = new
+        logger.info(f"Очередь обработчика {index} заменена, перенесено обновлений: {moved}")
+
+    async def supervise(self) -> None:
+        """Перезапускать завершившиеся и зависшие процессы."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            now = time.time()
+            for index, process in enumerate(self.processes):
+                if not process.is_alive():
+                    logger.error(f"Обработчик {index} завершился (код {process.exitcode}), перезапуск")
+                elif now - self.heartbeats[index].value > self.heartbeat_timeout:
+                    logger.error(f"Обработчик {index} не отвечает {now - self.heartbeats[index].value:.0f} с, перезапуск")
+                    process.kill()
+                    await loop.run_in_executor(None, process.join)
+                else:
+                    continue
+                await loop.run_in_executor(None, self._replace_queue, index)
+                self.restarts += 1
+                self._spawn(index)
+
+    async def stop(self, timeout: float = 30.0) -> None:
+        """Дождаться обработки очередей и остановить процессы."""
+        loop = asyncio.get_running_loop()
+        for queue in self.queues:
+            await loop.run_in_executor(None, queue.put, None)
+        deadline = time.monotonic() + timeout
+        for index, process in enumerate(self.processes):
+            await loop.run_in_executor(None, process.join, max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                logger.error(f"Обработчик {index} не остановился за {timeout:.0f} с, завершаем")
+                process.kill()
+        logger.info(f"Обработчики остановлены: {self.stats()}")
+
+    def stats(self) -> dict:
+        """Счётчики: принято обновлений, перезапусков, живых процессов."""
+        return {
+            "dispatched": self.dispatched,
+            "restarts": self.restarts,
+            "alive": sum(1 for process in self.processes if process is not None and process.is_alive()),
+        }
+
+
+async def _poll(bot: Bot, pool: WorkerPool, allowed_updates: list[str]) -> None:
+    """Получение обновлений через getUpdates и раздача обработчикам."""
+    await bot.delete_webhook()
+    backoff = Backoff(BackoffConfig(min_delay=1.0, max_delay=5.0, factor=1.3, jitter=0.1))
+    offset = None
+    while True:
+        try:
+            updates = await bot.get_updates(
+                offset=offset,
+                timeout=POLLING_TIMEOUT,
+                allowed_updates=allowed_updates,
+                request_timeout=int(bot.session.timeout + POLLING_TIMEOUT)
+            )
+        except Exception as e:
+            logger.error(f"Ошибка получения обновлений: {e}, повтор через {backoff.next_delay:.1f} с")
+            await backoff.asleep()
+            continue
+        backoff.reset()
+
+        for update in updates:
+            await pool.dispatch(update.model_dump(mode="json", exclude_unset=True, by_alias=True))
+            offset = update.update_id + 1
+
+
+def _webhook_app(pool: WorkerPool) -> web.Application:
+    """HTTP-приёмник webhook: проверка секрета и постановка в очередь без разбора обновления."""
+    async def handle(request: web.Request) -> web.Response:
+        secret = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if settings.webhook_secret and not compare_digest(secret, settings.webhook_secret):
+            return web.Response(status=401, text="Unauthorized")
+        await pool.dispatch(await request.json())
+        return web.json_response({})
+
+    app = web.Application()
+    app.router.add_post(settings.webhook_path, handle)
+    return app
+
+
+async def run_sharded() -> None:
+    """Приёмник обновлений и WORKERS процессов-обработчиков."""
+    from app.handlers import setup_routers
+    from app.main import create_bot, serve_webhook, stop_signal
+
+    bot = create_bot()
+    # Типы обновлений — по обработчикам; диспетчер (хранилище FSM, пул БД) приёмнику не нужен
+    allowed_updates = setup_routers().resolve_used_update_types()
+    pool = WorkerPool(settings.workers, settings.worker_queue_size, settings.worker_heartbeat_timeout)
+    pool.start()
+    supervisor = asyncio.create_task(pool.supervise())
+
+    try:
+        if settings.bot_mode == "webhook":
+            # Ответ обработчика уходит через Bot API: приёмник отвечает Telegram сразу
+            await serve_webhook(_webhook_app(pool), bot, allowed_updates)
+        else:
+            stop = stop_signal()
+            polling = asyncio.create_task(_poll(bot, pool, allowed_updates))
+            logger.info("Бот запущен (polling)")
+            await asyncio.wait([polling, asyncio.create_task(stop.wait())], return_when=asyncio.FIRST_COMPLETED)
+            polling.cancel()
+    finally:
+        supervisor.cancel()
+        await pool.stop()
+        distance_cache.merge([distance_cache.shard_path(index) for index in range(pool.count)])
+        await bot.session.close()
@@ -0,0 +1,394 @@
+"""
+Хранилища состояний FSM.
+
+PostgresStorage хранит состояние и данные диалога в таблице fsm_states, чтобы
+незаконченные заказы переживали перезапуск бота и были видны всем процессам.
+Чтобы не делать запрос к БД на каждый state.update_data, состояние держится
+в кэше процесса, а изменения записываются в фоне (write-behind): все ключи,
+изменённые за FSM_FLUSH_INTERVAL, пишутся одним INSERT ... ON CONFLICT.
+
+BoundedMemoryStorage — хранение в памяти процесса с ограничением: диалог,
+брошенный на середине, удаляется через FSM_MEMORY_TTL, а при превышении
+FSM_MEMORY_LIMIT_MB вытесняются давно не активные диалоги.
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from copy import copy
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.config import settings
+from app.db.base import async_session_maker
+from app.db.models import FsmState
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Entry:
+    """Состояние ключа в кэше процесса."""
+    state: Optional[str] = None
+    data: Dict[str, Any] = field(default_factory=dict)
+    loaded_at: float = 0.0
+
+
+class PostgresStorage(BaseStorage):
+    """
+    FSM-хранилище в Postgres с кэшем процесса и отложенной пакетной записью.
+
+    Чтение: из кэша, если запись свежее cache_ttl или ещё не записана в БД;
+    иначе — один SELECT. Запись: только в кэш, ключ помечается изменённым;
+    фоновая задача раз в flush_interval пишет все изменённые ключи одним
+    запросом. При остановке (close) несохранённые изменения дописываются.
+
+    Если несколько процессов обслуживают одного пользователя одновременно,
+    каждый видит чужие изменения не позже чем через cache_ttl — поэтому
+    обновления одного пользователя лучше направлять в один процесс.
+
+    Ошибка чтения из БД пробрасывается и не кэшируется: иначе пустое
+    состояние попало бы в кэш, и следующая запись затёрла бы настоящую
+    строку. При ошибке записи период повтора удваивается до FLUSH_BACKOFF_MAX.
+    """
+
+    # Максимальный период повтора записи при недоступной БД (сек)
+    FLUSH_BACKOFF_MAX = 30.0
+
+    def __init__(
+        self,
+        session_maker: async_sessionmaker = async_session_maker,
+        flush_interval: float = 0.2,
+        cache_size: int = 10000,
+        cache_ttl: float = 300.0
+    ):
+        """
+        Args:
+            session_maker: Фабрика сессий БД
+            flush_interval: Период фоновой записи (сек)
+            cache_size: Максимум ключей в кэше (вытесняются только записанные в БД)
+            cache_ttl: Сколько секунд доверять кэшу без перечитывания из БД
+        """
+        self.session_maker = session_maker
+        self.flush_interval = flush_interval
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+
+        self._cache: OrderedDict[str, _Entry] = OrderedDict()
+        self._dirty: set[str] = set()
+        # Ключи, запись которых выполняется прямо сейчас
+        self._flushing: set[str] = set()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._closed = False
+        # Неудачных записей подряд (0 — БД доступна)
+        self._flush_failures = 0
+
+        self.db_reads = 0
+        self.flushes = 0
+        self.rows_written = 0
+
+    async def _entry(self, key: StorageKey) -> _Entry:
+        """Запись кэша для ключа (при необходимости — из БД)."""
+        db_key = self.key_builder.build(key)
+        stale = self._cache.get(db_key)
+        if stale is not None and (self._pending(db_key) or time.monotonic() - stale.loaded_at < self.cache_ttl):
+            self._cache.move_to_end(db_key)
+            return stale
+
+        entry = _Entry(loaded_at=time.monotonic())
+        try:
+            async with self.session_maker() as session:
+                row = (await session.execute(
+                    select(FsmState.state, FsmState.data).where(FsmState.key == db_key)
+                )).one_or_none()
+        except (SQLAlchemyError, OSError) as e:
+            logger.error(f"Ошибка чтения состояния FSM {db_key}: {e}")
+            raise
+        self.db_reads += 1
+
+        # Пока шёл SELECT, ключ мог загрузить и изменить другой обработчик:
+        # его запись не заменяем, иначе изменения пропали бы при записи в БД
+        current = self._cache.get(db_key)
+        if current is not None and (current is not stale or self._pending(db_key)):
+            self._cache.move_to_end(db_key)
+            return current
+
+        if row is not None:
+            entry.state, entry.data = row.state, dict(row.data or {})
+        self._cache[db_key] = entry
+        self._evict()
+        return entry
+
+    def _pending(self, db_key: str) -> bool:
+        """Есть ли у ключа изменения, ещё не записанные в БД."""
+        return db_key in self._dirty or db_key in self._flushing
+
+    def _evict(self) -> None:
+        """Вытеснить давно не использованные ключи, уже записанные в БД."""
+        # Не записанные ключи переносятся в конец очереди; каждый — не больше одного раза
+        skipped = 0
+        while len(self._cache) > self.cache_size and skipped < len(self._cache):
+            db_key, entry = self._cache.popitem(last=False)
+            if self._pending(db_key):
+                self._cache[db_key] = entry
+                skipped += 1
+
+    def _mark_dirty(self, key: StorageKey) -> None:
+        self._dirty.add(self.key_builder.build(key))
+        if not self._closed and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    def _retry_delay(self) -> float:
+        """Пауза перед следующей записью: удваивается после каждой неудачи."""
+        if not self._flush_failures:
+            return self.flush_interval
+        return min(self.flush_interval * 2 ** self._flush_failures, self.FLUSH_BACKOFF_MAX)
+
+    async def _flush_loop(self) -> None:
+        """Фоновая запись изменённых ключей."""
+        while self._dirty and not self._closed:
+            await asyncio.sleep(self._retry_delay())
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Записать все изменённые ключи в БД одним запросом (пустые — удалить)."""
+        if not self._dirty:
+            return
+
+        keys = list(self._dirty)
+        self._flushing.update(keys)
+        self._dirty.clear()
+        rows, removed = [], []
+        for db_key in keys:
+            entry = self._cache[db_key]
+            if entry.state is None and not entry.data:
+                removed.append(db_key)
+            else:
+                rows.append({"key": db_key, "state": entry.state, "data": dict(entry.data)})
+
+        try:
+            async with self.session_maker() as session:
+                if rows:
+                    stmt = insert(FsmState).values(rows)
+                    await session.execute(stmt.on_conflict_do_update(
+                        index_elements=[FsmState.key],
+                        set_={"state": stmt.excluded.state, "data": stmt.excluded.data, "updated_at": func.now()}
+                    ))
+                if removed:
+                    await session.execute(delete(FsmState).where(FsmState.key.in_(removed)))
+                await session.commit()
+        except (SQLAlchemyError, OSError) as e:
+            # Ошибкой логируется только начало сбоя, повторы — на уровне DEBUG
+            if not self._flush_failures:
+                logger.error(f"Ошибка записи состояний FSM ({len(keys)} ключей), повтор позже: {e}")
+            else:
+                logger.debug(f"Повтор записи состояний FSM не удался ({self._flush_failures}): {e}")
+            self._flush_failures += 1
+            self._dirty.update(keys)
+            return
+        finally:
+            self._flushing.difference_update(keys)
+
+        if self._flush_failures:
+            logger.info(f"Запись состояний FSM восстановлена после {self._flush_failures} неудачных попыток")
+            self._flush_failures = 0
+        self.flushes += 1
+        self.rows_written += len(keys)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        entry = await self._entry(key)
+        entry.state = state.state if isinstance(state, State) else state
+        self._mark_dirty(key)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._entry(key)).state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        entry = await self._entry(key)
+        entry.data = data.copy()
+        self._mark_dirty(key)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._entry(key)).data.copy()
+
+    async def get_value(self, storage_key: StorageKey, dict_key: str, default: Optional[Any] = None) -> Optional[Any]:
+        return copy((await self._entry(storage_key)).data.get(dict_key, default))
+
+    async def close(self) -> None:
+        """Остановить фоновую запись и дописать несохранённые изменения."""
+        if self._closed:
+            return
+        self._closed = True
+        # Не отменяем фоновую запись: прерванный запрос потерял бы изменения
+        if self._flush_task is not None:
+            await self._flush_task
+        await self.flush()
+        if self._dirty:
+            logger.error(f"Не удалось сохранить состояния FSM: {len(self._dirty)} ключей")
+
+    def stats(self) -> dict:
+        """Счётчики хранилища."""
+        return {
+            "cached": len(self._cache),
+            "dirty": len(self._dirty),
+            "db_reads": self.db_reads,
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+        }
+
+
+class _Session:
+    """Компактное состояние диалога: номер состояния и данные в виде JSON."""
+    __slots__ = ("state", "data", "expires_at")
+
+    def __init__(self, state: int, data: bytes, expires_at: float):
+        self.state = state
+        self.data = data
+        self.expires_at = expires_at
+
+
+class BoundedMemoryStorage(BaseStorage):
+    """
+    FSM-хранилище в памяти процесса с TTL и ограничением объёма.
+
+    Каждый диалог хранится как _Session: состояние — номер в общей таблице
+    названий состояний, данные — JSON в bytes (десятки байт вместо словаря
+    с объектами Python). Время жизни продлевается при каждом обращении,
+    поэтому порядок LRU совпадает с порядком истечения: устаревшие диалоги
+    удаляются с начала очереди при каждой записи, без обхода всех ключей.
+    Данные диалога должны сериализоваться в JSON.
+    """
+
+    # Оценка накладных расходов на диалог помимо данных: ключ, узел
+    # OrderedDict, объект _Session (байт)
+    SESSION_OVERHEAD = 340
+
+    def __init__(self, ttl: float = 86400.0, max_bytes: int = 64 * 1024 * 1024):
+        """
+        Args:
+            ttl: Время жизни неактивного диалога (сек)
+            max_bytes: Ограничение объёма хранимых диалогов (байт)
+        """
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._sessions: OrderedDict[tuple, _Session] = OrderedDict()
+        self._state_names: list[Optional[str]] = [None]
+        self._state_ids: Dict[Optional[str], int] = {None: 0}
+        self.bytes_used = 0
+
+        self.expired = 0
+        self.evicted = 0
+
+    def _size(self, session: _Session) -> int:
+        return len(session.data) + self.SESSION_OVERHEAD
+
+    @staticmethod
+    def _key(key: StorageKey) -> tuple:
+        """Ключ-кортеж (StorageKey вместе со своим __dict__ занимает ~350 байт)."""
+        return key.bot_id, key.chat_id, key.user_id, key.thread_id, key.business_connection_id, key.destiny
+
+    def _get(self, key: tuple) -> Optional[_Session]:
+        """Живой диалог по ключу (с продлением времени жизни)."""
+        session = self._sessions.get(key)
+        if session is None:
+            return None
+        now = time.monotonic()
+        if session.expires_at <= now:
+            self._remove(key)
+            self.expired += 1
+            return None
+        session.expires_at = now + self.ttl
+        self._sessions.move_to_end(key)
+        return session
+
+    def _remove(self, key: tuple) -> None:
+        session = self._sessions.pop(key)
+        self.bytes_used -= self._size(session)
+
+    def _put(self, key: tuple, state: int, data: bytes) -> None:
+        """Сохранить диалог; пустой диалог (нет состояния и данных) удаляется."""
+        if key in self._sessions:
+            self._remove(key)
+        if state or data:
+            session = _Session(state, data, time.monotonic() + self.ttl)
+            self._sessions[key] = session
+            self.bytes_used += self._size(session)
+        self._shrink()
+
+    def _shrink(self) -> None:
+        """Удалить устаревшие диалоги и вытеснить старые сверх ограничения объёма."""
+        now = time.monotonic()
+        while self._sessions:
+            key, session = next(iter(self._sessions.items()))
+            if session.expires_at <= now:
+                self.expired += 1
+            elif self.bytes_used > self.max_bytes:
+                self.evicted += 1
+            else:
+                break
+            self._remove(key)
+
+    def _state_id(self, state: Optional[str]) -> int:
+        state_id = self._state_ids.get(state)
+        if state_id is None:
+            state_id = self._state_ids[state] = len(self._state_names)
+            self._state_names.append(state)
+        return state_id
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        key = self._key(key)
+        session = self._get(key)
+        state_id = self._state_id(state.state if isinstance(state, State) else state)
+        self._put(key, state_id, session.data if session else b"")
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        session = self._get(self._key(key))
+        return self._state_names[session.state] if session else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        key = self._key(key)
+        session = self._get(key)
+        blob = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode() if data else b""
+        self._put(key, session.state if session else 0, blob)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        session = self._get(self._key(key))
+        return json.loads(session.data) if session and session.data else {}
+
+    async def close(self) -> None:
+        logger.info(f"Хранилище FSM в памяти: {self.stats()}")
+
+    def stats(self) -> dict:
+        """Метрики: живые диалоги, занятый объём, удалённые по TTL и вытесненные."""
+        return {
+            "sessions": len(self._sessions),
+            "bytes": self.bytes_used,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
+
+
+def create_fsm_storage() -> BaseStorage:
+    """Хранилище FSM по настройке FSM_STORAGE: postgres или memory."""
+    if settings.fsm_storage == "memory":
+        logger.warning("Состояния FSM хранятся в памяти и теряются при перезапуске")
+        return BoundedMemoryStorage(
+            ttl=settings.fsm_memory_ttl,
+            max_bytes=int(settings.fsm_memory_limit_mb * 1024 * 1024)
+        )
+    if settings.fsm_storage == "postgres":
+        return PostgresStorage(
+            flush_interval=settings.fsm_flush_interval,
+            cache_size=settings.fsm_cache_size,
+            cache_ttl=settings.fsm_cache_ttl
+        )
+    raise ValueError(f"Неизвестное хранилище FSM: {settings.fsm_storage}")
@@ -0,0 +1,73 @@
+"""
+Бенчмарк пакетного расчёта расстояний: NumPy (haversine/vincenty) против geopy.geodesic.
+
+Использование:
+    python -m scripts.bench_distances            # 1 000 000 пар
+    python -m scripts.bench_distances --pairs 100000 --geodesic-sample 5000
+
+geodesic считается по выборке (по одной паре за вызов, как в
+GeoService.calculate_distance) и пересчитывается на полный объём.
+"""
+import argparse
+import time
+
+import numpy as np
+from geopy.distance import geodesic
+
+from app.services.distance import haversine_km, vincenty_km
+
+# Прямоугольник региона работы: Омск — Красноярск, Томск — Барнаул
+REGION = {"lat": (52.5, 57.5), "lon": (73.0, 93.5)}
+
+
+def random_points(count: int, rng: np.random.Generator) -> np.ndarray:
+    return np.column_stack([
+        rng.uniform(*REGION["lat"], count),
+        rng.uniform(*REGION["lon"], count),
+    ])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк пакетного расчёта расстояний")
+    parser.add_argument("--pairs", type=int, default=1_000_000)
+    parser.add_argument("--geodesic-sample", type=int, default=20_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    origins = random_points(args.pairs, rng)
+    destinations = random_points(args.pairs, rng)
+
+    results = {}
+    timings = {}
+    for name, func in (("haversine", haversine_km), ("vincenty", vincenty_km)):
+        started = time.perf_counter()
+        results[name] = func(origins, destinations)
+        timings[name] = time.perf_counter() - started
+        print(f"{name:>10}: {args.pairs:,} пар за {timings[name]:.3f} с — {args.pairs / timings[name]:,.0f} пар/с")
+
+    sample = min(args.geodesic_sample, args.pairs)
+    started = time.perf_counter()
+    reference = np.array([
+        geodesic(tuple(origins[i]), tuple(destinations[i])).kilometers
+        for i in range(sample)
+    ])
+    geodesic_total = (time.perf_counter() - started) * args.pairs / sample
+    print(
+        f"{'geodesic':>10}: {sample:,} пар по одной — ≈ {geodesic_total:.1f} с на {args.pairs:,} пар "
+        f"({args.pairs / geodesic_total:,.0f} пар/с)"
+    )
+
+    print("\nПогрешность относительно geodesic (по выборке) и ускорение:")
+    for name, distances in results.items():
+        error = np.abs(distances[:sample] - reference)
+        relative = error / np.maximum(reference, 1e-9)
+        print(
+            f"{name:>10}: макс. {error.max() * 1000:.4f} м, "
+            f"макс. относительная {relative.max() * 100:.4f}%, "
+            f"ускорение ×{geodesic_total / timings[name]:,.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
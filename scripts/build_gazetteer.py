@@ -0,0 +1,31 @@
+"""
+Построение офлайн-индекса адресов (газеттира) из выгрузки OpenStreetMap.
+
+Использование:
+    python -m scripts.build_gazetteer siberian-fed-district.osm.bz2
+    python -m scripts.build_gazetteer region.osm data/gazetteer.idx
+
+Выгрузку в формате OSM XML можно получить, например, через
+osmium cat region.osm.pbf -o region.osm.bz2
+"""
+import argparse
+import logging
+import os
+
+from app.services.gazetteer import CITIES, build_gazetteer
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Построить индекс адресов из OSM XML")
+    parser.add_argument("osm_path", help="Файл OSM XML (.osm, .osm.bz2, .osm.gz)")
+    parser.add_argument("out_path", nargs="?", default="data/gazetteer.idx", help="Куда сохранить индекс")
+    parser.add_argument("--city", action="append", dest="cities", help="Город (можно несколько раз)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    os.makedirs(os.path.dirname(args.out_path) or ".", exist_ok=True)
+    build_gazetteer(args.osm_path, args.out_path, args.cities or CITIES)
+
+
+if __name__ == "__main__":
+    main()
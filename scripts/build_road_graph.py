@@ -0,0 +1,45 @@
+"""
+Построение дорожного графа региона из выгрузки OpenStreetMap.
+
+Использование:
+    python -m scripts.build_road_graph siberian-fed-district.osm.bz2
+    python -m scripts.build_road_graph region.osm data/road_graph.npz --landmarks 16
+
+Рядом с графом создаются таблицы ориентиров road_graph.from_landmark.npy и
+road_graph.to_landmark.npy — их нужно развёртывать вместе с .npz.
+
+Выгрузку только с дорогами удобно получить через osmium:
+    osmium tags-filter region.osm.pbf w/highway -o roads.osm.bz2
+"""
+import argparse
+import logging
+import os
+import random
+import time
+
+from app.services.routing import RoadGraph, build_road_graph
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Построить дорожный граф из OSM XML")
+    parser.add_argument("osm_path", help="Файл OSM XML (.osm, .osm.bz2, .osm.gz)")
+    parser.add_argument("out_path", nargs="?", default="data/road_graph.npz", help="Куда сохранить граф")
+    parser.add_argument("--landmarks", type=int, default=16, help="Число ориентиров ALT")
+    parser.add_argument("--check", type=int, default=100, help="Число случайных запросов для проверки скорости")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    os.makedirs(os.path.dirname(args.out_path) or ".", exist_ok=True)
+    build_road_graph(args.osm_path, args.out_path, args.landmarks)
+
+    if args.check:
+        graph = RoadGraph(args.out_path)
+        pairs = [(random.randrange(len(graph)), random.randrange(len(graph))) for _ in range(args.check)]
+        started = time.perf_counter()
+        found = sum(graph.shortest_path_length(source, target) is not None for source, target in pairs)
+        elapsed = (time.perf_counter() - started) / len(pairs) * 1000
+        logging.info(f"Проверка: {found}/{len(pairs)} маршрутов найдено, {elapsed:.1f} мс на запрос, {graph.stats()}")
+
+
+if __name__ == "__main__":
+    main()
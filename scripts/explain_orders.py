@@ -0,0 +1,165 @@
+"""
+Планы запросов списков заказов до и после индексов миграции b4e8d1f6a2c0.
+
+Скрипт создаёт отдельную таблицу с той же структурой, что orders (рабочие
+данные не трогаются), заполняет её синтетическими заказами, печатает
+EXPLAIN (ANALYZE, BUFFERS) запросов OrderDBService с индексами как до
+миграции (PK и user_id), затем строит индексы миграции и печатает планы
+снова. Таблица удаляется в конце (--keep — оставить).
+
+Использование:
+    python -m scripts.explain_orders                       # 1 000 000 заказов
+    python -m scripts.explain_orders --rows 200000 --users 10000
+    python -m scripts.explain_orders --keep                # повторный запуск без заполнения
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+
+from app.db.base import engine
+
+TABLE = "explain_orders"
+
+# Индексы orders до миграции (кроме geohash — в этих запросах не участвуют)
+BASE_INDEXES = [
+    f"ALTER TABLE {TABLE} ADD PRIMARY KEY (id)",
+    f"CREATE INDEX {TABLE}_user_id ON {TABLE} (user_id)",
+]
+
+# Как в миграции b4e8d1f6a2c0
+NEW_INDEXES = [
+    f"CREATE INDEX {TABLE}_user_id_created_at ON {TABLE} (user_id, created_at DESC, id DESC)",
+    f"CREATE INDEX {TABLE}_status_created_at ON {TABLE} (status, created_at DESC, id DESC)",
+    f"CREATE INDEX {TABLE}_draft_user_id_updated_at ON {TABLE} (user_id, updated_at) WHERE status = 'DRAFT'",
+]
+
+# Доли статусов в синтетических данных (накопленные границы для random())
+STATUSES = [
+    ("DRAFT", 0.02),
+    ("PENDING", 0.07),
+    ("CONFIRMED", 0.12),
+    ("IN_PROGRESS", 0.15),
+    ("CANCELLED", 0.25),
+    ("COMPLETED", 1.0),
+]
+
+# Период создания заказов
+HISTORY_DAYS = 730
+
+
+def seed_sql(rows: int, users: int) -> str:
+    status = " ".join(f"WHEN r < {bound} THEN '{name}'" for name, bound in STATUSES)
+    return f"""
+        INSERT INTO {TABLE} (id, user_id, status, weight_kg, distance_km, price_rub, created_at, updated_at)
+        SELECT
+            g,
+            1 + floor(random() * {users})::bigint,
+            (CASE {status} END)::orderstatus,
+            round((random() * 5000)::numeric, 1),
+            round((random() * 300)::numeric, 1),
+            round((500 + random() * 20000)::numeric, 2),
+            created_at,
+            created_at + random() * interval '3 days'
+        FROM (
+            SELECT g, random() AS r, now() - random() * interval '{HISTORY_DAYS} days' AS created_at
+            FROM generate_series(1, {rows}) AS g
+        ) AS source
+    """
+
+
+def queries(user_id: int, cursor: tuple[datetime, int]) -> list[tuple[str, str]]:
+    """Запросы OrderDBService (значения подставлены: EXPLAIN без параметров)."""
+    created_at, order_id = cursor
+    keyset = f"(created_at, id) < ('{created_at.isoformat()}'::timestamptz, {order_id})"
+    newest = "ORDER BY created_at DESC, id DESC"
+    return [
+        ("get_user_orders_page: первая страница",
+         f"SELECT * FROM {TABLE} WHERE user_id = {user_id} {newest} LIMIT 6"),
+        ("get_user_orders_page: страница после курсора",
+         f"SELECT * FROM {TABLE} WHERE user_id = {user_id} AND {keyset} {newest} LIMIT 6"),
+        ("get_orders_by_status: PENDING, первая страница",
+         f"SELECT * FROM {TABLE} WHERE status = 'PENDING' {newest} LIMIT 100"),
+        ("get_orders_by_status: PENDING, глубокая страница по курсору",
+         f"SELECT * FROM {TABLE} WHERE status = 'PENDING' AND {keyset} {newest} LIMIT 100"),
+        ("get_orders_by_status: PENDING, та же страница через OFFSET",
+         f"SELECT * FROM {TABLE} WHERE status = 'PENDING' {newest} LIMIT 100 OFFSET 20000"),
+        ("get_user_draft_order",
+         f"SELECT * FROM {TABLE} WHERE user_id = {user_id} AND status = 'DRAFT' ORDER BY updated_at DESC LIMIT 1"),
+    ]
+
+
+async def explain_all(conn, title: str, user_id: int, cursor: tuple[datetime, int]) -> dict[str, float]:
+    """Напечатать планы и вернуть время выполнения запросов (мс)."""
+    print(f"\n{'=' * 20} {title} {'=' * 20}")
+    timings = {}
+    for name, sql in queries(user_id, cursor):
+        plan = [row[0] for row in await conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS) {sql}"))]
+        print(f"\n--- {name}")
+        print("\n".join(plan))
+        timings[name] = next(
+            float(line.split(":")[1].split()[0]) for line in plan if line.startswith("Execution Time")
+        )
+    return timings
+
+
+async def run(args: argparse.Namespace) -> None:
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        exists = (await conn.execute(text(f"SELECT to_regclass('{TABLE}')"))).scalar() is not None
+
+        if not (args.keep and exists):
+            await conn.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+            # Структура orders без индексов, ограничений и последовательности id
+            await conn.execute(text(f"CREATE UNLOGGED TABLE {TABLE} (LIKE orders)"))
+            started = time.perf_counter()
+            await conn.execute(text(seed_sql(args.rows, args.users)))
+            print(f"Заполнено {args.rows} заказов за {time.perf_counter() - started:.1f} с")
+        for sql in NEW_INDEXES:
+            await conn.execute(text(f"DROP INDEX IF EXISTS {sql.split()[2]}"))
+        if not (args.keep and exists):
+            for sql in BASE_INDEXES:
+                await conn.execute(text(sql))
+        await conn.execute(text(f"ANALYZE {TABLE}"))
+
+        # Пользователь с самой длинной историей и курсор в середине его заказов и списка PENDING
+        user_id = (await conn.execute(text(
+            f"SELECT user_id FROM {TABLE} GROUP BY user_id ORDER BY count(*) DESC LIMIT 1"
+        ))).scalar()
+        row = (await conn.execute(text(
+            f"SELECT created_at, id FROM {TABLE} WHERE status = 'PENDING' "
+            f"ORDER BY created_at DESC, id DESC LIMIT 1 OFFSET 20000"
+        ))).one_or_none()
+        cursor = (row.created_at, row.id) if row else (datetime.now(timezone.utc) - timedelta(days=HISTORY_DAYS // 2), 0)
+
+        before = await explain_all(conn, "До миграции: PK и user_id", user_id, cursor)
+
+        started = time.perf_counter()
+        for sql in NEW_INDEXES:
+            await conn.execute(text(sql))
+        await conn.execute(text(f"ANALYZE {TABLE}"))
+        print(f"\nИндексы миграции построены за {time.perf_counter() - started:.1f} с")
+
+        after = await explain_all(conn, "После миграции", user_id, cursor)
+
+        print(f"\n{'=' * 20} Время выполнения, мс {'=' * 20}")
+        for name in before:
+            print(f"{before[name]:>10.2f} -> {after[name]:>8.2f}  {name}")
+
+        if not args.keep:
+            await conn.execute(text(f"DROP TABLE {TABLE}"))
+    await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="EXPLAIN запросов заказов до и после индексов")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Заказов в тестовой таблице")
+    parser.add_argument("--users", type=int, default=50_000, help="Пользователей")
+    parser.add_argument("--keep", action="store_true", help="Не удалять таблицу (повторно — без заполнения)")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Локальный stub-сервер геокодера для проверки цепочки геокодеров.
+
+Отвечает в формате Nominatim (/search, /reverse) и Photon (/api, /reverse)
+с настраиваемой задержкой и долей ошибок.
+
+Использование:
+    python -m scripts.geocoder_stub --port 8081 --delay 0.05
+    python -m scripts.geocoder_stub --port 8082 --delay 2 --error-rate 0.5
+
+    NOMINATIM_URL=http://127.0.0.1:8081 PHOTON_URL=http://127.0.0.1:8082 \\
+    GEOCODER_BACKENDS=nominatim,photon python -m app.main
+"""
+import argparse
+import asyncio
+import random
+
+from aiohttp import web
+
+# Точка, которую stub возвращает на любой запрос (центр Новосибирска)
+LATITUDE = 55.030204
+LONGITUDE = 82.920430
+DISPLAY_NAME = "Красный проспект, Новосибирск, Новосибирская область, Россия"
+
+
+def create_app(delay: float, error_rate: float, not_found_rate: float) -> web.Application:
+    """Создать aiohttp-приложение stub-геокодера."""
+
+    async def respond(request: web.Request, payload) -> web.Response:
+        await asyncio.sleep(delay)
+        if random.random() < error_rate:
+            return web.json_response({"error": "stub failure"}, status=503)
+        if random.random() < not_found_rate:
+            payload = {"type": "FeatureCollection", "features": []} if isinstance(payload, dict) and "features" in payload else []
+        return web.json_response(payload)
+
+    async def nominatim_search(request: web.Request) -> web.Response:
+        return await respond(request, [{
+            "lat": str(LATITUDE),
+            "lon": str(LONGITUDE),
+            "display_name": DISPLAY_NAME,
+        }])
+
+    async def reverse(request: web.Request) -> web.Response:
+        # Nominatim передаёт format=json, Photon — нет
+        if "format" not in request.query:
+            return await photon(request)
+        return await respond(request, {
+            "lat": request.query.get("lat", str(LATITUDE)),
+            "lon": request.query.get("lon", str(LONGITUDE)),
+            "display_name": DISPLAY_NAME,
+        })
+
+    async def photon(request: web.Request) -> web.Response:
+        return await respond(request, {
+            "type": "FeatureCollection",
+            "features": [{
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [LONGITUDE, LATITUDE]},
+                "properties": {"name": "Красный проспект", "city": "Новосибирск", "country": "Россия"},
+            }],
+        })
+
+    app = web.Application()
+    app.router.add_get("/search", nominatim_search)
+    app.router.add_get("/reverse", reverse)
+    app.router.add_get("/api", photon)
+    app.router.add_get("/api/", photon)
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Stub-сервер геокодера (Nominatim/Photon)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--delay", type=float, default=0.05, help="Задержка ответа (сек)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов 503")
+    parser.add_argument("--not-found-rate", type=float, default=0.0, help="Доля пустых ответов")
+    args = parser.parse_args()
+
+    web.run_app(create_app(args.delay, args.error_rate, args.not_found_rate), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
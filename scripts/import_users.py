@@ -0,0 +1,58 @@
+"""
+Импорт списка пользователей из CSV (создание новых и обновление имён).
+
+Использование:
+    python -m scripts.import_users users.csv
+    python -m scripts.import_users users.csv --chunk-size 5000
+
+Колонки CSV: telegram_id (обязательная), username, first_name, last_name.
+Пустые значения не затирают сохранённые данные.
+"""
+import argparse
+import asyncio
+import csv
+import logging
+import time
+
+from app.db.base import async_session_maker, engine
+from app.services.user_db_service import UserDBService
+
+
+def load_users(path: str) -> list[dict]:
+    with open(path, newline="", encoding="utf-8") as source:
+        return [
+            {
+                "telegram_id": int(row["telegram_id"]),
+                "username": row.get("username") or None,
+                "first_name": row.get("first_name") or None,
+                "last_name": row.get("last_name") or None,
+            }
+            for row in csv.DictReader(source)
+        ]
+
+
+async def import_users(args: argparse.Namespace) -> None:
+    users = load_users(args.file)
+    started = time.perf_counter()
+    async with async_session_maker() as session:
+        created, updated = await UserDBService(session).upsert_users(users, chunk_size=args.chunk_size)
+    await engine.dispose()
+
+    elapsed = time.perf_counter() - started
+    unique = len({user["telegram_id"] for user in users})
+    print(f"Пользователей в файле: {unique} ({len(users)} строк), за {elapsed:.1f} с")
+    print(f"Создано: {created}, обновлено: {updated}, без изменений: {unique - created - updated}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Импорт пользователей из CSV")
+    parser.add_argument("file", help="CSV-файл с колонками telegram_id, username, first_name, last_name")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Строк в одном INSERT")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(import_users(args))
+
+
+if __name__ == "__main__":
+    main()
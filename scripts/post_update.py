@@ -0,0 +1,89 @@
+"""
+Отправка записанных обновлений Telegram в webhook бота — проверка без Telegram.
+
+Использование:
+    BOT_MODE=webhook python -m app.main                                 # в другом терминале
+    python -m scripts.post_update scripts/updates/help.json             # ответ webhook
+    python -m scripts.post_update scripts/updates/*.json --repeat 500 --concurrency 20
+
+Файл содержит одно обновление (JSON-объект, как в getUpdates) или список.
+При --repeat update_id и id пользователя заменяются уникальными, чтобы
+повторы выглядели как разные пользователи. Секрет берётся из WEBHOOK_SECRET.
+"""
+import argparse
+import asyncio
+import copy
+import json
+import time
+
+import aiohttp
+
+from app.config import settings
+
+
+def load_updates(paths: list[str]) -> list[dict]:
+    updates = []
+    for path in paths:
+        with open(path, encoding="utf-8") as source:
+            data = json.load(source)
+        updates.extend(data if isinstance(data, list) else [data])
+    return updates
+
+
+def personalize(update: dict, index: int) -> dict:
+    """Копия обновления с уникальными update_id и пользователем."""
+    update = copy.deepcopy(update)
+    update["update_id"] = update.get("update_id", 0) + index
+    for event in update.values():
+        if isinstance(event, dict) and "from" in event:
+            event["from"]["id"] += index
+            chat = event.get("chat") or event.get("message", {}).get("chat")
+            if chat is not None:
+                chat["id"] += index
+    return update
+
+
+async def post_updates(args: argparse.Namespace) -> None:
+    url = args.url or f"http://127.0.0.1:{settings.webhook_port}{settings.webhook_path}"
+    headers = {"X-Telegram-Bot-Api-Secret-Token": args.secret or settings.webhook_secret}
+    updates = load_updates(args.files)
+    if args.repeat > 1:
+        updates = [personalize(update, index) for index in range(args.repeat) for update in updates]
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+
+    async with aiohttp.ClientSession(headers=headers) as session:
+        async def post(update: dict) -> None:
+            async with semaphore:
+                started = time.perf_counter()
+                async with session.post(url, json=update) as response:
+                    body = await response.text()
+                latencies.append(time.perf_counter() - started)
+                if args.repeat == 1:
+                    print(f"update {update['update_id']}: HTTP {response.status}")
+                    print(body or "(пустой ответ — ответ отправлен через Bot API или его нет)")
+
+        started = time.perf_counter()
+        await asyncio.gather(*(post(update) for update in updates))
+        elapsed = time.perf_counter() - started
+
+    if args.repeat > 1:
+        latencies.sort()
+        print(f"Отправлено {len(updates)} обновлений за {elapsed:.2f} с ({len(updates) / elapsed:.0f} в секунду)")
+        print(f"Задержка: p50 {latencies[len(latencies) // 2] * 1000:.1f} мс, "
+              f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} мс")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Отправка записанных обновлений в webhook бота")
+    parser.add_argument("files", nargs="+", help="JSON-файлы с обновлениями")
+    parser.add_argument("--url", default="", help="Адрес webhook (по умолчанию локальный)")
+    parser.add_argument("--secret", default="", help="Секрет (по умолчанию WEBHOOK_SECRET)")
+    parser.add_argument("--repeat", type=int, default=1, help="Повторить каждое обновление N раз")
+    parser.add_argument("--concurrency", type=int, default=10, help="Одновременных запросов")
+    asyncio.run(post_updates(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Пересчёт счётчиков заказов (order_counters) по таблице orders.
+
+Нужен после изменения заказов в обход OrderDBService (SQL вручную,
+восстановление из бэкапа) и для проверки, что счётчики не разошлись.
+
+Использование:
+    python -m scripts.rebuild_order_counters --dry-run   # только показать расхождения
+    python -m scripts.rebuild_order_counters
+"""
+import argparse
+import asyncio
+import logging
+
+from app.db.base import async_session_maker, engine
+from app.db.models import OrderCounter
+from app.services.order_db_service import OrderDBService
+
+
+async def rebuild(args: argparse.Namespace) -> None:
+    async with async_session_maker() as session:
+        report = await OrderDBService(session).rebuild_counters(dry_run=args.dry_run)
+    await engine.dispose()
+
+    mode = "Проверка (без записи)" if args.dry_run else "Пересчёт"
+    print(f"{mode}: строк счётчиков {report['rows']}, расхождений {len(report['drift'])}")
+    for user_id, status, stored, actual in report["drift"][:args.top]:
+        owner = "все пользователи" if user_id == OrderCounter.ALL_USERS else f"пользователь {user_id}"
+        print(f"  {owner}, {status.name}: {stored} -> {actual}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Пересчитать счётчики заказов по таблице orders")
+    parser.add_argument("--dry-run", action="store_true", help="Только показать расхождения")
+    parser.add_argument("--top", type=int, default=20, help="Сколько расхождений показать")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(rebuild(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Пересчёт цен открытых заказов (PENDING, CONFIRMED) после изменения тарифа.
+
+Использование:
+    python -m scripts.reprice_orders --dry-run                  # только показать разницу
+    python -m scripts.reprice_orders --dry-run --diff diff.csv  # разница по каждому заказу в CSV
+    python -m scripts.reprice_orders --tariffs tariffs.json     # пересчитать по новому тарифу
+    python -m scripts.reprice_orders --chunk-size 10000
+
+Без --tariffs используется тариф из TARIFFS_PATH (или BASE_PRICE/PRICE_PER_KM/PRICE_PER_KG).
+"""
+import argparse
+import asyncio
+import csv
+import logging
+import time
+
+from app.config import settings
+from app.db.base import async_session_maker, engine
+from app.services.order_db_service import OrderDBService
+from app.services.pricing import load_tariffs
+
+
+async def reprice(args: argparse.Namespace) -> None:
+    tariff = load_tariffs(args.tariffs or settings.tariffs_path)
+    started = time.perf_counter()
+
+    def progress(processed: int, changed: int) -> None:
+        elapsed = time.perf_counter() - started
+        print(f"  обработано {processed}, изменено {changed} ({processed / elapsed:.0f} заказов/с)", flush=True)
+
+    async with async_session_maker() as session:
+        report = await OrderDBService(session).reprice_orders(
+            engine=tariff,
+            chunk_size=args.chunk_size,
+            dry_run=args.dry_run,
+            progress=progress
+        )
+    await engine.dispose()
+
+    elapsed = time.perf_counter() - started
+    mode = "Пробный пересчёт (без записи)" if args.dry_run else "Пересчёт"
+    print(f"\n{mode}: {report['processed']} заказов за {elapsed:.1f} с")
+    print(f"Изменится цена: {report['changed']}, суммарная разница: {report['delta']:+.2f} ₽")
+
+    # Крупнейшие изменения
+    changes = sorted(report["changes"], key=lambda change: abs(change[2] - (change[1] or 0)), reverse=True)
+    for order_id, old, new in changes[:args.top]:
+        print(f"  заказ #{order_id}: {old} -> {new} ({new - (old or 0):+.2f})")
+
+    if args.diff:
+        with open(args.diff, "w", newline="", encoding="utf-8") as out:
+            writer = csv.writer(out)
+            writer.writerow(["order_id", "old_price", "new_price", "delta"])
+            for order_id, old, new in report["changes"]:
+                writer.writerow([order_id, old, new, round(new - (old or 0), 2)])
+        print(f"Разница по заказам сохранена в {args.diff}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Пересчитать цены открытых заказов по тарифу")
+    parser.add_argument("--tariffs", help="Файл тарифа (по умолчанию TARIFFS_PATH)")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="Заказов в одном UPDATE")
+    parser.add_argument("--dry-run", action="store_true", help="Только показать разницу")
+    parser.add_argument("--diff", help="Сохранить разницу по заказам в CSV")
+    parser.add_argument("--top", type=int, default=10, help="Сколько крупнейших изменений показать")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(reprice(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+"""Общие настройки тестов: обязательные переменные окружения для app.config."""
+import os
+
+os.environ.setdefault("BOT_TOKEN", "1:test")
+os.environ.setdefault("MANAGER_CHAT_ID", "1")
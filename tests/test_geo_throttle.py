@@ -0,0 +1,41 @@
+"""Токен, выданный отменённому ожидающему, не должен теряться."""
+import asyncio
+import time
+
+from app.services.geo_throttle import PriorityTokenBucket
+
+RATE = 10.0
+
+
+class CancellingBucket(PriorityTokenBucket):
+    """Отменяет задачу первого ожидающего сразу после выдачи ему токена (до её пробуждения)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.victim = None
+        self.victim_waiter = None
+
+    def _grant(self) -> None:
+        if self.victim_waiter is None and self._waiters:
+            self.victim_waiter = self._waiters[0][2]
+        super()._grant()
+        if self.victim_waiter is not None and self.victim_waiter.done() and not self.victim.done():
+            self.victim.cancel()
+
+
+def test_cancelled_waiter_hands_token_to_next():
+    async def scenario() -> float:
+        bucket = CancellingBucket(rate=RATE, capacity=1)
+        await bucket.acquire()
+
+        started = time.monotonic()
+        bucket.victim = asyncio.create_task(bucket.acquire())
+        await asyncio.sleep(0)
+        await bucket.acquire()
+        elapsed = time.monotonic() - started
+
+        assert bucket.victim.cancelled()
+        return elapsed
+
+    # Токен отменённого ожидающего сразу достаётся следующему, а не через ещё 1 / RATE
+    assert asyncio.run(scenario()) < 1.5 / RATE
@@ -0,0 +1,77 @@
+"""Пересчёт цен по неизменённому тарифу не должен находить расхождений."""
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from types import SimpleNamespace
+
+from app.services.order_db_service import OrderDBService
+from app.services.pricing import TariffEngine
+
+TARIFF_PATH = Path(__file__).resolve().parent.parent / "tariffs.example.json"
+
+# (расстояние, вес, загрузка, выгрузка); точки — центр Новосибирска, город, Барнаул, вне зон
+ROUTES = [
+    (12.4, 350.0, (55.03, 82.92), (54.90, 82.80)),
+    (231.7, 1800.0, (55.03, 82.92), (53.35, 83.70)),
+    (47.0, 5200.0, (54.85, 82.75), (56.00, 85.00)),
+    (3.1, 80.0, None, None),
+]
+
+
+class FakeSession:
+    """Сессия, отдающая одну пачку заказов (как SELECT в reprice_orders)."""
+
+    def __init__(self, rows):
+        self.batches = [rows, []]
+
+    async def execute(self, stmt):
+        return SimpleNamespace(all=lambda: self.batches.pop(0))
+
+    async def commit(self):
+        raise AssertionError("пробный пересчёт не должен записывать")
+
+    async def rollback(self):
+        pass
+
+
+def quoted_orders(engine: TariffEngine) -> list:
+    """Заказы так, как их сохраняет бот: цена из process_weight, load_date из timestamptz (UTC)."""
+    rows = []
+    start = datetime(2025, 12, 8, 0, 0)  # понедельник
+    for index in range(24 * 7):
+        distance, weight, load_point, unload_point = ROUTES[index % len(ROUTES)]
+        load_time = engine.local_time(start + timedelta(hours=index))
+        price = engine.price(distance, weight, load_point, unload_point, load_time)
+        rows.append(SimpleNamespace(
+            id=index + 1,
+            price_rub=price,
+            distance_km=distance,
+            weight_kg=weight,
+            load_latitude=load_point[0] if load_point else None,
+            load_longitude=load_point[1] if load_point else None,
+            unload_latitude=unload_point[0] if unload_point else None,
+            unload_longitude=unload_point[1] if unload_point else None,
+            load_date=load_time.astimezone(timezone.utc),
+        ))
+    return rows
+
+
+def test_unchanged_tariff_reprices_nothing():
+    engine = TariffEngine(json.loads(TARIFF_PATH.read_text(encoding="utf-8")))
+    rows = quoted_orders(engine)
+
+    report = asyncio.run(OrderDBService(FakeSession(rows)).reprice_orders(engine=engine, dry_run=True))
+
+    assert report["processed"] == len(rows)
+    assert report["changed"] == 0
+    assert report["changes"] == []
+
+
+def test_stored_load_date_keeps_quoted_hour():
+    engine = TariffEngine(json.loads(TARIFF_PATH.read_text(encoding="utf-8")))
+    # Пятница 18:00 по Новосибирску — дневной тариф, не ночной и не выходной
+    quoted = engine.local_time(datetime(2025, 12, 12, 18, 0))
+    stored = quoted.astimezone(timezone.utc)
+
+    assert engine.price(60, 800, (55.03, 82.92), None, stored) == engine.price(60, 800, (55.03, 82.92), None, quoted)